@@ -0,0 +1,243 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_SUFFIX = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+READ_CHUNK = 1024 * 1024
+
+
+def shard_file_name(output_file, compression, shard_tables, index):
+    """Name of shard index of a backup. Unsharded backups keep the name of output_file."""
+    if shard_tables > 0:
+        root, ext = os.path.splitext(output_file)
+        output_file = f"{root}_{index:04d}{ext}"
+    return output_file + COMPRESSION_SUFFIX[compression]
+
+
+class _HashingFile:
+    """Write-only file object that hashes and counts the bytes that reach the disk."""
+
+    def __init__(self, fileobj, sha256, size):
+        self.fileobj = fileobj
+        self.sha256 = sha256
+        self.size = size
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+
+class BackupWriter:
+    """Writes a schema backup as one or more shards, optionally gzip or zstd compressed.
+
+    Text goes through a large write buffer and is encoded as utf-8. Tables are placed with
+    write_table, or streamed between begin_table and end_table. A new shard is started every
+    shard_tables tables, and the extent [shard, offset, length] of the table in the
+    uncompressed shard is returned.
+    checkpoint() ends the current gzip member or zstd frame, so that the shard can be cut back
+    to the returned position and appended to by resume(). Concatenated members and frames
+    decompress as one stream.
+    """
+
+    def __init__(self, output_file, compression='none', shard_tables=0, buffer_size=8 * 1024 * 1024):
+        if compression not in COMPRESSION_SUFFIX:
+            raise ValueError(f"Unsupported backup compression: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd backup compression requires the zstandard package")
+        self.output_file = output_file
+        self.compression = compression
+        self.shard_tables = shard_tables
+        self.buffer_size = buffer_size
+        self.shards = []
+        self.shard_index = 0
+        self.shard_size = 0
+        self.shard_table_count = 0
+        self.table_offset = 0
+        self.raw = None
+        self.hashing = None
+        self.stream = None
+
+    def path(self, index=None):
+        return shard_file_name(self.output_file, self.compression, self.shard_tables,
+                               self.shard_index if index is None else index)
+
+    def start(self):
+        self._open_shard('wb', hashlib.sha256(), 0)
+
+    def resume(self, position):
+        """Cut the backup back to a position returned by checkpoint() and continue writing there."""
+        self.shards = list(position['shards'])
+        self.shard_index = position['shard']
+        self.shard_size = position['size']
+        self.shard_table_count = position['tables']
+        index = self.shard_index + 1
+        while self.shard_tables > 0 and os.path.isfile(self.path(index)):
+            os.remove(self.path(index))
+            index += 1
+        os.truncate(self.path(), position['offset'])
+        sha256 = hashlib.sha256()
+        with open(self.path(), 'rb') as fd:
+            for chunk in iter(lambda: fd.read(READ_CHUNK), b''):
+                sha256.update(chunk)
+        self._open_shard('ab', sha256, position['offset'])
+
+    def _open_shard(self, mode, sha256, stored_size):
+        self.raw = open(self.path(), mode, buffering=self.buffer_size)
+        self.hashing = _HashingFile(self.raw, sha256, stored_size)
+        self.stream = None
+
+    def _stream(self):
+        if self.stream is None:
+            if self.compression == 'gzip':
+                self.stream = gzip.GzipFile(fileobj=self.hashing, mode='wb', compresslevel=6, mtime=0)
+            elif self.compression == 'zstd':
+                self.stream = zstandard.ZstdCompressor().stream_writer(self.hashing, closefd=False)
+            else:
+                self.stream = self.hashing
+        return self.stream
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self._stream().write(data)
+        self.shard_size += len(data)
+        return len(data)
+
+    def begin_table(self):
+        """Start the next table, whose text is then written with write() and ended by end_table()."""
+        if self.shard_tables > 0 and self.shard_table_count >= self.shard_tables:
+            self._finish_shard()
+            self.shard_index += 1
+            self.shard_size = 0
+            self.shard_table_count = 0
+            self._open_shard('wb', hashlib.sha256(), 0)
+        self.table_offset = self.shard_size
+
+    def end_table(self):
+        """Return the extent of the table started by begin_table()."""
+        self.shard_table_count += 1
+        return [self.shard_index, self.table_offset, self.shard_size - self.table_offset]
+
+    def write_table(self, text):
+        self.begin_table()
+        self.write(text)
+        return self.end_table()
+
+    def _seal(self):
+        if self.stream is not None and self.stream is not self.hashing:
+            self.stream.close()
+        self.stream = None
+        self.raw.flush()
+
+    def _finish_shard(self):
+        self._seal()
+        self.raw.close()
+        self.shards.append({
+            'file': os.path.basename(self.path()),
+            'tables': self.shard_table_count,
+            'bytes': self.shard_size,
+            'stored_bytes': self.hashing.size,
+            'sha256': self.hashing.sha256.hexdigest(),
+        })
+
+    def checkpoint(self):
+        """Make everything written so far durable and return its position."""
+        self._seal()
+        os.fsync(self.raw.fileno())
+        return {'shards': list(self.shards), 'shard': self.shard_index, 'offset': self.hashing.size,
+                'size': self.shard_size, 'tables': self.shard_table_count}
+
+    def close(self):
+        """Finish the last shard and return the list of shards."""
+        self._finish_shard()
+        self.raw = None
+        return self.shards
+
+    def abort(self):
+        if self.raw is not None and not self.raw.closed:
+            self.raw.close()
+
+
+class BackupReader:
+    """Reads table extents back from the shards of a previous backup.
+
+    Extents are expected in increasing order, which lets compressed shards be read in one
+    forward pass.
+    """
+
+    def __init__(self, directory, files, compression):
+        self.directory = directory
+        self.files = files
+        self.compression = compression
+        self.shard_index = None
+        self.fd = None
+        self.stream = None
+        self.position = 0
+
+    def _open(self, index):
+        self.close()
+        self.fd = open(os.path.join(self.directory, self.files[index]), 'rb')
+        if self.compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=self.fd, mode='rb')
+        elif self.compression == 'zstd':
+            self.stream = zstandard.ZstdDecompressor().stream_reader(self.fd, read_across_frames=True)
+        else:
+            self.stream = self.fd
+        self.shard_index = index
+        self.position = 0
+
+    def read(self, extent):
+        shard, offset, length = extent
+        if shard != self.shard_index or offset < self.position:
+            self._open(shard)
+        if self.stream is self.fd:
+            self.fd.seek(offset)
+        else:
+            while self.position < offset:
+                skipped = len(self.stream.read(min(READ_CHUNK, offset - self.position)))
+                if not skipped:
+                    break
+                self.position += skipped
+        data = self.stream.read(length)
+        self.position = offset + len(data)
+        return data.decode('utf-8')
+
+    def close(self):
+        if self.stream is not None and self.stream is not self.fd:
+            self.stream.close()
+        if self.fd is not None:
+            self.fd.close()
+        self.fd = None
+        self.stream = None
+        self.shard_index = None
+
+
+def write_manifest(output_file, catalog, compression, shards, counts):
+    """Write <output_file>.manifest.json describing the shards of a completed backup."""
+    manifest = {
+        'catalog': catalog,
+        'created': time.time(),
+        'compression': compression,
+        'bytes': sum(shard['bytes'] for shard in shards),
+        'stored_bytes': sum(shard['stored_bytes'] for shard in shards),
+        'shards': shards,
+    }
+    manifest.update(counts)
+    manifest_file = f"{output_file}.manifest.json"
+    with open(manifest_file, 'w') as fd:
+        json.dump(manifest, fd, indent=2)
+    logger.info(f"Backup manifest saved to {manifest_file}")
+    return manifest_file
@@ -0,0 +1,76 @@
+import time
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogRunner:
+    """Runs a command for many catalogs on a thread pool.
+
+    Every worker thread opens its own database object (and connection pool) with dbo_factory.
+    Catalogs are scheduled largest first by table count, so that a big catalog does not start
+    last and become the tail of the run. Progress and ETA are reported in tables.
+    """
+
+    def __init__(self, dbo_factory, workers=1):
+        self.logger = logger
+        self.dbo_factory = dbo_factory
+        self.workers = max(1, workers)
+        self.local = threading.local()
+        self.dbos = []
+        self.lock = threading.Lock()
+
+    def _dbo(self):
+        if getattr(self.local, 'dbo', None) is None:
+            self.local.dbo = self.dbo_factory()
+            with self.lock:
+                self.dbos.append(self.local.dbo)
+        return self.local.dbo
+
+    def _run_one(self, task, catalog):
+        start = time.time()
+        try:
+            task(self._dbo(), catalog)
+            status = 'ok'
+        except Exception as e:
+            traceback.print_exc()
+            self.logger.error(f"Catalog {catalog} failed: {e}")
+            status = f"failed: {e}"
+        return time.time() - start, status
+
+    def run(self, catalogs, task, table_counts=None):
+        """Call task(dbo, catalog) for every catalog. Returns [(catalog, tables, seconds, status)].
+
+        A task raises when its catalog was not processed completely, its status is then
+        'failed: <error>' and the other catalogs still run.
+        """
+        table_counts = table_counts or {}
+        ordered = sorted(catalogs, key=lambda catalog: table_counts.get(catalog, 0), reverse=True)
+        total_tables = sum(table_counts.get(catalog, 0) for catalog in ordered)
+        timings = {}
+        done_tables = 0
+        start = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="catalog") as executor:
+                futures = {executor.submit(self._run_one, task, catalog): catalog for catalog in ordered}
+                for future in as_completed(futures):
+                    catalog = futures[future]
+                    seconds, status = future.result()
+                    tables = table_counts.get(catalog, 0)
+                    timings[catalog] = (catalog, tables, round(seconds, 1), status)
+                    done_tables += tables
+                    elapsed = time.time() - start
+                    if done_tables and total_tables:
+                        eta = f"{elapsed * (total_tables - done_tables) / done_tables:.0f}s"
+                        progress = f"{done_tables}/{total_tables} tables ({100 * done_tables / total_tables:.0f}%)"
+                    else:
+                        eta = "unknown"
+                        progress = f"{done_tables} tables"
+                    self.logger.info(f"Catalogs {len(timings)}/{len(ordered)}, {progress}, elapsed {elapsed:.0f}s, ETA {eta}")
+        finally:
+            for dbo in self.dbos:
+                dbo.disconnect()
+        return [timings[catalog] for catalog in ordered]
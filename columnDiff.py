@@ -0,0 +1,297 @@
+import re
+import logging
+from bisect import bisect_left
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+SAME = 'same'
+WIDENING = 'widening'
+INCOMPATIBLE = 'incompatible'
+
+TYPE_ALIASES = {'integer': 'int', 'dec': 'decimal', 'numeric': 'decimal', 'double precision': 'double'}
+# numeric types in the order Hive widens them, and the integer digits they need in a decimal
+NUMERIC_RANK = {'tinyint': 1, 'smallint': 2, 'int': 3, 'bigint': 4, 'float': 5, 'double': 6, 'decimal': 7}
+INTEGER_DIGITS = {'tinyint': 3, 'smallint': 5, 'int': 10, 'bigint': 19}
+STRING_TYPES = ('string', 'varchar', 'char')
+# types that convert to string without loss
+TO_STRING = set(NUMERIC_RANK) | set(STRING_TYPES) | {'date', 'timestamp', 'boolean'}
+COMPLEX_TYPES = ('array', 'map', 'struct', 'uniontype')
+
+TOKEN = re.compile(r"\s*(`(?:[^`]|``)*`|[A-Za-z_][A-Za-z0-9_ ]*?(?=\s*[<>(),:]|\s*$)|\d+|[<>(),:])")
+
+
+def _tokens(type_string):
+    pos = 0
+    tokens = []
+    while pos < len(type_string):
+        match = TOKEN.match(type_string, pos)
+        if not match:
+            if type_string[pos:].strip():
+                raise ValueError(f"Unexpected text in type {type_string!r} at {pos}")
+            break
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+
+def _parse(tokens, pos):
+    name = tokens[pos].lower().strip()
+    name = TYPE_ALIASES.get(name, name)
+    pos += 1
+    if name in COMPLEX_TYPES:
+        if tokens[pos] != '<':
+            raise ValueError(f"{name} without <")
+        pos += 1
+        children = []
+        while True:
+            if name == 'struct':
+                field = tokens[pos]
+                field = field[1:-1].replace('``', '`') if field.startswith('`') else field
+                if tokens[pos + 1] != ':':
+                    raise ValueError(f"struct field {field} without :")
+                child, pos = _parse(tokens, pos + 2)
+                children.append((field.lower(), child))
+            else:
+                child, pos = _parse(tokens, pos)
+                children.append(child)
+            if tokens[pos] == '>':
+                break
+            if tokens[pos] != ',':
+                raise ValueError(f"Unexpected {tokens[pos]} in {name}")
+            pos += 1
+        if (name == 'array' and len(children) != 1) or (name == 'map' and len(children) != 2):
+            raise ValueError(f"Wrong number of element types in {name}")
+        return (name, tuple(children)), pos + 1
+    params = ()
+    if pos < len(tokens) and tokens[pos] == '(':
+        values = []
+        pos += 1
+        while tokens[pos] != ')':
+            if tokens[pos] != ',':
+                values.append(int(tokens[pos]))
+            pos += 1
+        params = tuple(values)
+        pos += 1
+    if name == 'decimal':
+        params = (params + (10, 0)[len(params):]) if len(params) < 2 else params
+    return (name, params), pos
+
+
+@lru_cache(maxsize=65536)
+def parse_type(type_string):
+    """Parse a Hive type string into a tree of tuples.
+
+    Primitives are (name, params), like ('decimal', (10, 2)) or ('varchar', (20,)). Complex
+    types are ('array', (element,)), ('map', (key, value)), ('struct', ((field, type), ...))
+    and ('uniontype', (type, ...)). Names are lower cased. Strings that do not parse are
+    returned as ('unknown', (type_string,)) and only compare equal to the same string.
+    Parsed trees are cached, wide tables repeat the same types many times.
+    """
+    try:
+        tokens = _tokens(type_string or '')
+        parsed, pos = _parse(tokens, 0)
+        if pos != len(tokens):
+            raise ValueError(f"Trailing text in type {type_string!r}")
+        return parsed
+    except (ValueError, IndexError) as e:
+        logger.debug(f"Could not parse type {type_string!r}: {e}")
+        return ('unknown', ((type_string or '').strip().lower(),))
+
+
+def _worst(kinds):
+    if INCOMPATIBLE in kinds:
+        return INCOMPATIBLE
+    if WIDENING in kinds:
+        return WIDENING
+    return SAME
+
+
+def _primitive_change(old, new):
+    (old_name, old_params), (new_name, new_params) = old, new
+    if old_name == new_name:
+        if old_name == 'decimal':
+            (old_precision, old_scale), (new_precision, new_scale) = old_params[:2], new_params[:2]
+            if new_scale >= old_scale and new_precision - new_scale >= old_precision - old_scale:
+                return WIDENING
+            return INCOMPATIBLE
+        if old_name in ('varchar', 'char'):
+            return WIDENING if new_params and old_params and new_params[0] >= old_params[0] else INCOMPATIBLE
+        return INCOMPATIBLE
+    if new_name == 'string' and old_name in TO_STRING:
+        return WIDENING
+    if old_name == 'char' and new_name == 'varchar':
+        return WIDENING if new_params and old_params and new_params[0] >= old_params[0] else INCOMPATIBLE
+    if old_name == 'date' and new_name == 'timestamp':
+        return WIDENING
+    if old_name in NUMERIC_RANK and new_name in NUMERIC_RANK:
+        if new_name == 'decimal':
+            precision, scale = new_params[:2]
+            return WIDENING if old_name in INTEGER_DIGITS and INTEGER_DIGITS[old_name] <= precision - scale else INCOMPATIBLE
+        return WIDENING if NUMERIC_RANK[new_name] > NUMERIC_RANK[old_name] and old_name != 'decimal' else INCOMPATIBLE
+    return INCOMPATIBLE
+
+
+def compare_types(old, new, path=''):
+    """Classify the change from type tree old to new as same, widening or incompatible.
+
+    Widening changes are the ones Hive applies to existing data without a rewrite: larger
+    numeric types, larger decimal/varchar/char, anything to string, struct fields appended at
+    the end, and widening of array, map value and struct field types.
+    Returns (kind, details), where details name the nested fields that changed.
+    """
+    if old == new:
+        return SAME, []
+    old_name, old_children = old
+    new_name, new_children = new
+    if old_name not in COMPLEX_TYPES or new_name not in COMPLEX_TYPES:
+        kind = INCOMPATIBLE if old_name in COMPLEX_TYPES or new_name in COMPLEX_TYPES else _primitive_change(old, new)
+        return kind, [f"{path or 'type'}: {format_type(old)} -> {format_type(new)} ({kind})"]
+    if old_name != new_name:
+        return INCOMPATIBLE, [f"{path or 'type'}: {old_name} -> {new_name} ({INCOMPATIBLE})"]
+
+    kinds = []
+    details = []
+    if old_name == 'struct':
+        new_fields = dict(new_children)
+        new_positions = {field: idx for idx, (field, _) in enumerate(new_children)}
+        for idx, (field, field_type) in enumerate(old_children):
+            field_path = f"{path}.{field}" if path else field
+            if field not in new_fields:
+                kinds.append(INCOMPATIBLE)
+                details.append(f"{field_path}: dropped")
+                continue
+            if new_positions[field] != idx:
+                kinds.append(INCOMPATIBLE)
+                details.append(f"{field_path}: moved from {idx} to {new_positions[field]}")
+            kind, field_details = compare_types(field_type, new_fields[field], field_path)
+            kinds.append(kind)
+            details.extend(field_details)
+        old_fields = {field for field, _ in old_children}
+        for field, field_type in new_children:
+            if field not in old_fields:
+                field_path = f"{path}.{field}" if path else field
+                # new fields can only be appended to the end of a struct
+                appended = new_positions[field] >= len(old_children)
+                kinds.append(WIDENING if appended else INCOMPATIBLE)
+                details.append(f"{field_path}: added {format_type(field_type)}")
+    elif len(old_children) != len(new_children):
+        return INCOMPATIBLE, [f"{path or 'type'}: {format_type(old)} -> {format_type(new)} ({INCOMPATIBLE})"]
+    else:
+        labels = {'array': ['element'], 'map': ['key', 'value']}.get(old_name) or [str(idx) for idx in range(len(old_children))]
+        for label, old_child, new_child in zip(labels, old_children, new_children):
+            kind, child_details = compare_types(old_child, new_child, f"{path}<{label}>" if path else f"<{label}>")
+            if old_name == 'map' and label == 'key' and kind != SAME:
+                kind = INCOMPATIBLE
+            kinds.append(kind)
+            details.extend(child_details)
+    return _worst(kinds), details
+
+
+def format_type(parsed):
+    name, children = parsed
+    if name == 'unknown':
+        return children[0]
+    if name == 'struct':
+        return f"struct<{','.join(f'{field}:{format_type(child)}' for field, child in children)}>"
+    if name in COMPLEX_TYPES:
+        return f"{name}<{','.join(format_type(child) for child in children)}>"
+    if children:
+        return f"{name}({','.join(str(param) for param in children)})"
+    return name
+
+
+def _in_order(sequence):
+    """Indexes of a longest increasing subsequence of sequence (patience sorting, n log n)."""
+    tails = []
+    tail_index = []
+    previous = [None] * len(sequence)
+    for idx, value in enumerate(sequence):
+        pos = bisect_left(tails, value)
+        if pos == len(tails):
+            tails.append(value)
+            tail_index.append(idx)
+        else:
+            tails[pos] = value
+            tail_index[pos] = idx
+        previous[idx] = tail_index[pos - 1] if pos else None
+    result = set()
+    idx = tail_index[-1] if tail_index else None
+    while idx is not None:
+        result.add(idx)
+        idx = previous[idx]
+    return result
+
+
+def diff_columns(columns1, columns2):
+    """Structural diff of two ordered lists of (column, type) pairs.
+
+    Returns a dict with
+      new_columns / dropped_columns: [{'column', 'data_type', 'position'}]
+      type_changes: [{'column', 'from', 'to', 'change', 'details'}], change is widening or incompatible
+      moved_columns: [{'column', 'from', 'to', 'after'}], columns that are out of order relative to
+        the other common columns (the complement of the longest run that kept its order)
+      renamed_columns: [{'from', 'to', 'data_type', 'position'}], a dropped and an added column with
+        the same type, at the same position or the only pair of that type
+    Every step is a dict lookup or a single pass, so wide tables diff in linear time
+    (n log n for the moves).
+    """
+    index1 = {name.lower(): (pos, name, data_type) for pos, (name, data_type) in enumerate(columns1)}
+    index2 = {name.lower(): (pos, name, data_type) for pos, (name, data_type) in enumerate(columns2)}
+
+    differences = {'new_columns': [], 'dropped_columns': [], 'type_changes': [], 'moved_columns': [], 'renamed_columns': []}
+    dropped = [key for key in index1 if key not in index2]
+    added = [key for key in index2 if key not in index1]
+
+    # likely renames: same position and type first, then a type that was dropped and added once
+    renamed = {}
+    added_at = {index2[key][0]: key for key in added}
+    for key in dropped:
+        pos, _, data_type = index1[key]
+        candidate = added_at.get(pos)
+        if candidate is not None and parse_type(index2[candidate][2]) == parse_type(data_type):
+            renamed[key] = candidate
+    dropped_by_type = {}
+    added_by_type = {}
+    for key in dropped:
+        if key not in renamed:
+            dropped_by_type.setdefault(parse_type(index1[key][2]), []).append(key)
+    renamed_targets = set(renamed.values())
+    for key in added:
+        if key not in renamed_targets:
+            added_by_type.setdefault(parse_type(index2[key][2]), []).append(key)
+    for parsed, keys in dropped_by_type.items():
+        if len(keys) == 1 and len(added_by_type.get(parsed, [])) == 1:
+            renamed[keys[0]] = added_by_type[parsed][0]
+    renamed_targets = set(renamed.values())
+
+    for key in dropped:
+        pos, name, data_type = index1[key]
+        if key in renamed:
+            new_pos, new_name, _ = index2[renamed[key]]
+            differences['renamed_columns'].append({'from': name, 'to': new_name, 'data_type': data_type, 'position': new_pos})
+        else:
+            differences['dropped_columns'].append({'column': name, 'data_type': data_type, 'position': pos})
+    for key in added:
+        if key not in renamed_targets:
+            pos, name, data_type = index2[key]
+            differences['new_columns'].append({'column': name, 'data_type': data_type, 'position': pos})
+
+    common = [key for key in index1 if key in index2]
+    for key in common:
+        _, name, old_type = index1[key]
+        new_type = index2[key][2]
+        if old_type == new_type:
+            continue
+        kind, details = compare_types(parse_type(old_type), parse_type(new_type), name)
+        if kind != SAME:
+            differences['type_changes'].append({'column': name, 'from': old_type, 'to': new_type, 'change': kind, 'details': details})
+
+    kept = _in_order([index2[key][0] for key in common])
+    for idx, key in enumerate(common):
+        if idx not in kept:
+            new_pos, name, _ = index2[key]
+            differences['moved_columns'].append({'column': name, 'from': index1[key][0], 'to': new_pos,
+                                                 'after': columns2[new_pos - 1][0] if new_pos else None})
+
+    return {key: value for key, value in differences.items() if value}
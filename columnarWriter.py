@@ -0,0 +1,133 @@
+import os
+import re
+import csv
+import gzip
+import logging
+import datetime
+from decimal import Decimal
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+# [reports] report_format values written by ColumnarWriter, with their file suffix
+COLUMNAR_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow', 'csv.gz': '.csv.gz'}
+
+
+def check_formats(formats):
+    """Raise ValueError when a format needs pyarrow and it is not installed."""
+    if pyarrow is None and any(report_format in ('parquet', 'arrow') for report_format in formats):
+        raise ValueError("parquet and arrow report formats require the pyarrow package")
+
+
+def query_file_name(filebase, query_name):
+    """<filebase>_<query name as lower case identifier>, e.g. sales_reports_1700000000_table_stats."""
+    return f"{filebase}_{re.sub(r'[^0-9a-zA-Z]+', '_', query_name).strip('_').lower()}"
+
+
+def _text(value):
+    if isinstance(value, (bytes, bytearray)):
+        # mysql returns TEXT columns of some collations as bytes
+        return value.decode('utf-8', 'replace')
+    return str(value)
+
+
+def _column_type(values):
+    """Arrow type and converter of a column, from the first non null value of the first batch."""
+    value = next((value for value in values if value is not None), None)
+    if isinstance(value, bool):
+        return pyarrow.bool_(), bool
+    if isinstance(value, int):
+        return pyarrow.int64(), int
+    if isinstance(value, (float, Decimal)):
+        # averages and sums are decimals on the metastore databases, float is enough for reports
+        return pyarrow.float64(), float
+    if isinstance(value, datetime.datetime):
+        return pyarrow.timestamp('us'), None
+    if isinstance(value, datetime.date):
+        return pyarrow.date32(), None
+    return pyarrow.string(), _text
+
+
+class ColumnarWriter:
+    """Writes one query result as typed columnar files, one record batch at a time.
+
+    Every batch of rows goes to all formats at once and is then dropped, so memory is bounded by
+    the batch size and not by the result. The column types are taken from the first batch:
+    integers, floats (also decimals), booleans, timestamps and dates keep their type, everything
+    else is a string. A column without values in the first batch is a string column.
+    """
+
+    def __init__(self, base_path, formats):
+        check_formats(formats)
+        self.logger = logger
+        self.paths = {report_format: base_path + COLUMNAR_FORMATS[report_format] for report_format in formats}
+        self.schema = None
+        self.converters = None
+        self.writers = {}
+        self.csv_fd = None
+        self.csv_writer = None
+        self.rows = 0
+
+    def _open(self, columns, rows):
+        fields = []
+        self.converters = []
+        for idx, column in enumerate(columns):
+            if pyarrow is not None:
+                arrow_type, converter = _column_type(row[idx] for row in rows)
+                fields.append(pyarrow.field(str(column), arrow_type))
+                self.converters.append(converter)
+        if 'parquet' in self.paths or 'arrow' in self.paths:
+            self.schema = pyarrow.schema(fields)
+        if 'parquet' in self.paths:
+            self.writers['parquet'] = pyarrow.parquet.ParquetWriter(self.paths['parquet'], self.schema, compression='snappy')
+        if 'arrow' in self.paths:
+            self.writers['arrow'] = pyarrow.ipc.new_file(self.paths['arrow'], self.schema)
+        if 'csv.gz' in self.paths:
+            self.csv_fd = gzip.open(self.paths['csv.gz'], 'wt', newline='', encoding='utf-8')
+            self.csv_writer = csv.writer(self.csv_fd)
+            self.csv_writer.writerow(columns)
+
+    def write_batch(self, rows, columns):
+        if not rows:
+            return
+        if self.converters is None:
+            self._open(columns, rows)
+        if self.writers:
+            arrays = []
+            for idx, (field, converter) in enumerate(zip(self.schema, self.converters)):
+                values = [row[idx] for row in rows]
+                if converter is not None:
+                    values = [None if value is None else converter(value) for value in values]
+                arrays.append(pyarrow.array(values, type=field.type))
+            batch = pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema)
+            if 'parquet' in self.writers:
+                self.writers['parquet'].write_batch(batch)
+            if 'arrow' in self.writers:
+                self.writers['arrow'].write_batch(batch)
+        if self.csv_writer:
+            self.csv_writer.writerows([['' if value is None else _text(value) for value in row] for row in rows])
+        self.rows += len(rows)
+
+    def close(self):
+        """Finish the files. Returns the paths written, none for a result without rows."""
+        for writer in self.writers.values():
+            writer.close()
+        if self.csv_fd:
+            self.csv_fd.close()
+        return list(self.paths.values()) if self.converters is not None else []
+
+    def abort(self):
+        """Close and remove partly written files, after a failed query."""
+        try:
+            self.close()
+        except Exception as e:
+            self.logger.debug(f"Closing after a failed export: {e}")
+        for path in self.paths.values():
+            if os.path.isfile(path):
+                os.remove(path)
@@ -1,117 +1,455 @@
 import os
+import glob
+import json
 import sys
+import time
 import logging
+import itertools
 import traceback
+from collections import deque
+from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor
 
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, parent_dir)
 from reportWriter import ReportWriter
+from backupWriter import BackupWriter, BackupReader, write_manifest
+from viewDependencies import order_views
 
 logger = logging.getLogger(__name__)
 
+# table extents in the state file are [shard, offset, length] of the uncompressed shard
+BACKUP_STATE_VERSION = 2
+
+
+def partition_spec(part_name):
+    """Render a PART_NAME like dt=2024-01-01/hr=3 as a partition spec: dt='2024-01-01', hr=3.
+
+    Keys and values are unescaped from the %XX escaping of the metastore. Integer values are
+    left unquoted, anything else becomes a quoted string literal.
+    """
+    spec = []
+    for part in part_name.split('/'):
+        key, value = (unquote(item) for item in part.split('=', 1))
+        try:
+            int(value)
+            spec.append(f"{key}={value}")
+        except ValueError:
+            value = value.replace('\\', '\\\\').replace("'", "\\'")
+            spec.append(f"{key}='{value}'")
+    return ", ".join(spec)
+
+
+class ExtractionError(Exception):
+    """A metastore query failed while extracting a table. The backup run stops at its last checkpoint."""
+
+
+class CheckpointJournal:
+    """Append-only journal of the tables durably written to a backup file (<file>.ckpt).
+
+    The first line describes the run. Every further line is a checkpoint: the TBL_ID of the
+    last table written, the BackupWriter position after it and the extents of the tables
+    written since the previous checkpoint. The backup is fsynced before each checkpoint,
+    so everything up to the last complete line can be trusted after a crash.
+    """
+
+    def __init__(self, output_file):
+        self.path = f"{output_file}.ckpt"
+
+    def start(self, header):
+        with open(self.path, 'w') as fd:
+            fd.write(json.dumps(header) + "\n")
+            fd.flush()
+            os.fsync(fd.fileno())
+
+    def load(self):
+        """Return (header, last_table_id, position, table_extents) of the last checkpoint, or None."""
+        if not os.path.isfile(self.path):
+            return None
+        header = None
+        last_table_id = None
+        table_extents = {}
+        with open(self.path, 'r') as fd:
+            for line in fd:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn write of the checkpoint being appended when the run died
+                    break
+                if header is None:
+                    header = entry
+                    position = header['position']
+                    continue
+                last_table_id = entry['table_id']
+                position = entry['position']
+                table_extents.update(entry['tables'])
+        if header is None:
+            return None
+        return header, last_table_id, position, table_extents
+
+    def checkpoint(self, writer, table_id, table_extents):
+        position = writer.checkpoint()
+        with open(self.path, 'a') as fd:
+            fd.write(json.dumps({'table_id': table_id, 'position': position, 'tables': table_extents}) + "\n")
+            fd.flush()
+            os.fsync(fd.fileno())
+
+    def remove(self):
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+
 class DatabaseBackup:
-    def __init__(self, config):
+    def __init__(self, config, catalog_queries):
         self.logger = logger
         self.config = config
+        self.catalog_queries = catalog_queries
 
-    def database_schema_backup(self, dbo, db_type, hms_db, catalog, queries, output_file):
+    def database_schema_backup(self, dbo, db_type, hms_db, catalog, queries, output_file, bulk_queries=None, resume=False):
         db_schema={}
         DEFAULT_SCHEMA="default"
+        journal = CheckpointJournal(output_file)
+        writer = self.backup_writer(output_file)
         try:
             status_counter=0
             self.logger.info(f"Extracting DDL for database: {catalog}")
 
-            with open(output_file, 'w') as fd:
-                header = f"-- Beginning of backup\n"
-                fd.write(header)
-
-            # Create "create database" statement
-            if self.config.get_property('schema_backup', 'create_db_statement', 'true') == 'true':
-                if db_type == 'postgresql':
-                    create_db = f'select "DESC", "DB_LOCATION_URI" from "DBS" where "NAME"=\'{catalog}\''
-                elif db_type == 'mysql':
-                    create_db = f'select `DESC`, DB_LOCATION_URI from DBS where NAME=\'{catalog}\''
-
-                results = dbo.query(create_db)
-                if len(results) > 0:
-                    with open(output_file, 'a') as fd:
-                        header = f"-- Create Database\n"
-                        fd.write(header)
-                        create_db_statement=f"CREATE DATABASE IF NOT EXISTS {catalog} \n COMMENT \"{results[0]}\" \n LOCATION \"{results[1]}\";\n"
-                        fd.write(create_db_statement)
-                else:
-                    logger.warn(f"database: {catalog} not found")
-                    return
+            resumed = journal.load() if resume else None
+            if resumed and (resumed[0]['render_options'] != self.render_options()
+                            or resumed[0]['output_options'] != self.output_options()):
+                logger.warning(f"Backup options changed since {output_file} was started. Starting over")
+                resumed = None
+            if resumed:
+                header, last_table_id, position, table_extents = resumed
+                last_event_id = header['last_event_id']
+                # drop whatever was written after the last durable checkpoint
+                writer.resume(position)
+                logger.info(f"Resuming backup of {catalog} in {output_file} after table id {last_table_id} ({len(table_extents)} tables done)")
+            else:
+                last_table_id = None
+                table_extents = {}
+                writer.start()
+                writer.write(f"-- Beginning of backup\n")
+
+                # Create "create database" statement
+                if self.config.get_property('schema_backup', 'create_db_statement', 'true') == 'true':
+                    create_db = self.catalog_queries['database_info']
+                    results, _ = dbo.query(create_db, create_db.params(catalog=catalog))
+                    if results:
+                        writer.write(f"-- Create Database\n")
+                        create_db_statement=f"CREATE DATABASE IF NOT EXISTS {catalog} \n COMMENT \"{results[0][0]}\" \n LOCATION \"{results[0][1]}\";\n"
+                        writer.write(create_db_statement)
+                    else:
+                        raise ExtractionError(f"database: {catalog} not found")
+
+                # The event watermark is read before the table list so that changes made while the
+                # backup runs are picked up again by the next incremental run
+                last_event_id = self.current_event_id(dbo)
+                journal.start({'catalog': catalog, 'last_event_id': last_event_id, 'render_options': self.render_options(),
+                               'output_options': self.output_options(), 'position': writer.checkpoint()})
 
             db_schema['schemas']={}
             db_schema['schemas'][DEFAULT_SCHEMA]={}
             db_schema['schemas'][DEFAULT_SCHEMA]['tables']={}
 
             # Get tables
-            if db_type == 'postgresql':
-                table_list_cmd = f'select "TBL_NAME" from "TBLS" where "TBL_TYPE" not in (\'VIRTUAL_VIEW\',\'MATERIALIZED_VIEW\') and "DB_ID"=(select "DB_ID" from "DBS" where "NAME"=\'{catalog}\') order by "TBL_ID"'
-            elif db_type == 'mysql':
-                table_list_cmd = f'select TBL_NAME from TBLS where TBL_TYPE not in (\'VIRTUAL_VIEW\',\'MATERIALIZED_VIEW\') and DB_ID=(select DB_ID from DBS where NAME=\'{catalog}\') order by TBL_ID'
-
-            rows, cols = dbo.query(table_list_cmd)
+            table_list_cmd = self.catalog_queries['table_list']
+            rows, cols = dbo.query(table_list_cmd, table_list_cmd.params(catalog=catalog))
+            if rows is None:
+                raise ExtractionError(f"table_list failed for {catalog}")
+            logger.info(f"Found {len(rows)} tables in {catalog}")
+            if last_table_id is not None:
+                # table_list is ordered by TBL_ID and new tables get higher ids
+                rows = [row for row in rows if row[1] > last_table_id]
             total_tables = len(rows)
-            logger.info(f"Found {total_tables} tables in {catalog}")
-            with open(output_file, 'a') as fd:
-                for row in rows:
-                    table_dict = self.backup_table_ddl(dbo, 'hive', catalog, row[0], queries, fd)
-                    if status_counter > 0 and total_tables > 10 and status_counter%(int(total_tables/10)) == 0:
-                        logger.info(f"Processed {status_counter} tables")
-                    status_counter = status_counter + 1
-                    db_schema['schemas'][DEFAULT_SCHEMA]['tables'][row[0]] = table_dict
+
+            # Incremental backups copy the DDL of unchanged tables from the previous backup
+            reuse = {}
+            previous = None
+            if self.config.get_property('schema_backup', 'backup_mode', 'full') == 'incremental':
+                previous = self.load_previous_backup(output_file, catalog)
+                changed = self.changed_tables(dbo, catalog, previous, last_event_id)
+                if changed is None:
+                    previous = None
+                else:
+                    reuse = {name: extent for name, extent in previous['tables'].items() if name not in changed}
+                    logger.info(f"Incremental backup of {catalog}: {len(changed)} tables changed since event {previous['last_event_id']} ({previous['ddl_file']})")
+
+            extraction_mode = self.config.get_property('schema_backup', 'extraction_mode', 'per_table')
+            if extraction_mode == 'bulk' and not bulk_queries:
+                logger.warning("extraction_mode is bulk but no bulk queries were loaded. Falling back to per_table")
+                extraction_mode = 'per_table'
+            if extraction_mode == 'bulk' and previous:
+                # chunks would span the unchanged tables; the few changed ones are extracted per table
+                extraction_mode = 'per_table'
+            if extraction_mode == 'bulk':
+                # Tables are ordered by TBL_ID, so every chunk maps to one TBL_ID range
+                chunk_size = int(self.config.get_property('schema_backup', 'bulk_chunk_size', '1000'))
+                units = [rows[i:i + chunk_size] for i in range(0, total_tables, chunk_size)]
+            else:
+                units = [[row] for row in rows]
+            workers = int(self.config.get_property('schema_backup', 'workers', '1'))
+            checkpoint_interval = int(self.config.get_property('schema_backup', 'checkpoint_interval', '500'))
+            start_time = time.time()
+            reader = BackupReader(os.path.dirname(output_file), previous['files'], previous['compression']) if previous else None
+            try:
+                checkpoint_extents = {}
+                for unit_results in self.extract_units(dbo, catalog, units, queries, bulk_queries, extraction_mode, workers, reuse):
+                    for table_name, table_id, table_dict, create_statement, partitions in unit_results:
+                        writer.begin_table()
+                        if create_statement is None:
+                            writer.write(reader.read(reuse[table_name]))
+                        else:
+                            # partitions go from the cursor to the writer, on this thread and in TBL_ID order
+                            writer.write(create_statement)
+                            self.write_partitions(dbo, catalog, table_name, partitions, writer)
+                        checkpoint_extents[table_name] = writer.end_table()
+                        last_table_id = table_id
+                        if status_counter > 0 and total_tables > 10 and status_counter%(int(total_tables/10)) == 0:
+                            rate = status_counter / max(time.time() - start_time, 0.001)
+                            logger.info(f"Processed {status_counter} tables ({rate:.1f} tables/sec)")
+                        status_counter = status_counter + 1
+                        if table_dict is not None:
+                            db_schema['schemas'][DEFAULT_SCHEMA]['tables'][table_name] = table_dict
+                    if len(checkpoint_extents) >= checkpoint_interval:
+                        journal.checkpoint(writer, last_table_id, checkpoint_extents)
+                        table_extents.update(checkpoint_extents)
+                        checkpoint_extents = {}
+                journal.checkpoint(writer, last_table_id, checkpoint_extents)
+                table_extents.update(checkpoint_extents)
+            finally:
+                if reader is not None:
+                    reader.close()
+            elapsed = time.time() - start_time
+            reused = sum(1 for row in rows if row[0] in reuse)
+            logger.info(f"Extracted {status_counter - reused} tables and reused {reused} in {elapsed:.1f}s ({status_counter / max(elapsed, 0.001):.1f} tables/sec, workers={workers})")
             logger.info(f"Table DDL saved to {output_file} successfully.")
 
+            view_count = 0
+            function_count = 0
             # Get views and materialized views and append to the results file at the end.
             # The views and materialized views are ordered to resolve the dependencies
             if self.config.get_property('schema_backup', 'include_views', 'true') == 'true':
-                if db_type == 'postgresql':
-                    view_list_cmd = f'select "TBL_ID" from "TBLS" where "TBL_TYPE" in (\'VIRTUAL_VIEW\',\'MATERIALIZED_VIEW\') and "DB_ID"=(select "DB_ID" from "DBS" where "NAME"=\'{catalog}\') order by "TBL_ID"'
-                elif db_type == 'mysql':
-                    view_list_cmd = f'select TBL_ID from TBLS where TBL_TYPE in (\'VIRTUAL_VIEW\',\'MATERIALIZED_VIEW\') and DB_ID=(select DB_ID from DBS where NAME=\'{catalog}\') order by TBL_ID'
-
-                rows, _ = dbo.query(view_list_cmd)
+                view_cmd = self.catalog_queries['view_definitions']
+                rows, _ = dbo.query(view_cmd, view_cmd.params(catalog=catalog))
+                if rows is None:
+                    raise ExtractionError(f"view_definitions failed for {catalog}")
                 logger.info(f"Found {len(rows)} views in {catalog}")
-                with open(output_file, 'a') as fd:
-                    for row in rows:
-                        if db_type == 'postgresql':
-                            formatted_query=f'select "TBL_TYPE", "VIEW_EXPANDED_TEXT", "TBL_NAME" from "TBLS" where "DB_ID"=(select "DB_ID" from "DBS" where "NAME"=\'{catalog}\') and "TBL_ID"={row[0]}'
-                        elif db_type == 'mysql':
-                            formatted_query=f'select TBL_TYPE, VIEW_EXPANDED_TEXT, TBL_NAME from TBLS where DB_ID=(select DB_ID from DBS where NAME=\'{catalog}\') and TBL_ID={row[0]}'
-                        results, _ = dbo.query(formatted_query)
-                        if len(results) > 0:
-                            create_view_statement='' 
-                            view_text = results[0][1]
-                            logger.debug(f"View DDL {results[0]}, {view_text}")
-                            if results[0] == 'VIRTUAL_VIEW':
-                                create_view_statement = f"CREATE VIEW {results[0][2]} as ({view_text});\n"
-                            if results[0] == 'MATERIALIZED_VIEW':
-                                create_view_statement = f"CREATE MATERIALIZED VIEW {results[0][2]} as ({view_text});\n"
-                            fd.write(create_view_statement)
+                view_count = len(rows)
+                for view_name, view_type, view_text in order_views([(row[3], row[1], row[2]) for row in rows], catalog):
+                    create_view_statement=''
+                    logger.debug(f"View DDL {view_name}, {view_type}, {view_text}")
+                    if view_type == 'VIRTUAL_VIEW':
+                        create_view_statement = f"CREATE VIEW `{catalog}`.`{view_name}` as ({view_text});\n"
+                    if view_type == 'MATERIALIZED_VIEW':
+                        create_view_statement = f"CREATE MATERIALIZED VIEW `{catalog}`.`{view_name}` as ({view_text});\n"
+                    writer.write(create_view_statement)
 
             # Get functions DDL and add to the end of the results file
             if self.config.get_property('schema_backup', 'include_functions', 'true') == 'true':
-                if db_type == 'postgresql':
-                    func_list_cmd = f'select "CLASS_NAME", "FUNC_NAME","FUNC_TYPE", "OWNER_NAME" from "FUNCS" where "DB_ID"=(select "DB_ID" from "DBS" where "NAME"=\'{catalog}\') order by "FUNC_ID"'
-                elif db_type == 'mysql':
-                    func_list_cmd = f'select CLASS_NAME, FUNC_NAME,FUNC_TYPE, OWNER_NAME from FUNCS where DB_ID=(select DB_ID from DBS where NAME=\'{catalog}\') order by FUNC_ID'
-                
-                rows, cols = dbo.query(func_list_cmd)
-                with open(output_file, 'a') as fd:
-                    for row in rows:
-                        create_func_statement = f"CREATE {row[2]} FUNCTION {row[1]} AS {row[0]};\n"
-                        fd.write(create_func_statement)
+                func_list_cmd = self.catalog_queries['function_list']
+                rows, cols = dbo.query(func_list_cmd, func_list_cmd.params(catalog=catalog))
+                if rows is None:
+                    raise ExtractionError(f"function_list failed for {catalog}")
+                function_count = len(rows)
+                for row in rows:
+                    # FUNC_TYPE is the numeric function type of the metastore (1 = JAVA), not a keyword
+                    create_func_statement = f"CREATE FUNCTION `{catalog}`.`{row[1]}` AS '{row[0]}';\n"
+                    writer.write(create_func_statement)
+
+            shards = writer.close()
+            write_manifest(output_file, catalog, writer.compression, shards,
+                           {'tables': len(table_extents), 'views': view_count, 'functions': function_count})
+            self.save_backup_state(output_file, catalog, last_event_id, table_extents, shards)
+            journal.remove()
 
         except Exception as e:
             logger.error(f"An error occurred in backup_database_ddl: {e}")
-            traceback.print_exc()
+            writer.abort()
+            if os.path.isfile(journal.path):
+                logger.error(f"Backup of {catalog} is incomplete. Run again with --resume to continue {output_file}")
+            # the journal is kept, the caller sees the catalog as failed
+            raise
         return db_schema
 
 
-    def backup_table_ddl(self, dbo, database, catalog, table, table_ddl_queries, ofd):
+    def extract_units(self, dbo, catalog, units, queries, bulk_queries, extraction_mode, workers, reuse=None):
+        """Yield a list of (table_name, table_id, table_dict, create_statement, partitions) for every
+        unit of tables, in the order of units.
+
+        With workers > 1 the units are extracted concurrently on a thread pool that shares
+        the connection pool of dbo. A bounded reorder buffer hands the results back in
+        TBL_ID order so that backups of an unchanged catalog stay diffable. The partitions
+        are streamed by the caller with write_partitions(), so the buffer only holds the
+        CREATE statements.
+        Tables found in reuse are not extracted, their table_dict, create_statement and partitions are None.
+        """
+        reuse = reuse or {}
+        if workers <= 1:
+            for unit in units:
+                yield self._extract_unit(dbo, catalog, unit, queries, bulk_queries, extraction_mode, reuse)
+            return
+
+        max_pending = workers * 4
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="schema_backup") as executor:
+            for unit in units:
+                pending.append(executor.submit(self._extract_unit, dbo, catalog, unit, queries, bulk_queries, extraction_mode, reuse))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+    def _extract_unit(self, dbo, catalog, unit, queries, bulk_queries, extraction_mode, reuse):
+        chunk_results = None
+        if extraction_mode == 'bulk':
+            chunk_results = self.fetch_table_chunk(dbo, 'hive', catalog, unit[0][1], unit[-1][1], bulk_queries)
+        unit_results = []
+        for row in unit:
+            if row[0] in reuse:
+                unit_results.append((row[0], row[1], None, None, None))
+                continue
+            prefetched = chunk_results.get(row[1], {}) if chunk_results is not None else None
+            table_dict, create_statement, partitions = self.table_ddl(dbo, 'hive', catalog, row[0], queries, prefetched=prefetched)
+            unit_results.append((row[0], row[1], table_dict, create_statement, partitions))
+        return unit_results
+
+
+    @staticmethod
+    def find_unfinished_backup(results_dir, catalog):
+        """Return the most recent backup file of catalog that still has a checkpoint journal, or None."""
+        journals = glob.glob(os.path.join(glob.escape(results_dir), f"{glob.escape(catalog)}_backup_*.ckpt"))
+        if not journals:
+            return None
+        return max(journals, key=os.path.getmtime)[:-len('.ckpt')]
+
+
+    def current_event_id(self, dbo):
+        """Highest EVENT_ID of NOTIFICATION_LOG, or None when notifications are not available."""
+        try:
+            event_range = self.catalog_queries['event_id_range']
+            results, _ = dbo.query(event_range)
+            if results and results[0][1] is not None:
+                return int(results[0][1])
+        except Exception as e:
+            logger.warning(f"Unable to read NOTIFICATION_LOG: {e}")
+        return None
+
+
+    def load_previous_backup(self, output_file, catalog):
+        """Return the state of the most recent backup of catalog in the results directory, or None."""
+        results_dir = os.path.dirname(output_file) or '.'
+        latest = None
+        for state_file in glob.glob(os.path.join(glob.escape(results_dir), f"{glob.escape(catalog)}_backup_*.state.json")):
+            try:
+                with open(state_file, 'r') as fd:
+                    state = json.load(fd)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable backup state {state_file}: {e}")
+                continue
+            if state.get('version') != BACKUP_STATE_VERSION or state.get('catalog') != catalog:
+                continue
+            if state['ddl_file'] == os.path.basename(output_file):
+                continue
+            if not all(os.path.isfile(os.path.join(results_dir, name)) for name in state['files']):
+                continue
+            if latest is None or state['created'] > latest['created']:
+                latest = state
+        return latest
+
+
+    def changed_tables(self, dbo, catalog, previous, last_event_id):
+        """Names of the tables with DDL events since the previous backup.
+
+        Returns None when the previous backup cannot be brought up to date, in which case
+        a full backup is taken: no previous backup, different rendering options, no event
+        watermark, or events between the two watermarks have already been purged.
+        """
+        if previous is None:
+            logger.info(f"No previous backup of {catalog} found. Taking a full backup")
+            return None
+        if previous.get('render_options') != self.render_options():
+            logger.info(f"Backup options changed since {previous['ddl_file']}. Taking a full backup")
+            return None
+        if previous.get('last_event_id') is None or last_event_id is None:
+            logger.info(f"No NOTIFICATION_LOG watermark for {catalog}. Taking a full backup")
+            return None
+        event_range = self.catalog_queries['event_id_range']
+        results, _ = dbo.query(event_range)
+        if not results:
+            logger.info(f"Unable to read the NOTIFICATION_LOG event range. Taking a full backup")
+            return None
+        if results[0][0] is not None and int(results[0][0]) > previous['last_event_id'] + 1:
+            logger.info(f"NOTIFICATION_LOG was cleaned up past event {previous['last_event_id']}. Taking a full backup")
+            return None
+        changed_cmd = self.catalog_queries['changed_tables']
+        rows, cols = dbo.query(changed_cmd, changed_cmd.params(catalog=catalog, from_event_id=previous['last_event_id'], to_event_id=last_event_id))
+        if cols is None:
+            # a failed query returns (None, None), no changes is an empty result with columns
+            logger.info(f"Unable to read the changed tables of {catalog}. Taking a full backup")
+            return None
+        return {row[0] for row in rows}
+
+
+    def single_line(self):
+        """Whether CREATE TABLE statements are written on one line. The renderer and the backup
+        state must use the same default."""
+        return self.config.get_property('schema_backup', 'single_line_statement', 'true') == 'true'
+
+
+    def render_options(self):
+        return {
+            'single_line_statement': 'true' if self.single_line() else 'false',
+            'partition_batch_size': self.config.get_property('schema_backup', 'partition_batch_size', '1'),
+        }
+
+
+    def output_options(self):
+        return {
+            'compression': self.config.get_property('schema_backup', 'output_compression', 'none'),
+            'shard_tables': int(self.config.get_property('schema_backup', 'shard_tables', '0')),
+        }
+
+
+    def backup_writer(self, output_file):
+        buffer_size = int(self.config.get_property('schema_backup', 'write_buffer_mb', '8')) * 1024 * 1024
+        return BackupWriter(output_file, buffer_size=buffer_size, **self.output_options())
+
+
+    def save_backup_state(self, output_file, catalog, last_event_id, table_extents, shards):
+        """Record the event watermark and the extent of every table next to the DDL file."""
+        state = {
+            'version': BACKUP_STATE_VERSION,
+            'catalog': catalog,
+            'ddl_file': os.path.basename(output_file),
+            'files': [shard['file'] for shard in shards],
+            'compression': self.output_options()['compression'],
+            'created': time.time(),
+            'last_event_id': last_event_id,
+            'render_options': self.render_options(),
+            'tables': table_extents,
+        }
+        state_file = f"{output_file}.state.json"
+        with open(state_file, 'w') as fd:
+            json.dump(state, fd)
+        logger.info(f"Backup state saved to {state_file} (event {last_event_id})")
+
+
+    def backup_table_ddl(self, dbo, database, catalog, table, table_ddl_queries, ofd, prefetched=None):
+        """Write the CREATE statement and the ADD PARTITION statements of a table to ofd."""
+        table_dict, create_statement, partitions = self.table_ddl(dbo, database, catalog, table, table_ddl_queries, prefetched)
+        ofd.write(create_statement)
+        self.write_partitions(dbo, catalog, table, partitions, ofd)
+        return table_dict
+
+
+    def table_ddl(self, dbo, database, catalog, table, table_ddl_queries, prefetched=None):
+        """Return (table_dict, create statement, partitions) of a table.
+
+        The partitions are not read here: write_partitions() streams them to the backup, so that
+        the partitions of a large table never have to be held in memory.
+        """
         create_statement=""
         table_dict={}
         try:
@@ -133,14 +471,26 @@ class DatabaseBackup:
             table_comment=""
             sorted_by_string=""
             alter_statement_string=""
-            for query_name, query_template in table_ddl_queries.items():
-                formatted_query = query_template.format(database=database, catalog=catalog,
-                    table=table, table_id=table_id, serde_id=serde_id, sd_id=sd_id, cd_id=cd_id,
-                    db_location_uri=db_location_uri, db_managed_uri=db_managed_uri)
-                logger.debug(f"Executing query {query_name} : {formatted_query}")
-                rows, cols = dbo.query(formatted_query)
-                logger.debug(f"Rows: {len(rows)}, cols: {len(cols)}")
-                results = [dict(zip(cols, row)) for row in rows]
+            partition_query=None
+            for query_name, query in table_ddl_queries.items():
+                if query_name == 'Q18':
+                    # Partitions can run into millions of rows. They are streamed per table after the
+                    # create statement, also in bulk mode. Location prefixes are bound as text
+                    partition_query = (query, query.params(database=database, catalog=catalog,
+                        table=table, table_id=table_id, db_location_uri=f"{db_location_uri}", db_managed_uri=f"{db_managed_uri}"))
+                    continue
+                if prefetched is not None:
+                    # Bulk mode: results were already fetched for a whole chunk of tables
+                    results = prefetched.get(query_name, [])
+                else:
+                    params = query.params(database=database, catalog=catalog,
+                        table=table, table_id=table_id, serde_id=serde_id, sd_id=sd_id, cd_id=cd_id)
+                    logger.debug(f"Executing query {query_name} : {query} {params}")
+                    rows, cols = dbo.query(query, params)
+                    if rows is None:
+                        raise ExtractionError(f"{query_name} failed for table {catalog}.{table}")
+                    logger.debug(f"Rows: {len(rows)}, cols: {len(cols)}")
+                    results = [dict(zip(cols, row)) for row in rows]
                 logger.debug(f"Results for {query_name} : {results}")
                 if query_name == 'Q1':
                     if len(results) > 0:
@@ -156,7 +506,7 @@ class DatabaseBackup:
                             table_type = ttype
                     else:
                         logging.warning(f"Table: {table} not found in the metastore")
-                        return
+                        return None, "", None
                 if query_name == 'Q2':
                     if len(results) > 0:
                         sd_id = results[0].get('SD_ID')
@@ -270,39 +620,87 @@ class DatabaseBackup:
                         if bucket_cols is not None:
                             clustered_by_string=f"\nCLUSTERED BY ({bucket_cols}) {sorted_by_string} {bucket_string}"
 
-                if query_name == 'Q18':
-                    alter_statements = []
-                    for entry in results:
-                        part_key=entry['PART_NAME']
-                        key, value = part_key.split('=')
-                        try:
-                            int(value)
-                            is_numeric = True
-                        except ValueError:
-                            is_numeric = False
-
-                        if not is_numeric:
-                            part_key=f"{key}='{value}'"
-
-                        temp=f"ALTER TABLE {catalog}.{table_name} ADD PARTITION ({part_key}) LOCATION '{entry['LOCATION']}';\n"
-                        alter_statements.append(temp)
-
             if table_type == 'TABLE':
                 create_statement = f"CREATE {table_type} `{catalog}`.`{table_name}`(\n  {column_string}) {table_comment} {partition_key_string} {clustered_by_string} {row_format} {serde_properties} {format_string} {stored_by} {tbl_properties};\n\n"
             else:
                 create_statement = f"CREATE {table_type} `{catalog}`.`{table_name}`(\n  {column_string}) {table_comment} {partition_key_string} {clustered_by_string} {row_format} {serde_properties} {format_string} {location_string} {stored_by} {tbl_properties};\n\n"
 
-            if self.config.get_property('schema_backup', 'single_line_statement', 'true') == 'true':
+            if self.single_line():
                 new_create_statement = ''.join([char for char in create_statement if char not in ['\n', '\r']])
-                ofd.write(f"{new_create_statement}\n")
-            else:
-                ofd.write(create_statement)
+                create_statement = f"{new_create_statement}\n"
 
-            for alter_statement in alter_statements:
+            return table_dict, create_statement, (table_name, partition_query)
+        except ExtractionError:
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            # the table must not be checkpointed as finished, so that --resume retries it
+            raise ExtractionError(f"DDL extraction failed for table {catalog}.{table}: {e}") from e
+
+
+    def write_partitions(self, dbo, catalog, table, partitions, ofd):
+        """Write the ADD PARTITION statements of a table, partitions is (table_name, Q18 query) from table_ddl()."""
+        if partitions is None:
+            return
+        table_name, partition_query = partitions
+        if partition_query is None:
+            return
+        try:
+            partition_entries = self._stream_partitions(dbo, catalog, table, *partition_query)
+            for alter_statement in self._partition_statements(catalog, table_name, partition_entries):
                 logging.debug(f"{alter_statement}")
                 ofd.write(alter_statement)
-
-            return table_dict
+        except ExtractionError:
+            raise
         except Exception as e:
             traceback.print_exc()
-            print("Error:", e)
+            raise ExtractionError(f"Partition extraction failed for table {catalog}.{table}: {e}") from e
+
+
+    def _stream_partitions(self, dbo, catalog, table, query, params):
+        try:
+            for rows, cols in dbo.iter_query(query, params):
+                for row in rows:
+                    yield dict(zip(cols, row))
+        except Exception as e:
+            raise ExtractionError(f"Q18 failed for table {catalog}.{table}: {e}") from e
+
+
+    def fetch_table_chunk(self, dbo, database, catalog, min_table_id, max_table_id, bulk_queries):
+        """Run the set-based bulk queries for a TBL_ID range and group the rows per table."""
+        chunk_results = {}
+        for query_name, query in bulk_queries.items():
+            params = query.params(database=database, catalog=catalog,
+                min_table_id=min_table_id, max_table_id=max_table_id)
+            logger.debug(f"Executing bulk query {query_name} : {query} {params}")
+            rows, cols = dbo.query(query, params)
+            if rows is None:
+                raise ExtractionError(f"Bulk query {query_name} failed for table ids {min_table_id}-{max_table_id}")
+            logger.debug(f"Bulk query {query_name} returned {len(rows)} rows")
+            for row in rows:
+                entry = dict(zip(cols, row))
+                chunk_results.setdefault(entry['TBL_ID'], {}).setdefault(query_name, []).append(entry)
+        return chunk_results
+
+
+    def _partition_statements(self, catalog, table_name, entries):
+        """Yield the ADD PARTITION statements of a table as the partition entries stream in.
+
+        With partition_batch_size > 1 up to that many partitions are added by one
+        ALTER TABLE ... ADD IF NOT EXISTS PARTITION (...) LOCATION ... PARTITION (...) ... statement.
+        """
+        batch_size = int(self.config.get_property('schema_backup', 'partition_batch_size', '1'))
+        if batch_size <= 1:
+            for entry in entries:
+                yield f"ALTER TABLE {catalog}.{table_name} ADD PARTITION ({partition_spec(entry['PART_NAME'])}) LOCATION '{entry['LOCATION']}';\n"
+            return
+        # single_line_statement keeps every statement on one line, like the CREATE statements
+        separator = " " if self.single_line() else "\n"
+        entries = iter(entries)
+        while True:
+            batch = list(itertools.islice(entries, batch_size))
+            if not batch:
+                return
+            partitions = separator.join(f"PARTITION ({partition_spec(entry['PART_NAME'])}) LOCATION '{entry['LOCATION']}'" for entry in batch)
+            yield f"ALTER TABLE {catalog}.{table_name} ADD IF NOT EXISTS{separator}{partitions};\n"
+
@@ -1,91 +1,194 @@
 import os
 import sys
+import time
 import logging
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+from viewDependencies import order_views
+from schemaFingerprint import add_fingerprints, fingerprint_object
+from tableStore import TableStore
+from partitionCompare import ordered_partitions, merge_partitions
+from commands.databaseBackup import ExtractionError
+
 logger = logging.getLogger(__name__)
 
 class DatabaseCompare:
-    def __init__(self, config):
+    def __init__(self, config, catalog_queries):
         self.logger = logger
         self.config = config
+        self.catalog_queries = catalog_queries
+
+    def get_database_schemas(self, sides, db_type, hms_db, queries):
+        """Extract the schemas of several (label, dbo, catalog) sides concurrently.
+
+        Every side is read through its own dbo, so independent metastores are extracted in
+        parallel. The first side is the reference (source or golden) the others are compared
+        to. Returns {label: (db_schema, seconds)}.
+        With server_fingerprints, tables whose server side fingerprint is the same on every side
+        are not extracted, they only carry that fingerprint. A table that only matches the
+        reference on some sides is extracted once from the reference and shared with them.
+        """
+        identical = {}
+        if len(sides) > 1 and self.config.get_property('compare', 'server_fingerprints', 'true') == 'true':
+            identical = self.identical_tables(sides)
+
+        def extract(label, dbo, catalog):
+            start = time.time()
+            db_schema = self.get_database_schema(dbo, db_type, hms_db, catalog, queries, identical_tables=identical.get(label))
+            return db_schema, time.time() - start
+
+        with ThreadPoolExecutor(max_workers=len(sides), thread_name_prefix="compare") as executor:
+            futures = {label: executor.submit(extract, label, dbo, catalog) for label, dbo, catalog in sides}
+            schemas = {label: future.result() for label, future in futures.items()}
+
+        reference = sides[0][0]
+        reference_tables = schemas[reference][0].get('schemas', {}).get('default', {}).get('tables', {})
+        for label, _, _ in sides[1:]:
+            db_schema = schemas[label][0]
+            tables = db_schema.get('schemas', {}).get('default', {}).get('tables')
+            shared = [name for name in identical.get(label, {}) if name not in identical.get(reference, {}) and name in reference_tables]
+            if tables is not None and shared:
+                for name in shared:
+                    tables[name] = reference_tables[name]
+                add_fingerprints(db_schema, self.config)
+        return schemas
+
+
+    def identical_tables(self, sides):
+        """Return {label: {table: fingerprint}} of the tables that need not be extracted on each side.
+
+        The table_fingerprints query hashes what the compare looks at (type, location, formats,
+        number of buckets, bucket columns, serde and its parameters, columns and partition keys)
+        in one aggregate query per catalog. Table parameters are not compared and not hashed.
+        The reference side skips the tables that are identical on every side, the other sides
+        skip the tables that are identical to the reference.
+        """
+        fingerprints = {}
+        for label, dbo, catalog in sides:
+            fingerprint_cmd = self.catalog_queries['table_fingerprints']
+            rows, _ = dbo.query(fingerprint_cmd, fingerprint_cmd.params(catalog=catalog))
+            if rows is None:
+                logger.warning(f"table_fingerprints failed on {label}. Extracting all tables")
+                return {}
+            fingerprints[label] = {row[0]: row[1] for row in rows}
+        reference = sides[0][0]
+        identical = {}
+        common = fingerprints[reference]
+        for label, _, _ in sides[1:]:
+            identical[label] = {name: fp for name, fp in fingerprints[label].items() if fingerprints[reference].get(name) == fp}
+            common = {name: fp for name, fp in common.items() if identical[label].get(name) == fp}
+        identical[reference] = common
+        logger.info(f"{len(common)} tables have identical fingerprints on all sides and are not extracted")
+        return identical
+
+
+    def compare_partitions(self, source, target):
+        """Compare the partitions of a (dbo, catalog) source and target.
+
+        Both sides stream (TBL_NAME, PART_NAME, LOCATION) in key order through server side
+        cursors and are merge joined, so memory does not grow with the number of partitions.
+        Returns {table: counters} of merge_partitions.
+        """
+        sample_size = int(self.config.get_property('compare', 'partition_sample_size', '20'))
+        location_mode = self.config.get_property('compare', 'partition_location_compare', 'full')
+        batch_size = int(self.config.get_property('compare', 'partition_batch_size', '5000'))
+        partition_cmd = self.catalog_queries['partition_list']
+        streams = []
+        for label, (dbo, catalog) in (('source', source), ('target', target)):
+            batches = dbo.iter_query(partition_cmd, partition_cmd.params(catalog=catalog), batch_size=batch_size)
+            streams.append(ordered_partitions(batches, f"{label} {catalog}"))
+        start = time.time()
+        tables = merge_partitions(streams[0], streams[1], sample_size, location_mode)
+        logger.info(f"Compared partitions of {len(tables)} tables in {time.time() - start:.1f}s")
+        return tables
 
-    def get_database_schema(self, dbo, db_type, hms_db, catalog, queries):
-        db_schema={}
+
+    def table_store(self):
+        """Container for the tables of one extracted schema.
+
+        With [compare] memory_budget_mb, tables beyond the budget spill to a sqlite file.
+        """
+        budget_mb = int(self.config.get_property('compare', 'memory_budget_mb', '0'))
+        if budget_mb <= 0:
+            return {}
+        return TableStore(budget_mb * 1024 * 1024, self.config.get_property('compare', 'spill_dir', '').strip())
+
+
+    def get_database_schema(self, dbo, db_type, hms_db, catalog, queries, identical_tables=None):
+        db_schema={'catalog': catalog}
         DEFAULT_SCHEMA="default"
         try:
             if self.config.get_property('compare', 'compare_database_properties', 'true') == 'true':
                 db_schema['properties']={}
-                if db_type == 'postgresql':
-                    create_db = f'select "DESC", "DB_LOCATION_URI" from "DBS" where "NAME"=\'{catalog}\''
-                elif db_type == 'mysql':
-                    create_db = f'select `DESC`, DB_LOCATION_URI from DBS where NAME=\'{catalog}\''
-
-                results = dbo.query(create_db)
-                if len(results) > 0:
-                    db_schema['properties']['comment']=results[0]
-                    db_schema['properties']['location']=results[1]
+                create_db = self.catalog_queries['database_info']
+                results, _ = dbo.query(create_db, create_db.params(catalog=catalog))
+                if results:
+                    db_schema['properties']['comment']=results[0][0]
+                    db_schema['properties']['location']=results[0][1]
                 else:
                     logger.warn(f"database: {catalog} not found")
                     return db_schema
 
             db_schema['schemas']={}
             db_schema['schemas'][DEFAULT_SCHEMA]={}
-            db_schema['schemas'][DEFAULT_SCHEMA]['tables']={}
+            db_schema['schemas'][DEFAULT_SCHEMA]['tables']=self.table_store()
 
             # Get tables
             if self.config.get_property('compare', 'compare_tables', 'true') == 'true':
-                if db_type == 'postgresql':
-                    table_list_cmd = f'select "TBL_NAME" from "TBLS" where "TBL_TYPE" not in (\'VIRTUAL_VIEW\',\'MATERIALIZED_VIEW\') and "DB_ID"=(select "DB_ID" from "DBS" where "NAME"=\'{catalog}\') order by "TBL_ID"'
-                elif db_type == 'mysql':
-                    table_list_cmd = f'select TBL_NAME from TBLS where TBL_TYPE not in (\'VIRTUAL_VIEW\',\'MATERIALIZED_VIEW\') and DB_ID=(select DB_ID from DBS where NAME=\'{catalog}\') order by TBL_ID'
-
-                rows, cols = dbo.query(table_list_cmd)
+                table_list_cmd = self.catalog_queries['table_list']
+                rows, cols = dbo.query(table_list_cmd, table_list_cmd.params(catalog=catalog))
+                if rows is None:
+                    raise ExtractionError(f"table_list failed for {catalog}")
+                identical_tables = identical_tables or {}
                 for row in rows:
+                    if row[0] in identical_tables:
+                        db_schema['schemas'][DEFAULT_SCHEMA]['tables'][row[0]] = {'fingerprint': f"server:{identical_tables[row[0]]}"}
+                        continue
                     table_dict = self.get_table_schema(dbo, 'hive', catalog, row[0], queries)
-                    db_schema['schemas'][DEFAULT_SCHEMA]['tables'][row[0]] = table_dict
+                    db_schema['schemas'][DEFAULT_SCHEMA]['tables'][row[0]] = fingerprint_object(table_dict, 'tables', self.config)
 
 
             # Get views
             if self.config.get_property('compare', 'compare_views', 'true') == 'true':
                 db_schema['schemas'][DEFAULT_SCHEMA]['views']={}
-                if db_type == 'postgresql':
-                    view_list_cmd = f'select "TBL_ID" from "TBLS" where "TBL_TYPE" in (\'VIRTUAL_VIEW\',\'MATERIALIZED_VIEW\') and "DB_ID"=(select "DB_ID" from "DBS" where "NAME"=\'{catalog}\') order by "TBL_ID"'
-                elif db_type == 'mysql':
-                    view_list_cmd = f'select TBL_ID from TBLS where TBL_TYPE in (\'VIRTUAL_VIEW\',\'MATERIALIZED_VIEW\') and DB_ID=(select DB_ID from DBS where NAME=\'{catalog}\') order by TBL_ID'
-
-                rows, _ = dbo.query(view_list_cmd)
-                for row in rows:
-                    if db_type == 'postgresql':
-                        formatted_query=f'select "TBL_TYPE", "VIEW_EXPANDED_TEXT", "TBL_NAME" from "TBLS" where "DB_ID"=(select "DB_ID" from "DBS" where "NAME"=\'{catalog}\') and "TBL_ID"={row[0]}'
-                    elif db_type == 'mysql':
-                        formatted_query=f'select TBL_TYPE, VIEW_EXPANDED_TEXT, TBL_NAME from TBLS where DB_ID=(select DB_ID from DBS where NAME=\'{catalog}\') and TBL_ID={row[0]}'
-                    results, _ = dbo.query(formatted_query)
-                    if len(results) > 0:
-                        view_text = results[0][1]
-                        logger.debug(f"View DDL {results[0]}, {view_text}")
-                        db_schema['schemas'][DEFAULT_SCHEMA]['views'][results[0][2]] = {}
-                        db_schema['schemas'][DEFAULT_SCHEMA]['views'][results[0][2]]['definition'] = view_text
-                        if results[0][0] == 'VIRTUAL_VIEW':
-                            db_schema['schemas'][DEFAULT_SCHEMA]['views'][results[0][2]]['type']='VIRTUAL_VIEW'
-                        if results[0][0] == 'MATERIALIZED_VIEW':
-                            db_schema['schemas'][DEFAULT_SCHEMA]['views'][results[0][2]]['type']='MATERIALIZED_VIEW'
+                view_cmd = self.catalog_queries['view_definitions']
+                rows, _ = dbo.query(view_cmd, view_cmd.params(catalog=catalog))
+                if rows is None:
+                    raise ExtractionError(f"view_definitions failed for {catalog}")
+                # dependency order, so that CREATE VIEW statements generated from the diff replay in one pass
+                for view_name, view_type, view_text in order_views([(row[3], row[1], row[2]) for row in rows], catalog):
+                    logger.debug(f"View DDL {view_name}, {view_text}")
+                    db_schema['schemas'][DEFAULT_SCHEMA]['views'][view_name] = {}
+                    db_schema['schemas'][DEFAULT_SCHEMA]['views'][view_name]['definition'] = view_text
+                    if view_type == 'VIRTUAL_VIEW':
+                        db_schema['schemas'][DEFAULT_SCHEMA]['views'][view_name]['type']='VIRTUAL_VIEW'
+                    if view_type == 'MATERIALIZED_VIEW':
+                        db_schema['schemas'][DEFAULT_SCHEMA]['views'][view_name]['type']='MATERIALIZED_VIEW'
 
             # Get functions DDL and add to the end of the results file
             if self.config.get_property('compare', 'compare_functions', 'true') == 'true':
-                if db_type == 'postgresql':
-                    func_list_cmd = f'select "CLASS_NAME", "FUNC_NAME","FUNC_TYPE", "OWNER_NAME" from "FUNCS" where "DB_ID"=(select "DB_ID" from "DBS" where "NAME"=\'{catalog}\') order by "FUNC_ID"'
-                elif db_type == 'mysql':
-                    func_list_cmd = f'select CLASS_NAME, FUNC_NAME,FUNC_TYPE, OWNER_NAME from FUNCS where DB_ID=(select DB_ID from DBS where NAME=\'{catalog}\') order by FUNC_ID'
-                
-                rows, cols = dbo.query(func_list_cmd)
+                db_schema['schemas'][DEFAULT_SCHEMA]['functions']={}
+                func_list_cmd = self.catalog_queries['function_list']
+                rows, cols = dbo.query(func_list_cmd, func_list_cmd.params(catalog=catalog))
+                if rows is None:
+                    raise ExtractionError(f"function_list failed for {catalog}")
                 for row in rows:
                     db_schema['schemas'][DEFAULT_SCHEMA]['functions'][row[1]] = {}
                     db_schema['schemas'][DEFAULT_SCHEMA]['functions'][row[1]]['class'] = row[0]
                     db_schema['schemas'][DEFAULT_SCHEMA]['functions'][row[1]]['type'] = row[2]
                     db_schema['schemas'][DEFAULT_SCHEMA]['functions'][row[1]]['owner'] = row[3]
+            add_fingerprints(db_schema, self.config)
+        except ExtractionError as e:
+            # a half extracted schema would turn the missing objects into DROP statements
+            logger.error(f"Extraction of {catalog} failed, it is not compared: {e}")
+            raise
         except Exception as e:
             logger.error(f"An error occurred in get_database_schema: {e}")
             traceback.print_exc()
+            raise ExtractionError(f"Extraction of {catalog} failed: {e}") from e
         return db_schema
 
 
@@ -110,12 +213,17 @@ class DatabaseCompare:
             table_comment=""
             sorted_by_string=""
             alter_statement_string=""
-            for query_name, query_template in table_ddl_queries.items():
-                formatted_query = query_template.format(database=database, catalog=catalog,
+            for query_name, query in table_ddl_queries.items():
+                if query_name == 'Q18':
+                    # partitions are compared for the whole catalog by compare_partitions
+                    continue
+                params = query.params(database=database, catalog=catalog,
                     table=table, table_id=table_id, serde_id=serde_id, sd_id=sd_id, cd_id=cd_id,
-                    db_location_uri=db_location_uri, db_managed_uri=db_managed_uri)
-                logger.debug(f"Executing query {query_name} : {formatted_query}")
-                rows, cols = dbo.query(formatted_query)
+                    db_location_uri=f"{db_location_uri}", db_managed_uri=f"{db_managed_uri}")
+                logger.debug(f"Executing query {query_name} : {query} {params}")
+                rows, cols = dbo.query(query, params)
+                if rows is None:
+                    raise ExtractionError(f"{query_name} failed for table {catalog}.{table}")
                 logger.debug(f"Rows: {len(rows)}, cols: {len(cols)}")
                 results = [dict(zip(cols, row)) for row in rows]
                 logger.debug(f"Results for {query_name} : {results}")
@@ -232,15 +340,9 @@ class DatabaseCompare:
                         if bucket_cols is not None:
                             table_dict['clustered_by'] = bucket_cols
 
-                if query_name == 'Q18':
-                    for entry in results:
-                        part_key=entry['PART_NAME']
-                        key, value = part_key.split('=')
-                        table_dict['custom_partitions'] = {}
-                        table_dict['custom_partitions'][key] = {}
-                        table_dict['custom_partitions'][key]['value'] = value
-                        table_dict['custom_partitions'][key]['value'] = entry['LOCATION']
-
             return table_dict
+        except ExtractionError:
+            raise
         except Exception as e:
             traceback.print_exc()
+            raise ExtractionError(f"Schema extraction failed for table {catalog}.{table}: {e}") from e
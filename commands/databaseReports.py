@@ -1,75 +1,188 @@
 import os
 import sys
 import logging
+import itertools
+import contextlib
 import traceback
 
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, parent_dir)
 from reportWriter import ReportWriter
+from queryRunner import QueryRunner
+from databaseInterface import QueryTimeout
+from columnarWriter import COLUMNAR_FORMATS, ColumnarWriter, query_file_name
 
 logger = logging.getLogger(__name__)
 
+def _streamed_rows(batches):
+    """(cols, rows) of a stream of (rows, cols) batches, cols is None for an empty result."""
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        return None, iter(())
+    rows, cols = first
+    return cols, itertools.chain(rows, (row for rows, _ in batches for row in rows))
+
+
+def _export_batches(batches, writer):
+    """Pass a stream of (rows, cols) batches through, writing every batch to a ColumnarWriter."""
+    for rows, cols in batches:
+        writer.write_batch(rows, cols)
+        yield rows, cols
+
+
 class DatabaseReports:
-    def __init__(self):
+    def __init__(self, runner=None, streamed_queries=(), batch_size=10000):
         self.logger = logger
+        self.runner = runner or QueryRunner()
+        self.streamed_queries = set(streamed_queries)
+        self.batch_size = batch_size
 
     def gather_database_info(self, dbo, database, catalog, queries, results_dir):
+        """Run the report queries of catalog. Returns {query name: result} in query file order.
+
+        Queries run concurrently on the QueryRunner and are fetched, except the streamed
+        queries (all of them with a single query worker): their result only holds a lazy
+        server side cursor stream, which create_database_reports writes batch by batch.
+        """
         logger.info(f"Gather database database: {catalog}")
         results = {}
+        streamed = set(queries) if self.runner.workers == 1 else self.streamed_queries & set(queries)
         try:
-            for query_name, query_template in queries.items():
-                formatted_query = query_template.format(database=database, catalog=catalog)
-                logger.debug(f"Executing query {query_name} : {formatted_query}")
-                rows, cols = dbo.query(formatted_query)
+            fetched = self.runner.run(dbo, {name: query for name, query in queries.items() if name not in streamed},
+                                      database=database, catalog=catalog)
+            for query_name, query in queries.items():
+                if query_name in streamed:
+                    # iter_query is a generator, the query runs when the report is written
+                    batches = dbo.iter_query(query, query.params(database=database, catalog=catalog), self.batch_size,
+                                             timeout=self.runner.timeout or None)
+                    results[query_name] = {'batches': batches, 'status': 'ok'}
+                    continue
+                rows, cols, status = fetched[query_name]
+                if status == 'timeout':
+                    # the section stays in the report, marked instead of empty
+                    cols = ['status']
+                    rows = [(f"TIMEOUT: cancelled after {self.runner.timeout}s",)]
                 results[query_name]={}
                 results[query_name]['rows']=rows
                 results[query_name]['cols']=cols
+                results[query_name]['status']=status
         except Exception as e:
             traceback.print_exc()
             logger.error(f"An error occurred in gather_database_info: {e}")
             return None
         return results
 
+    def export_columnar(self, dbo, database, catalog, queries, results_dir, filebase, formats, batch_size=50000):
+        """Write every query result as parquet, arrow and/or csv.gz files <filebase>_<query>.<format>.
+
+        The rows are streamed from a server side cursor in batches of batch_size. This is for
+        reports with only columnar formats, with md or html create_database_reports writes the
+        columnar files from the same cursor pass. Queries that fail or time out get no file.
+        Returns the names of those queries.
+        """
+        logger.info(f"Export reports of {catalog} as {', '.join(formats)}")
+        failed = []
+        for query_name, query in queries.items():
+            writer = ColumnarWriter(os.path.join(results_dir, query_file_name(filebase, query_name)), formats)
+            try:
+                for rows, cols in dbo.iter_query(query, query.params(database=database, catalog=catalog), batch_size,
+                                                 timeout=self.runner.timeout or None):
+                    writer.write_batch(rows, cols)
+            except Exception as e:
+                traceback.print_exc()
+                logger.error(f"Export of {query_name} failed: {e}")
+                writer.abort()
+                failed.append(query_name)
+                continue
+            if not self._close_columnar(writer, query_name):
+                failed.append(query_name)
+        return failed
+
+    def _close_columnar(self, writer, query_name):
+        """Finish the columnar files of a query. Returns False when they could not be written."""
+        try:
+            paths = writer.close()
+        except Exception as e:
+            traceback.print_exc()
+            logger.error(f"Export of {query_name} failed: {e}")
+            writer.abort()
+            return False
+        if paths:
+            logger.info(f"{writer.rows} rows of {query_name} saved to {', '.join(paths)}")
+        else:
+            logger.info(f"Query {query_name} returned no rows, not exported")
+        return True
+
+    def _failure(self, error):
+        """Text of the row that marks a streamed query that failed."""
+        if isinstance(error, QueryTimeout):
+            return f"TIMEOUT: cancelled after {self.runner.timeout}s"
+        return f"FAILED: {error}"
+
+    def _write_streamed(self, rw, handles, query_name, batches):
+        """Write a streamed result. A query that fails in any batch is re-raised after its section is closed."""
+        try:
+            cols, rows = _streamed_rows(batches)
+        except Exception as e:
+            status = 'TIMEOUT' if isinstance(e, QueryTimeout) else 'FAILED'
+            rw.write_tables(handles, f"{query_name} ({status})", ['status'], [(self._failure(e),)])
+            raise
+        rw.write_tables(handles, query_name, cols, rows, failed=self._failure)
+
     def create_database_reports(self, results, results_dir, filebase, report_formats):
-        md_tables = []
-        html_tables = []
-        rw = ReportWriter()
-        for query_name, value in results.items():
-            rows=value['rows']
-            cols=value['cols']
-
-            # md results
-            if 'md' in report_formats:
-                temp={}
-                temp[query_name] = rw.tuples_to_markdown_table(query_name, cols, rows)
-                md_tables.append(temp)
-
-            # html results
-            if 'html' in report_formats:
-                temp={}
-                temp[query_name] = rw.tuples_to_html_table(query_name, cols, rows)
-                html_tables.append(temp)
+        """Write the results of gather_database_info to the report file of every format in one pass.
 
+        Each table is streamed to all open files at once, the columnar formats included: every
+        batch read from a cursor also goes to the ColumnarWriter of the query, so a streamed query
+        runs once for all formats. Fetched results are released as soon as they are written.
+        Returns the names of the queries that failed or timed out, their sections are marked in the
+        reports. Errors writing the report files are raised.
+        """
+        rw = ReportWriter()
+        failed = []
+        columnar_formats = [report_format for report_format in report_formats if report_format in COLUMNAR_FORMATS]
+        paths = {}
+        if 'md' in report_formats:
+            paths['md'] = os.path.join(results_dir, f"{filebase}.md")
+        if 'html' in report_formats:
+            paths['html'] = os.path.join(results_dir, f"{filebase}.html")
         try:
-            if 'md' in report_formats:
-                md_results_file = os.path.join(results_dir, f"{filebase}.md")
-                with open(md_results_file, 'w') as rfd:
-                    for table in md_tables:
-                        for k,v in table.items():
-                            rfd.write(v)
-                logger.info(f"Report saved to {md_results_file}")
-
-            if 'html' in report_formats:
-                html_results_file = os.path.join(results_dir, f"{filebase}.html")
-                title="Database reports"
-                with open(html_results_file, 'w') as hfd:
-                    rw.write_section1(hfd, title)
-                    for table in html_tables:
-                        for k,v in table.items():
-                            hfd.write(v)
-                    rw.write_section2(hfd)
-                logger.info(f"Report saved to {html_results_file}")
+            with contextlib.ExitStack() as stack:
+                handles = {report_format: stack.enter_context(open(path, 'w')) for report_format, path in paths.items()}
+                if 'html' in handles:
+                    rw.write_section1(handles['html'], "Database reports")
+                for query_name in list(results):
+                    value = results.pop(query_name)
+                    title = f"{query_name} (TIMEOUT)" if value.get('status') == 'timeout' else query_name
+                    if value.get('status') != 'ok':
+                        failed.append(query_name)
+                    columnar = None
+                    if columnar_formats and value.get('status') == 'ok':
+                        columnar = ColumnarWriter(os.path.join(results_dir, query_file_name(filebase, query_name)), columnar_formats)
+                    if 'batches' in value:
+                        batches = value['batches'] if columnar is None else _export_batches(value['batches'], columnar)
+                        try:
+                            self._write_streamed(rw, handles, query_name, batches)
+                        except Exception as e:
+                            # the section is closed with a TIMEOUT or FAILED row, go on with the next query
+                            logger.error(f"Query {query_name} failed: {e}")
+                            failed.append(query_name)
+                            if columnar is not None:
+                                columnar.abort()
+                                columnar = None
+                    else:
+                        rw.write_tables(handles, title, value['cols'], value['rows'])
+                        if columnar is not None and value['rows']:
+                            columnar.write_batch(value['rows'], value['cols'])
+                    if columnar is not None and not self._close_columnar(columnar, query_name):
+                        failed.append(query_name)
+                if 'html' in handles:
+                    rw.write_section2(handles['html'])
+            for path in paths.values():
+                logger.info(f"Report saved to {path}")
 
         except Exception as e:
-            traceback.print_exc()
             logger.error(f"error writing to report files in create_database_reports: {e}")
+            raise
+        return failed
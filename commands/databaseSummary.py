@@ -3,30 +3,27 @@ import sys
 import logging
 import traceback
 
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+from queryRunner import QueryRunner
+
 logger = logging.getLogger(__name__)
 
 class DatabaseSummary:
-    def __init__(self):
+    def __init__(self, runner=None):
         self.logger = logger
+        self.runner = runner or QueryRunner()
 
     def get_summary(self, dbo, db_type, hms_db, catalog, queries, **kwargs):
         summary={}
         logger.info(f"Get summary for database: {catalog}")
         try:
             table=kwargs.get('table', 'ALL')
-            table_filter=""
-            if table != 'ALL':
-                if db_type == 'postgresql':
-                    table_filter=f"\"TBL_NAME\"='{table}' and"
-                elif db_type == 'mysql':
-                    table_filter=f"TBL_NAME='{table}' and"
-                else:
-                    table_filter=f"\"TBL_NAME\"='{table}' and"
-            for query_name, query_template in queries.items():
-                formatted_query = query_template.format(database='hive', catalog=catalog, past_days=kwargs.get('past_days', 1), table=table, table_filter=table_filter)
-                logger.debug(f"Executing query {query_name} : {formatted_query}")
-                rows, cols = dbo.query(formatted_query)
-                if not rows or not cols:
+            results = self.runner.run(dbo, queries, database='hive', catalog=catalog, past_days=kwargs.get('past_days', 1), table=table)
+            for query_name, (rows, cols, status) in results.items():
+                if status == 'timeout':
+                    summary[query_name] = f"TIMEOUT after {self.runner.timeout}s"
+                elif not rows or not cols:
                     logger.error(f"Failed to run query. Ignoring")
                 else:
                     results = [dict(zip(cols, row)) for row in rows]
@@ -38,3 +35,35 @@ class DatabaseSummary:
             traceback.print_exc()
             return None
         return summary
+
+    def get_all_summaries(self, dbo, queries, catalogs, **kwargs):
+        """Summaries of many catalogs with one query per metric.
+
+        The queries of summary_all.queries group by catalog and return (catalog, key, value)
+        rows. A NULL catalog applies to every catalog (like the hive version).
+        Returns {catalog: summary} with the same keys as get_summary.
+        """
+        summaries = {catalog: {} for catalog in catalogs}
+        logger.info(f"Get summary for {len(summaries)} databases")
+        try:
+            results = self.runner.run(dbo, queries, database='hive', past_days=kwargs.get('past_days', 1))
+            for query_name, (rows, cols, status) in results.items():
+                if status == 'timeout':
+                    for summary in summaries.values():
+                        summary[query_name] = f"TIMEOUT after {self.runner.timeout}s"
+                    continue
+                if not rows or not cols:
+                    logger.error(f"Failed to run query {query_name}. Ignoring")
+                    continue
+                for row in rows:
+                    entry = dict(zip(cols, row))
+                    if entry['catalog'] is None:
+                        for summary in summaries.values():
+                            summary[entry['key']] = entry['value']
+                    elif entry['catalog'] in summaries:
+                        summaries[entry['catalog']][entry['key']] = entry['value']
+        except Exception as e:
+            print("Error in get_all_summaries:", e)
+            traceback.print_exc()
+            return None
+        return summaries
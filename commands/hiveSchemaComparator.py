@@ -1,10 +1,23 @@
 import os
+import sys
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+from schemaFingerprint import compared_keys, object_fingerprint
+from diffReportWriter import DiffReportWriter
+from columnDiff import diff_columns
+from reconciliationPlanner import ReconciliationPlan
 
 class HiveSchemaComparator:
 
     def __init__(self, config):
         self.config = config 
-        self.sql_statements = []
+        self.plan = ReconciliationPlan()
+
+    @property
+    def sql_statements(self):
+        # grouped per table and in replay order
+        return self.plan.statements()
 
     def compare_schemas(self, schema1, schema2):
         differences = {}
@@ -18,12 +31,60 @@ class HiveSchemaComparator:
                 differences['schemas'] = schema_diff
 
         for schema_name in schema1_names.intersection(schema2_names):
-            schema_diff = self._compare_schema_objects(schema1['schemas'][schema_name], schema2['schemas'][schema_name], schema_name)
+            # identical catalogs have the same fingerprint over all their objects
+            fingerprint = schema1['schemas'][schema_name].get('fingerprint')
+            if fingerprint and fingerprint == schema2['schemas'][schema_name].get('fingerprint'):
+                continue
+            # statements apply to the catalog of schema1, when the schema knows it
+            qualifier = schema1.get('catalog') if schema_name == 'default' and schema1.get('catalog') else schema_name
+            schema_diff = self._compare_schema_objects(schema1['schemas'][schema_name], schema2['schemas'][schema_name], qualifier)
             if schema_diff:
                 differences[schema_name] = schema_diff
 
         return differences
 
+    def compare_fleet(self, golden, targets):
+        """Compare every target schema to one golden schema.
+
+        targets is {label: db_schema}. Every pairwise compare reuses the same extracted golden
+        schema. Returns ({label: differences}, {label: ReconciliationPlan}). The differences
+        are from golden to the target, each plan brings its target back to golden and is meant
+        to be replayed on the target.
+        """
+        differences = {}
+        plans = {}
+        for label, target in targets.items():
+            differences[label] = HiveSchemaComparator(self.config).compare_schemas(golden, target)
+            if differences[label]:
+                comparator = HiveSchemaComparator(self.config)
+                comparator.compare_schemas(target, golden)
+                plans[label] = comparator.plan
+            else:
+                plans[label] = ReconciliationPlan()
+        return differences, plans
+
+    @staticmethod
+    def drift_matrix(fleet_differences):
+        """Turn the differences of compare_fleet into {schema: {object_type: {object: {label: drift}}}}.
+
+        drift is 'missing' (in the golden schema only), 'extra' (in the target only) or
+        'modified: <attributes>'. Objects without drift on any target are left out.
+        """
+        matrix = {}
+        for label, differences in fleet_differences.items():
+            for schema_name, schema_diff in differences.items():
+                if schema_name == 'schemas' or not isinstance(schema_diff, dict):
+                    continue
+                for object_type, object_diff in schema_diff.items():
+                    objects = matrix.setdefault(schema_name, {}).setdefault(object_type, {})
+                    for name in object_diff.get('dropped_objects', []):
+                        objects.setdefault(name, {})[label] = 'missing'
+                    for name in object_diff.get('added_objects', []):
+                        objects.setdefault(name, {})[label] = 'extra'
+                    for name, attributes in object_diff.get('modified_objects', {}).items():
+                        objects.setdefault(name, {})[label] = f"modified: {', '.join(attributes)}"
+        return matrix
+
     def _compare_schema_objects(self, schema1, schema2, schema_name):
         differences = {}
 
@@ -38,7 +99,8 @@ class HiveSchemaComparator:
                 differences['views'] = views_diff
 
         if self.config.get_property('compare', 'compare_udfs', True):
-            udfs_diff = self._compare_objects(schema1.get('udfs', {}), schema2.get('udfs', {}), 'udfs', schema_name)
+            # extracted schemas keep functions under 'functions'
+            udfs_diff = self._compare_objects(schema1.get('functions', schema1.get('udfs', {})), schema2.get('functions', schema2.get('udfs', {})), 'udfs', schema_name)
             if udfs_diff:
                 differences['udfs'] = udfs_diff
 
@@ -55,28 +117,32 @@ class HiveSchemaComparator:
         obj2_names = set(obj2.keys())
 
         # Handle objects present in schema2 but not in schema1 (add new objects)
-        for obj_name in obj2_names - obj1_names:
+        for obj_name in sorted(obj2_names - obj1_names):
+            obj = obj2[obj_name]
             if object_type == 'tables':
                 differences['added_objects'].append(obj_name)
-                self.sql_statements.append(self._generate_create_table(obj_name, obj2[obj_name], schema_name))
+                if obj is None:
+                    self.plan.manual_step("table could not be extracted", f"CREATE TABLE {schema_name}.{obj_name}")
+                else:
+                    self.plan.create_table(self._generate_create_table(obj_name, obj, schema_name))
             elif object_type == 'views':
                 differences['added_objects'].append(obj_name)
-                self.sql_statements.append(self._generate_create_view(obj_name, obj2[obj_name], schema_name))
+                self.plan.create_view(schema_name, obj_name, obj.get('definition'))
             elif object_type == 'udfs':
                 differences['added_objects'].append(obj_name)
-                self.sql_statements.append(self._generate_create_udf(obj_name, obj2[obj_name], schema_name))
+                self.plan.create_function(self._generate_create_udf(obj_name, obj, schema_name))
 
         # Handle objects present in schema1 but not in schema2 (drop old objects)
-        for obj_name in obj1_names - obj2_names:
+        for obj_name in sorted(obj1_names - obj2_names):
             if object_type == 'tables':
                 differences['dropped_objects'].append(obj_name)
-                self.sql_statements.append(f"DROP TABLE {schema_name}.{obj_name};")
+                self.plan.drop_table(schema_name, obj_name)
             elif object_type == 'views':
                 differences['dropped_objects'].append(obj_name)
-                self.sql_statements.append(f"DROP VIEW {schema_name}.{obj_name};")
+                self.plan.drop_view(schema_name, obj_name, (obj1[obj_name] or {}).get('definition'))
             elif object_type == 'udfs':
                 differences['dropped_objects'].append(obj_name)
-                self.sql_statements.append(f"DROP FUNCTION {schema_name}.{obj_name};")
+                self.plan.drop_function(schema_name, obj_name)
 
         # Compare object names (only if object names differ, indicating added or dropped objects)
         obj_diff = self._compare_sets(obj1_names, obj2_names, object_type)
@@ -84,7 +150,11 @@ class HiveSchemaComparator:
             differences['name_differences'] = obj_diff
 
         # Compare objects present in both schemas (check for attribute differences)
-        for obj_name in obj1_names.intersection(obj2_names):
+        # Only objects with different fingerprints can have attribute differences
+        # in name order, so that spilled tables are read one at a time in key order
+        for obj_name in sorted(obj1_names.intersection(obj2_names)):
+            if self._object_fingerprint(obj1, obj_name, object_type) == self._object_fingerprint(obj2, obj_name, object_type):
+                continue
             attributes_diff = self._compare_attributes(obj1[obj_name], obj2[obj_name], obj_name, object_type, schema_name)
             if attributes_diff:
                 differences['modified_objects'][obj_name] = attributes_diff
@@ -96,6 +166,23 @@ class HiveSchemaComparator:
             return None
 
 
+    def _object_fingerprint(self, objects, obj_name, object_type):
+        # snapshot objects know their fingerprints without being parsed
+        if hasattr(objects, 'fingerprint'):
+            return objects.fingerprint(obj_name)
+        return self._fingerprint(objects[obj_name], object_type)
+
+
+    def _fingerprint(self, obj, object_type):
+        if obj is None:
+            # the object failed to extract
+            return None
+        if 'fingerprint' in obj:
+            return obj['fingerprint']
+        keys = compared_keys(self.config, object_type)
+        return object_fingerprint(obj, keys if keys else sorted(obj))
+
+
     def _compare_attributes(self, obj1, obj2, obj_name, object_type, schema_name):
         differences = {}
 
@@ -104,22 +191,19 @@ class HiveSchemaComparator:
             # Compare columns if the option is enabled
             if self.config.get_property('compare', 'compare_columns', True):
                 if 'columns' in obj1 and 'columns' in obj2:
-                    column_diff = self._compare_columns(
-                        obj1['columns'], obj2['columns'],
-                        obj1.get('data_types', []), obj2.get('data_types', []),
-                        obj_name, schema_name
-                    )
+                    column_diff = self._compare_columns(self._column_pairs(obj1), self._column_pairs(obj2), obj_name, schema_name)
                     if column_diff:
                         differences['columns'] = column_diff
 
             # Compare SERDE if the option is enabled
             if self.config.get_property('compare', 'compare_serdes', True):
-                if obj1.get('serdes') != obj2.get('serdes'):
-                    differences['serdes'] = {
-                        'schema1': obj1.get('serdes', []),
-                        'schema2': obj2.get('serdes', [])
+                if obj1.get('serde') != obj2.get('serde'):
+                    differences['serde'] = {
+                        'schema1': obj1.get('serde', ''),
+                        'schema2': obj2.get('serde', '')
                     }
-                    self.sql_statements.append(f"ALTER TABLE {schema_name}.{obj_name} SET SERDE '{obj2['serdes'][0]}';")
+                    if obj2.get('serde'):
+                        self.plan.alter_table(schema_name, obj_name, f"SET SERDE '{obj2['serde']}'")
 
             # Compare location if the option is enabled
             if self.config.get_property('compare', 'compare_location', True):
@@ -128,7 +212,10 @@ class HiveSchemaComparator:
                         'schema1': obj1.get('location', ''),
                         'schema2': obj2.get('location', '')
                     }
-                    self.sql_statements.append(f"ALTER TABLE {schema_name}.{obj_name} SET LOCATION '{obj2['location']}';")
+                    if obj2.get('location'):
+                        self.plan.alter_table(schema_name, obj_name, f"SET LOCATION '{obj2['location']}'")
+                    else:
+                        self.plan.manual_step("table moved to the database location", f"ALTER TABLE {schema_name}.{obj_name} SET LOCATION")
 
             # Compare primary key if the option is enabled
             if self.config.get_property('compare', 'compare_primary_key', True):
@@ -137,63 +224,77 @@ class HiveSchemaComparator:
                         'schema1': obj1.get('primary_key', []),
                         'schema2': obj2.get('primary_key', [])
                     }
-                    self.sql_statements.append(f"ALTER TABLE {schema_name}.{obj_name} DROP PRIMARY KEY;")
-                    self.sql_statements.append(f"ALTER TABLE {schema_name}.{obj_name} ADD PRIMARY KEY ({', '.join(obj2['primary_key'])});")
+                    if obj1.get('primary_key'):
+                        self.plan.alter_table(schema_name, obj_name, "DROP PRIMARY KEY")
+                    if obj2.get('primary_key'):
+                        self.plan.alter_table(schema_name, obj_name, f"ADD PRIMARY KEY ({', '.join(obj2['primary_key'])}) DISABLE NOVALIDATE")
 
             # Compare bucket information if the option is enabled
             if self.config.get_property('compare', 'compare_bucket', True):
-                if obj1.get('bucket') != obj2.get('bucket'):
+                if obj1.get('bucket') != obj2.get('bucket') or obj1.get('clustered_by') != obj2.get('clustered_by'):
                     differences['bucket'] = {
                         'schema1': obj1.get('bucket', {}),
                         'schema2': obj2.get('bucket', {})
                     }
-                    self.sql_statements.append(f"ALTER TABLE {schema_name}.{obj_name} CLUSTERED BY ({', '.join(obj2['bucket']['bucket_columns'])}) INTO {obj2['bucket']['num_buckets']} BUCKETS;")
+                    self.plan.alter_table(schema_name, obj_name, self._bucket_clause(obj2) or "NOT CLUSTERED")
 
         # Handle changes in views
         if object_type == 'views':
-            # Compare view query if the option is enabled
-            if obj1.get('query') != obj2.get('query'):
-                differences['query'] = {
-                    'schema1': obj1.get('query', ''),
-                    'schema2': obj2.get('query', '')
+            if obj1.get('definition') != obj2.get('definition'):
+                differences['definition'] = {
+                    'schema1': obj1.get('definition', ''),
+                    'schema2': obj2.get('definition', '')
                 }
-                self.sql_statements.append(f"CREATE OR REPLACE VIEW {schema_name}.{obj_name} AS {obj2['query']};")
+                self.plan.create_view(schema_name, obj_name, obj2.get('definition'))
+
+        # Handle changes in functions
+        if object_type == 'udfs':
+            if obj1.get('class') != obj2.get('class'):
+                differences['class'] = {
+                    'schema1': obj1.get('class', ''),
+                    'schema2': obj2.get('class', '')
+                }
+                self.plan.drop_function(schema_name, obj_name)
+                self.plan.create_function(self._generate_create_udf(obj_name, obj2, schema_name))
 
         return differences
 
 
-    def _compare_columns(self, cols1, cols2, types1, types2, table_name, schema_name):
-        differences = {
-            'new_columns': [],
-            'dropped_columns': []
-        }
+    def _column_pairs(self, table_obj):
+        # column_list and data_types are in column order, columns is keyed by name
+        if 'column_list' in table_obj and 'data_types' in table_obj:
+            return list(zip(table_obj['column_list'], table_obj['data_types']))
+        return [(name, column.get('type')) for name, column in table_obj['columns'].items()]
 
-        # Add missing columns (present in cols2 but not in cols1)
-        for i, col in enumerate(cols2):
-            if col not in cols1:
-                new_column = {
-                    'column': col,
-                    'data_type': types2[i]
-                }
-                differences['new_columns'].append(new_column)
-                self.sql_statements.append(f"ALTER TABLE {schema_name}.{table_name} ADD COLUMNS ({col} {types2[i]});")
-
-        # Drop old columns (present in cols1 but not in cols2)
-        for i, col in enumerate(cols1):
-            if col not in cols2:
-                dropped_column = {
-                    'column': col,
-                    'data_type': types1[i]
-                }
-                differences['dropped_columns'].append(dropped_column)
-                self.sql_statements.append(f"ALTER TABLE {schema_name}.{table_name} DROP COLUMN {col};")
 
-        # Only return differences if there are actual changes
-        if differences['new_columns'] or differences['dropped_columns']:
-            return differences
-        else:
+    def _compare_columns(self, cols1, cols2, table_name, schema_name):
+        differences = diff_columns(cols1, cols2)
+        if not differences:
             return None
 
+        for column in differences.get('type_changes', []):
+            if column['change'] != 'widening':
+                # existing data can not be read with the new type, the table needs a rewrite
+                self.plan.manual_step("incompatible type change, rewrite the data",
+                                      f"ALTER TABLE {schema_name}.{table_name} CHANGE COLUMN {column['column']} {column['column']} {column['to']}")
+
+        if differences.get('dropped_columns'):
+            # Hive drops columns by replacing the column list, which also applies every other column change
+            self.plan.replace_columns(schema_name, table_name, cols2)
+            return differences
+
+        self.plan.add_columns(schema_name, table_name, [(column['column'], column['data_type']) for column in differences.get('new_columns', [])])
+        for column in differences.get('renamed_columns', []):
+            self.plan.change_column(schema_name, table_name, f"CHANGE COLUMN {column['from']} {column['to']} {column['data_type']}")
+        for column in differences.get('type_changes', []):
+            if column['change'] == 'widening':
+                self.plan.change_column(schema_name, table_name, f"CHANGE COLUMN {column['column']} {column['column']} {column['to']}")
+        types2 = dict(cols2)
+        for column in differences.get('moved_columns', []):
+            position = f"AFTER {column['after']}" if column['after'] else "FIRST"
+            self.plan.change_column(schema_name, table_name, f"CHANGE COLUMN {column['column']} {column['column']} {types2[column['column']]} {position}")
+        return differences
+
 
     def _compare_sets(self, set1, set2, name):
         differences = {}
@@ -208,31 +309,31 @@ class HiveSchemaComparator:
         return differences if differences else None
 
     # SQL Generation Helpers
-    def _generate_create_table(self, table_name, table_obj, schema_name):
-        columns = ', '.join([f"{col} {dtype}" for col, dtype in zip(table_obj['column_list'], table_obj['data_types'])])
-        if 'primary_key' in table_obj:
-            primary_key = f"PRIMARY KEY ({', '.join(table_obj['primary_key'])})"
-        else:
-            primary_key = ''
-        if 'bucket' in table_obj:
-            bucket = f"CLUSTERED BY ({', '.join(table_obj['bucket']['bucket_columns'])}) INTO {table_obj['bucket']['num_buckets']} BUCKETS"
-        else:
-            bucket = ''
-        if 'location' in table_obj:
-            location = f"LOCATION '{table_obj['location']}'"
-        else:
-            location = ''
-        if 'serdes' in table_obj:
-            serdes = f"SERDE '{table_obj['serdes'][0]}'"
-        else:
-            serdes = ''
-        return f"CREATE TABLE {schema_name}.{table_name} ({columns}, {primary_key}) {bucket} {serdes} {location};"
+    def _bucket_clause(self, table_obj):
+        if table_obj.get('bucket') and table_obj.get('clustered_by'):
+            return f"CLUSTERED BY ({table_obj['clustered_by']}) INTO {table_obj['bucket']['num_buckets']} BUCKETS"
+        return ''
 
-    def _generate_create_view(self, view_name, view_obj, schema_name):
-        return f"CREATE VIEW {schema_name}.{view_name} AS {view_obj['definition']};"
+    def _generate_create_table(self, table_name, table_obj, schema_name):
+        columns = ', '.join(f"{col} {dtype}" for col, dtype in self._column_pairs(table_obj)) if 'columns' in table_obj else ''
+        external = 'EXTERNAL ' if table_obj.get('type') == 'EXTERNAL_TABLE' else ''
+        clauses = [f"CREATE {external}TABLE {schema_name}.{table_name} ({columns})"]
+        if table_obj.get('primary_key'):
+            clauses[0] = clauses[0][:-1] + f", PRIMARY KEY ({', '.join(table_obj['primary_key'])}) DISABLE NOVALIDATE)"
+        if table_obj.get('partitioned_by'):
+            clauses.append(f"PARTITIONED BY ({', '.join(table_obj['partitioned_by'])})")
+        if self._bucket_clause(table_obj):
+            clauses.append(self._bucket_clause(table_obj))
+        if table_obj.get('serde'):
+            clauses.append(f"ROW FORMAT SERDE '{table_obj['serde']}'")
+        if table_obj.get('input_format') and table_obj.get('output_format'):
+            clauses.append(f"STORED AS INPUTFORMAT '{table_obj['input_format']}' OUTPUTFORMAT '{table_obj['output_format']}'")
+        if table_obj.get('location'):
+            clauses.append(f"LOCATION '{table_obj['location']}'")
+        return "\n".join(clauses) + ";"
 
     def _generate_create_udf(self, udf_name, udf_obj, schema_name):
-        return f"CREATE FUNCTION {schema_name}.{udf_name} AS '{udf_obj['return_type']}' RETURNS {udf_obj['arguments'][0]};"
+        return f"CREATE FUNCTION {schema_name}.{udf_name} AS '{udf_obj['class']}';"
 
 
     def print_diffs_detailed(self, diffs):
@@ -260,110 +361,8 @@ class HiveSchemaComparator:
 
 
     def generate_html_report(self, differences, results_dir="results", output_file="report.html"):
-        # Start the HTML structure
-        html_content = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Schema Differences Report</title>
-            <style>
-                body { font-family: Arial, sans-serif; margin: 20px; }
-                h1 { color: #2C3E50; }
-                h2 { color: #34495E; }
-                h3 { color: #5D6D7E; }
-                table { width: 100%; border-collapse: collapse; margin: 20px 0; }
-                th, td { border: 1px solid #ddd; padding: 8px; }
-                th { background-color: #f2f2f2; }
-                tr:nth-child(even) { background-color: #f9f9f9; }
-                .added { background-color: #d4edda; }
-                .dropped { background-color: #f8d7da; }
-                .modified { background-color: #fff3cd; }
-            </style>
-        </head>
-        <body>
-            <h1>Schema Differences Report</h1>
-        """
-
-        def create_table_row(attribute, schema1_value, schema2_value, css_class=""):
-            return f"""
-            <tr class="{css_class}">
-                <td>{attribute}</td>
-                <td>{schema1_value}</td>
-                <td>{schema2_value}</td>
-            </tr>
-            """
-
-        def process_attribute(attribute_name, attribute_diff):
-            """Helper function to handle differences in attributes."""
-            rows = ""
-            if isinstance(attribute_diff, dict):
-                schema1_val = attribute_diff.get('schema1', '')
-                schema2_val = attribute_diff.get('schema2', '')
-            elif isinstance(attribute_diff, tuple):
-                schema1_val, schema2_val = attribute_diff
-            else:
-                schema1_val = attribute_diff
-                schema2_val = ""
-
-            rows += create_table_row(attribute_name, schema1_val, schema2_val, "modified")
-            return rows
-
-        # Recursive function to process differences
-        def process_differences(differences, depth=0):
-            nonlocal html_content
-
-            indent = " " * (depth * 4)
-            if isinstance(differences, dict):
-                for key, value in differences.items():
-                    if key in ['added_objects', 'dropped_objects']:
-                        html_content += f"<h3>{key.replace('_', ' ').capitalize()}</h3>"
-                        html_content += "<ul>"
-                        for obj in value:
-                            html_content += f"<li>{obj}</li>"
-                        html_content += "</ul>"
-
-                    elif key == 'modified_objects':
-                        for obj_name, attributes in value.items():
-                            html_content += f"<h3>Modified Object: {obj_name}</h3>"
-                            html_content += "<table>"
-                            html_content += """
-                            <tr>
-                                <th>Attribute</th>
-                                <th>Schema 1 Value</th>
-                                <th>Schema 2 Value</th>
-                            </tr>
-                            """
-                            for attribute_name, attribute_diff in attributes.items():
-                                if isinstance(attribute_diff, dict):
-                                    for sub_attr, sub_diff in attribute_diff.items():
-                                        html_content += process_attribute(f"{attribute_name} ({sub_attr})", sub_diff)
-                                else:
-                                    html_content += process_attribute(attribute_name, attribute_diff)
-                            html_content += "</table>"
-
-                    elif key == 'name_differences':
-                        html_content += "<h3>Object Name Differences</h3>"
-                        for sub_key, sub_value in value.items():
-                            html_content += f"<h4>{sub_key.replace('_', ' ').capitalize()}</h4>"
-                            html_content += "<ul>"
-                            for obj in sub_value:
-                                html_content += f"<li>{obj}</li>"
-                            html_content += "</ul>"
-                    else:
-                        html_content += f"<h2>{key.capitalize()}</h2>"
-                        process_differences(value, depth + 1)
-
-        process_differences(differences)
-
-        # Close the HTML structure
-        html_content += """
-        </body>
-        </html>
-        """
-
-        # Write the HTML content to the file
-        html_results_file = os.path.join(results_dir, output_file)
-        with open(html_results_file, 'w') as file:
-            file.write(html_content)
+        # sections are streamed to the file, large sections continue on linked sub-pages
+        page_rows = int(self.config.get_property('compare', 'html_page_rows', '10000'))
+        html_results_file = DiffReportWriter(results_dir, output_file, page_rows).write(differences)
 
         print(f"HTML report generated: {os.path.abspath(html_results_file)}")
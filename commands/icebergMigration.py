@@ -2,15 +2,15 @@ import configparser
 import os
 import sys
 import logging
-import traceback
 
 logger = logging.getLogger(__name__)
 
 valid_formats=["org.apache.hadoop.hive.ql.io.orc.OrcSerde", "org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe", "org.apache.hadoop.hive.serde2.avro.AvroSerDe"]
 
 class IcebergMigration:
-    def __init__(self, version='2', approach='inplace', table_properties='', results_dir="results"):
+    def __init__(self, version='2', approach='inplace', table_properties='', results_dir="results", queries=None):
         self.logger = logger
+        self.queries = queries
         self.results_dir = results_dir
         self.version = version
         self.table_properties = table_properties
@@ -18,12 +18,11 @@ class IcebergMigration:
     def create_iceberg_migration_statements(self, dbo, db_type, catalog, filebase):
         try:
             logger.info(f"Running iceberg migration for database: {catalog}")
-            list_tables = f'SELECT a."TBL_ID", a."TBL_NAME", a."TBL_TYPE", b."IS_COMPRESSED", b."IS_STOREDASSUBDIRECTORIES", b."INPUT_FORMAT", b."OUTPUT_FORMAT",c."SLIB" FROM "TBLS" a inner join "SDS" b on a."SD_ID"=b."SD_ID" INNER JOIN "SERDES" c on b."SERDE_ID"=c."SERDE_ID" where a."DB_ID"=(select "DB_ID" from "DBS" where "NAME"=\'{catalog}\');'
-            rows, cols = dbo.query(list_tables)
+            list_tables = self.queries['iceberg_candidates']
             results_file=os.path.join(self.results_dir, f"{filebase}.sql")
             output_file=os.path.join(self.results_dir, f"{filebase}.log")
             with open(results_file, "w") as res, open(output_file, "w") as out:
-                for entry in rows:
+                for entry in (row for rows, _ in dbo.iter_query(list_tables, list_tables.params(catalog=catalog)) for row in rows):
                     props=[]
                     props.append(f"'storage_handler'='org.apache.iceberg.mr.hive.HiveIcebergStorageHandler'")
                     props.append(f"'format-version'='{self.version}'")
@@ -38,8 +37,8 @@ class IcebergMigration:
                     if not entry[7] in valid_formats:
                         out.write(f"Table : {entry[1]} is not eligible to convert to Iceberg\n")
                         continue
-                    table_props_query = f'select tp."PARAM_KEY", tp."PARAM_VALUE" from "TABLE_PARAMS" tp where tp."TBL_ID"={table_id}'
-                    prop_results,_ = dbo.query(table_props_query)
+                    table_props_query = self.queries['table_params']
+                    prop_results,_ = dbo.query(table_props_query, table_props_query.params(table_id=table_id))
                     handler=""
                     transactional=""
                     external_purge='false'
@@ -66,4 +65,4 @@ class IcebergMigration:
                 logger.info(f"saved logs to {output_file}")
         except Exception as e:
             print("Error in create_iceberg_migration_statements:", e)
-            traceback.print_exc()
+            raise
@@ -1,3 +1,11 @@
+from abc import ABC, abstractmethod
+
+
+class QueryTimeout(Exception):
+    """A query was cancelled by the server because it ran longer than its statement timeout."""
+    pass
+
+
 class DatabaseInterface(ABC):
     def __init__(self):
         self.connection = None
@@ -13,6 +21,12 @@ class DatabaseInterface(ABC):
         pass
 
     @abstractmethod
-    def query(self, sql_query: str, params: tuple = ()):
-        """Execute a query on the database."""
+    def query(self, sql_query: str, params: tuple = (), timeout: float = None):
+        """Execute a query on the database. With timeout (seconds) a slower query raises QueryTimeout."""
+        pass
+
+    @abstractmethod
+    def iter_query(self, sql_query: str, params: tuple = (), batch_size: int = 1000, timeout: float = None):
+        """Stream the results of a query as (rows, cols) batches of at most batch_size rows.
+        With timeout (seconds) a slower query raises QueryTimeout."""
         pass
@@ -0,0 +1,142 @@
+import os
+import html
+import json
+import logging
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+PAGE_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<title>{title}</title>
+<link rel="stylesheet" href="https://cdn.datatables.net/1.10.24/css/jquery.dataTables.min.css">
+<script src="https://code.jquery.com/jquery-3.5.1.min.js"></script>
+<script src="https://cdn.datatables.net/1.10.24/js/jquery.dataTables.min.js"></script>
+<style>
+body {{ font-family: Arial, sans-serif; margin: 20px; }}
+h1 {{ color: #2C3E50; }}
+h2 {{ color: #34495E; }}
+h3 {{ color: #5D6D7E; }}
+table thead th {{ background-color: #f2f2f2; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+"""
+PAGE_TAIL = "</body>\n</html>\n"
+
+
+def _text(value):
+    """Cell text of a diff value, html escaped because DataTables renders data as html."""
+    if value is None:
+        value = ''
+    elif not isinstance(value, str):
+        value = json.dumps(value, default=str)
+    return html.escape(value)
+
+
+class DiffReportWriter:
+    """Streams the differences of HiveSchemaComparator to an HTML report.
+
+    Sections are written to the file while the diff tree is walked, nothing is built up in
+    memory. Every section is a DataTables table fed from a JSON array, so the browser renders
+    only the visible rows. Sections with more than page_rows rows continue on linked sub-pages
+    <report>_<section>_<page>.html of page_rows rows each.
+    """
+
+    def __init__(self, results_dir, output_file, page_rows=10000):
+        self.logger = logger
+        self.results_dir = results_dir
+        self.output_file = output_file
+        self.page_rows = max(1, page_rows)
+        self.section_count = 0
+        self.fd = None
+
+    def write(self, differences, title="Schema Differences Report"):
+        path = os.path.join(self.results_dir, self.output_file)
+        self.fd = open(path, 'w', encoding='utf-8')
+        try:
+            self.fd.write(PAGE_HEAD.format(title=html.escape(title)))
+            if not differences:
+                self.fd.write("<p><strong>No differences</strong></p>\n")
+            self._walk(differences, 2)
+            self.fd.write(PAGE_TAIL)
+        finally:
+            self.fd.close()
+            self.fd = None
+        self.logger.info(f"HTML report with {self.section_count} sections written to {path}")
+        return path
+
+    def _walk(self, differences, depth):
+        if not isinstance(differences, dict):
+            return
+        for key, value in differences.items():
+            if key in ('added_objects', 'dropped_objects'):
+                self._section(key.replace('_', ' ').capitalize(), ['object'], ([name] for name in value), depth)
+            elif key == 'modified_objects':
+                self._section("Modified objects", ['object', 'attribute', 'schema 1 value', 'schema 2 value'],
+                              self._modified_rows(value), depth)
+            elif key == 'name_differences':
+                for sub_key, names in value.items():
+                    self._section(sub_key.replace('_', ' ').capitalize(), ['object'], ([name] for name in names), depth)
+            elif isinstance(value, dict):
+                self.fd.write(f"<h{min(depth, 6)}>{html.escape(str(key).capitalize())}</h{min(depth, 6)}>\n")
+                self._walk(value, depth + 1)
+            elif isinstance(value, list):
+                self._section(str(key).replace('_', ' ').capitalize(), ['object'], ([name] for name in value), depth)
+
+    def _modified_rows(self, modified_objects):
+        for obj_name, attributes in modified_objects.items():
+            for attribute, diff in attributes.items():
+                if isinstance(diff, dict) and ('schema1' in diff or 'schema2' in diff):
+                    yield [obj_name, attribute, diff.get('schema1', ''), diff.get('schema2', '')]
+                elif isinstance(diff, dict):
+                    for sub_attribute, sub_diff in diff.items():
+                        yield [obj_name, f"{attribute} ({sub_attribute})", *self._values(sub_diff)]
+                else:
+                    yield [obj_name, attribute, *self._values(diff)]
+
+    @staticmethod
+    def _values(diff):
+        if isinstance(diff, dict):
+            return [diff.get('schema1', ''), diff.get('schema2', '')]
+        if isinstance(diff, tuple):
+            return list(diff)
+        return [diff, '']
+
+    def _section(self, title, columns, rows, depth):
+        self.section_count += 1
+        section = self.section_count
+        heading = min(depth, 6)
+        self.fd.write(f"<h{heading}>{html.escape(title)}</h{heading}>\n")
+        rows = iter(rows)
+        self._table(self.fd, f"section{section}", columns, islice(rows, self.page_rows))
+
+        root, ext = os.path.splitext(self.output_file)
+        links = []
+        page = 1
+        while True:
+            chunk = list(islice(rows, self.page_rows))
+            if not chunk:
+                break
+            page += 1
+            page_file = f"{root}_{section}_{page}{ext}"
+            with open(os.path.join(self.results_dir, page_file), 'w', encoding='utf-8') as fd:
+                fd.write(PAGE_HEAD.format(title=html.escape(f"{title}, page {page}")))
+                fd.write(f"<p><a href=\"{html.escape(self.output_file)}\">Back to the report</a></p>\n")
+                self._table(fd, f"section{section}", columns, chunk)
+                fd.write(PAGE_TAIL)
+            links.append(f"<a href=\"{html.escape(page_file)}\">page {page}</a>")
+        if links:
+            self.fd.write(f"<p>More rows ({self.page_rows} per page): {', '.join(links)}</p>\n")
+
+    def _table(self, fd, table_id, columns, rows):
+        fd.write(f"<table id=\"{table_id}\" class=\"display\" style=\"width:100%\"></table>\n<script>\n")
+        fd.write(f"$('#{table_id}').DataTable({{deferRender: true, columns: {json.dumps([{'title': html.escape(column)} for column in columns])}, data: [\n")
+        for count, row in enumerate(rows):
+            if count:
+                fd.write(",\n")
+            fd.write(json.dumps([_text(value) for value in row]))
+        fd.write("\n]});\n</script>\n")
@@ -0,0 +1,123 @@
+import time
+import logging
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+# NOTIFICATION_LOG event types that change metadata. INSERT, transaction, write id and
+# statistics events are counted but are not DDL
+DDL_EVENT_TYPES = frozenset((
+    'CREATE_DATABASE', 'ALTER_DATABASE', 'DROP_DATABASE',
+    'CREATE_TABLE', 'ALTER_TABLE', 'DROP_TABLE',
+    'ADD_PARTITION', 'ALTER_PARTITION', 'DROP_PARTITION',
+    'CREATE_FUNCTION', 'DROP_FUNCTION',
+    'ADD_PRIMARYKEY', 'ADD_FOREIGNKEY', 'ADD_UNIQUECONSTRAINT', 'ADD_NOTNULLCONSTRAINT', 'DROP_CONSTRAINT',
+    'CREATE_CATALOG', 'ALTER_CATALOG', 'DROP_CATALOG',
+))
+
+
+class EventWatcher:
+    """Follows NOTIFICATION_LOG and keeps rolling event counters in memory.
+
+    Every poll reads only the events after the last seen EVENT_ID (the primary key), so the
+    cost of a poll depends on the new events, not on the size of the table. Counters per
+    catalog, table and event type are kept since the start of the watch, and events per minute
+    over the last window_minutes give the current rate of all and of DDL events.
+    """
+
+    def __init__(self, dbo, catalog_queries, catalogs=None, window_minutes=15, batch_size=10000):
+        self.logger = logger
+        self.dbo = dbo
+        self.catalog_queries = catalog_queries
+        self.catalogs = set(catalogs) if catalogs else None
+        self.window = window_minutes * 60
+        self.batch_size = batch_size
+        self.last_event_id = None
+        self.started = time.time()
+        self.events = 0
+        self.ddl_events = 0
+        self.by_catalog = Counter()
+        self.by_table = Counter()
+        self.by_type = Counter()
+        # (minute, events, ddl events) of the rate window, oldest first
+        self.minutes = deque()
+
+    def _event_id_range(self):
+        rows, _ = self.dbo.query(self.catalog_queries['event_id_range'])
+        if not rows or rows[0][1] is None:
+            return None, None
+        return int(rows[0][0]), int(rows[0][1])
+
+    def start(self, from_event_id=None):
+        """Watch from from_event_id, by default from the current end of NOTIFICATION_LOG."""
+        if from_event_id is None:
+            _, from_event_id = self._event_id_range()
+        self.last_event_id = from_event_id or 0
+        self.started = time.time()
+        self.logger.info(f"Watching NOTIFICATION_LOG after event {self.last_event_id}")
+
+    def _count(self, event_time, event_type, catalog, table):
+        ddl = event_type in DDL_EVENT_TYPES
+        self.events += 1
+        self.ddl_events += ddl
+        self.by_catalog[catalog] += 1
+        self.by_type[event_type] += 1
+        if table:
+            self.by_table[f"{catalog}.{table}"] += 1
+        minute = int(event_time) // 60 * 60
+        if self.minutes and self.minutes[-1][0] == minute:
+            _, events, ddl_events = self.minutes[-1]
+            self.minutes[-1] = (minute, events + 1, ddl_events + ddl)
+        elif not self.minutes or minute > self.minutes[-1][0]:
+            self.minutes.append((minute, 1, int(ddl)))
+        else:
+            # an event that committed late with an older EVENT_TIME, count it in its minute
+            for idx, (bucket, events, ddl_events) in enumerate(self.minutes):
+                if bucket == minute:
+                    self.minutes[idx] = (minute, events + 1, ddl_events + ddl)
+                    break
+
+    def poll(self):
+        """Count the events added since the last poll. Returns the number of new events."""
+        first_event_id, last_event_id = self._event_id_range()
+        if last_event_id is None or last_event_id <= self.last_event_id:
+            return 0
+        if first_event_id > self.last_event_id + 1:
+            self.logger.warning(f"NOTIFICATION_LOG was cleaned up past event {self.last_event_id}, events {self.last_event_id + 1} to {first_event_id - 1} are not counted")
+        query = self.catalog_queries['notification_events']
+        params = query.params(from_event_id=self.last_event_id, to_event_id=last_event_id)
+        new_events = 0
+        for rows, _ in self.dbo.iter_query(query, params, batch_size=self.batch_size):
+            for event_id, event_time, event_type, catalog, table in rows:
+                if self.catalogs is None or catalog in self.catalogs:
+                    self._count(event_time, event_type, catalog, table)
+                    new_events += 1
+        self.last_event_id = last_event_id
+        return new_events
+
+    def rates(self, now=None):
+        """(events per minute, DDL events per minute) over the rate window."""
+        now = now or time.time()
+        while self.minutes and self.minutes[0][0] <= now - self.window - 60:
+            self.minutes.popleft()
+        since = now - self.window
+        events = sum(count for minute, count, _ in self.minutes if minute >= since)
+        ddl_events = sum(ddl for minute, _, ddl in self.minutes if minute >= since)
+        minutes = max(1.0, min(self.window, now - self.started) / 60)
+        return round(events / minutes, 2), round(ddl_events / minutes, 2)
+
+    def snapshot(self, top=20):
+        """Counters since the start of the watch and the current rates, as a dict."""
+        events_per_minute, ddl_per_minute = self.rates()
+        return {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'last_event_id': self.last_event_id,
+            'watching_seconds': round(time.time() - self.started),
+            'events': self.events,
+            'ddl_events': self.ddl_events,
+            'events_per_minute': events_per_minute,
+            'ddl_events_per_minute': ddl_per_minute,
+            'by_catalog': dict(self.by_catalog.most_common()),
+            'by_event_type': dict(self.by_type.most_common()),
+            'top_tables': dict(self.by_table.most_common(top)),
+        }
@@ -15,29 +15,36 @@ import sys
 import json
 import time
 import base64
+import getpass
 import argparse
 import traceback
 import pprint
 import logging
 from logging_setup import setup_logging
 from iniReader import iniReader
+from queryRegistry import QueryRegistry
 from postgresqlDatabase import PostgreSQLDatabase
 from mysqlDatabase import MySQLDatabase
 from reportWriter import ReportWriter
+from catalogRunner import CatalogRunner
+from queryRunner import QueryRunner
+from schemaSnapshot import save_snapshot, load_snapshot
+from summaryHistory import SummaryHistory, TREND_COLUMNS
+from eventWatcher import EventWatcher
+from columnarWriter import COLUMNAR_FORMATS, check_formats
+from partitionCompare import partition_differences
 from commands.icebergMigration import IcebergMigration
 from commands.databaseSummary import DatabaseSummary
 from commands.databaseReports import DatabaseReports
-from commands.databaseBackup import DatabaseBackup
+from commands.databaseBackup import DatabaseBackup, ExtractionError
 from commands.databaseCompare import DatabaseCompare
 from commands.hiveSchemaComparator import HiveSchemaComparator
 
 logger = logging.getLogger("hms_util")
 
-def read_query_file(filename):
+def read_query_file(registry, query_file):
     try:
-        with open(filename, 'r') as file:
-            queries = json.load(file)
-        return queries
+        return registry.load(query_file)
     except Exception as e:
         logger.error(f"read_query_file: {e}")
         sys.exit(1)
@@ -49,13 +56,19 @@ def get_dbobject(db_type, config, db_ufn="source"):
     database = config.get_property(db_ufn, 'database', 'unknowndb')
     user = config.get_property(db_ufn, 'user', 'unknownuser')
     password = config.get_property(db_ufn, 'password', 'unknown')
+    # Every schema_backup worker and every concurrent report query holds at most one pooled connection at a time,
+    # the backup also streams partitions on the main thread while the workers extract
+    pool_size = max(int(config.get_property(db_ufn, 'pool_size', '5')),
+                    int(config.get_property('schema_backup', 'workers', '1')) + 1,
+                    int(config.get_property('global', 'query_workers', '1')))
+    prepared_statements = config.get_property('global', 'prepared_statements', 'true') == 'true'
 
     if db_type == 'postgresql':
         dbo = PostgreSQLDatabase()
-        dbo.connect(host=host, port=port, database=database, user=user, password=password)
+        dbo.connect(host=host, port=port, database=database, user=user, password=password, pool_size=pool_size, prepared_statements=prepared_statements)
     elif db_type == 'mysql':
         dbo = MySQLDatabase()
-        dbo.connect(host=host, port=port, database=database, user=user, password=password)
+        dbo.connect(host=host, port=port, database=database, user=user, password=password, pool_size=pool_size, prepared_statements=prepared_statements)
     else:
         dbo = None
     return dbo
@@ -65,6 +78,7 @@ def main():
     parser = argparse.ArgumentParser(description="Arguments to hms_util script.")
     parser.add_argument("--log_level", type=str, help="log level", choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO')
     parser.add_argument("--config", type=str, help="path to config.ini file", default='config.ini')
+    parser.add_argument("--resume", action='store_true', help="schema_backup: continue the unfinished backup of each catalog from its last checkpoint")
 
     signature = int(time.time())
     args = parser.parse_args()
@@ -72,8 +86,9 @@ def main():
     config = iniReader(args.config)
     config.validate()
 
+    command = config.get_property('global', 'command', 'summary')
     password = config.get_property('source', 'password', '')
-    if password.isspace() or len(password) == 0:
+    if command != 'trend' and (password.isspace() or len(password) == 0):
         password = getpass.getpass(prompt="Enter password for the source database: ")
         config.set('source', 'password', password)
 
@@ -86,21 +101,41 @@ def main():
     except Exception as e:
         logger.error(f"creating results directory: {e}")
 
+    history_file = config.get_property('summary', 'history_file', '') or os.path.join(results_dir, 'summary_history.sqlite')
+    if command == 'trend':
+        # reads the summary history only, the metastore is not queried
+        try:
+            history = SummaryHistory(history_file)
+            db = config.get_property('global', 'catalog', 'default')
+            records = history.trend(None if db == 'ALL' else [db], int(config.get_property('trend', 'runs', '10')))
+            history.close()
+            value = config.get_property('trend', 'report_format', 'csv, md')
+            report_formats = [item.strip() for item in value.split(',')]
+            rw = ReportWriter()
+            filebase = "summary_trend_"+str(signature)
+            if 'csv' in report_formats:
+                rw.write_csv_table(TREND_COLUMNS, records, os.path.join(results_dir, filebase+".csv"))
+            md_table = rw.tuples_to_markdown_table("Summary trend", TREND_COLUMNS, records)
+            if 'md' in report_formats:
+                with open(os.path.join(results_dir, filebase+".md"), 'w') as fd:
+                    fd.write(md_table)
+            print(md_table)
+        except Exception as e:
+            traceback.print_exc()
+            logger.error(f"command trend failed: {e}")
+        return
 
-    command = config.get_property('global', 'command', 'summary')
     db_type = config.get_property('global', 'database_type', 'postgresql')
     hms_db = config.get_property('source', 'database', 'hive'),
     dbo = get_dbobject(db_type, config, "source")
+    # All .queries files are compiled once into bind parameter statements
+    registry = QueryRegistry(config.get_property('global', 'queries_dir', 'queries'), db_type)
+    catalog_queries = read_query_file(registry, config.get_property('global', 'catalog_query_file', 'catalog.queries'))
 
     db = config.get_property('global', 'catalog', 'default')
     if db == 'ALL':
         try:
-            if db_type == 'postgresql':
-                db_list_query = "select \"NAME\" from \"DBS\" where \"NAME\" not in ('sys', 'information_schema');"
-            elif db_type == 'mysql':
-                db_list_query = "select NAME from DBS where NAME not in ('sys', 'information_schema');"
-
-            tdbs,_ = dbo.query(db_list_query)
+            tdbs,_ = dbo.query(catalog_queries['database_list'])
             dbs = [db[0] for db in tdbs]
         except Exception as e:
             logger.error("Connecting to source: {e}")
@@ -108,19 +143,40 @@ def main():
     else:
         dbs=[db]
 
+    # Catalogs are processed by catalog_workers threads, each with its own connection pool
+    catalog_workers = min(int(config.get_property('global', 'catalog_workers', '1')), len(dbs))
+    table_counts = {}
+    if len(dbs) > 1:
+        rows, _ = dbo.query(catalog_queries['catalog_table_counts'])
+        table_counts = {row[0]: int(row[1]) for row in rows or []}
+    if catalog_workers > 1:
+        runner = CatalogRunner(lambda: get_dbobject(db_type, config, "source"), catalog_workers)
+    else:
+        runner = CatalogRunner(lambda: dbo)
+
+    # summary and reports run the queries of one catalog concurrently, each with its own statement timeout
+    query_runner = QueryRunner(int(config.get_property('global', 'query_workers', '1')),
+                               float(config.get_property('global', 'query_timeout', '0')))
+
+    def run_catalogs(task):
+        timings = runner.run(dbs, task, table_counts)
+        if len(dbs) > 1:
+            timing_table = ReportWriter().tuples_to_markdown_table(f"{command} catalog timings", ['catalog', 'tables', 'seconds', 'status'], timings)
+            print(timing_table)
+            with open(os.path.join(results_dir, f"{command}_catalog_timings_{signature}.md"), 'w') as fd:
+                fd.write(timing_table)
+
     if command == 'summary':
         try:
-            queries = read_query_file(os.path.join(
-                config.get_property('global', 'queries_dir', 'queries'),
-                config.get_property('global', 'database_type', 'postgresql'),
-                config.get_property('summary', 'query_file', 'summary.queries'))
-            )
+            queries = read_query_file(registry, config.get_property('summary', 'query_file', 'summary.queries'))
             value = config.get_property('summary', 'report_format', 'csv, md')
             report_formats = [item.strip() for item in value.split(',')]
             rw = ReportWriter()
-            ds = DatabaseSummary()
-            for db in dbs:
-                summary_info = ds.get_summary(dbo, db_type, hms_db, db, queries)
+            ds = DatabaseSummary(query_runner)
+            history = SummaryHistory(history_file) if config.get_property('summary', 'history', 'true') == 'true' else None
+            def write_summary(db, summary_info):
+                if history and summary_info:
+                    history.append(signature, db, summary_info)
                 filebase = db+"_summary_"+str(signature)
                 if 'csv' in report_formats:
                     output_file = os.path.join(results_dir,filebase+".csv")
@@ -129,42 +185,149 @@ def main():
                 if 'md' in report_formats:
                     output_file = os.path.join(results_dir,filebase+".md")
                     rw.write_md_file(summary_info, output_file)
+            def summary_task(dbo, db):
+                summary_info = ds.get_summary(dbo, db_type, hms_db, db, queries)
+                if summary_info is None:
+                    raise Exception(f"summary of {db} failed")
+                write_summary(db, summary_info)
+            if len(dbs) > 1 and config.get_property('summary', 'single_pass', 'true') == 'true':
+                # one query per metric grouped by catalog, instead of every query for every catalog
+                all_queries = read_query_file(registry, config.get_property('summary', 'all_catalogs_query_file', 'summary_all.queries'))
+                summaries = ds.get_all_summaries(dbo, all_queries, dbs)
+                if summaries is None:
+                    raise Exception("single pass summary failed")
+                keys = list(dict.fromkeys(key for summary in summaries.values() for key in summary))
+                records = [(db, *(summaries[db].get(key, '') for key in keys)) for db in dbs]
+                for db in dbs:
+                    write_summary(db, summaries[db])
+                filebase = "all_catalogs_summary_"+str(signature)
+                if 'csv' in report_formats:
+                    rw.write_csv_table(['catalog', *keys], records, os.path.join(results_dir, filebase+".csv"))
+                if 'md' in report_formats:
+                    with open(os.path.join(results_dir, filebase+".md"), 'w') as fd:
+                        fd.write(rw.tuples_to_markdown_table("Summary of all catalogs", ['catalog', *keys], records))
+            else:
+                run_catalogs(summary_task)
+            if history:
+                history.close()
         except Exception as e:
             traceback.print_exc()
             logger.error(f"Command summary failed: {e}")
 
     elif command == 'reports':
         try:
-            queries = read_query_file(os.path.join(
-                config.get_property('global', 'queries_dir', 'queries'),
-                config.get_property('global', 'database_type', 'postgresql'),
-                config.get_property('reports', 'query_file', 'reports.queries')))
+            queries = read_query_file(registry, config.get_property('reports', 'query_file', 'reports.queries'))
             value = config.get_property('reports', 'report_format', 'html, md')
             report_formats = [item.strip() for item in value.split(',')]
-            dr = DatabaseReports()
-            for db in dbs:
-                results = dr.gather_database_info(dbo, 'hive', db, queries, results_dir)
-                if results:
-                    dr.create_database_reports(results, results_dir, f"{db}_reports_{signature}", report_formats)
+            # with one query worker every query is streamed from the cursor, with more only these
+            streamed_queries = [name.strip() for name in config.get_property('reports', 'streamed_queries', 'Table Stats, Partition Count by Table').split(',') if name.strip()]
+            dr = DatabaseReports(query_runner, streamed_queries, int(config.get_property('reports', 'stream_batch_size', '10000')))
+            columnar_formats = [report_format for report_format in report_formats if report_format in COLUMNAR_FORMATS]
+            check_formats(columnar_formats)
+            columnar_batch_size = int(config.get_property('reports', 'columnar_batch_size', '50000'))
+            def reports_task(dbo, db):
+                filebase = f"{db}_reports_{signature}"
+                failed = []
+                if 'md' in report_formats or 'html' in report_formats:
+                    results = dr.gather_database_info(dbo, 'hive', db, queries, results_dir)
+                    if results is None:
+                        raise Exception(f"report queries of {db} failed")
+                    # md, html and the columnar formats are written from one pass over the results
+                    failed = dr.create_database_reports(results, results_dir, filebase, report_formats)
+                elif columnar_formats:
+                    # only columnar formats: stream every query from the cursor instead of fetching it
+                    failed = dr.export_columnar(dbo, 'hive', db, queries, results_dir, filebase, columnar_formats, columnar_batch_size)
+                if failed:
+                    # the reports are written, the catalog is reported as failed in the timings
+                    raise Exception(f"{len(failed)} of {len(queries)} report queries failed: {', '.join(failed)}")
+            run_catalogs(reports_task)
         except Exception as e:
             traceback.print_exc()
             logger.error(f"command reports failed: {e}")
 
+    elif command == 'compare' and config.get_property('compare', 'targets', '').strip():
+        # Fleet compare: every catalog of the source (golden) metastore against several targets
+        dbcompare = DatabaseCompare(config, catalog_queries)
+        comparator = HiveSchemaComparator(config)
+        schema_backup_queries = read_query_file(registry, config.get_property('schema_backup', 'query_file', 'backup_ddl.queries'))
+        labels = [label.strip() for label in config.get_property('compare', 'targets', '').split(',') if label.strip()]
+        targets = []
+        for label in labels:
+            password = config.get_property(label, 'password', '')
+            if password.isspace() or len(password) == 0:
+                password = getpass.getpass(prompt=f"Enter password for the {label} database: ")
+                config.set(label, 'password', password)
+            targets.append((label, get_dbobject(db_type, config, label)))
+        source_label = config.get_property('compare', 'golden_label', 'golden')
+        matrix_rows = []
+        fleet_matrix = {}
+        try:
+            for catalog in dbs:
+                sides = [(source_label, dbo, catalog)] + [(label, target_dbo, catalog) for label, target_dbo in targets]
+                # golden and targets are extracted once, concurrently, and shared by all pairwise compares
+                try:
+                    schemas = dbcompare.get_database_schemas(sides, db_type, hms_db, schema_backup_queries)
+                except ExtractionError as e:
+                    logger.error(f"Compare of {catalog} skipped: {e}")
+                    continue
+                print(f"\nExtraction time {catalog}: " + ", ".join(f"{label} {seconds:.1f}s" for label, (_, seconds) in schemas.items()))
+                golden = schemas[source_label][0]
+                differences, plans = comparator.compare_fleet(golden, {label: schemas[label][0] for label in labels})
+                matrix = fleet_matrix[catalog] = comparator.drift_matrix(differences)
+                for schema_name, object_types in matrix.items():
+                    for object_type, objects in object_types.items():
+                        for name in sorted(objects):
+                            matrix_rows.append((catalog, object_type, name, *(objects[name].get(label, '') for label in labels)))
+                for label in labels:
+                    if plans[label].statements():
+                        # replayed on the target, brings its catalog back to the golden metastore
+                        plans[label].write(os.path.join(results_dir, f"{catalog}_{label}_reconcile_{signature}.sql"),
+                                           f"Reconcile {catalog} of {label} with {source_label} (run on {label})")
+            matrix_table = ReportWriter().tuples_to_markdown_table("Drift matrix", ['catalog', 'type', 'object', *labels], matrix_rows)
+            print(matrix_table)
+            with open(os.path.join(results_dir, f"drift_matrix_{signature}.md"), 'w') as fd:
+                fd.write(matrix_table)
+            with open(os.path.join(results_dir, f"drift_matrix_{signature}.json"), 'w') as fd:
+                json.dump(fleet_matrix, fd, indent=2)
+            logger.info(f"Drift matrix of {len(labels)} targets saved to {results_dir}")
+        except Exception as e:
+            traceback.print_exc()
+            logger.error(f"command compare failed: {e}")
+        finally:
+            for _, target_dbo in targets:
+                target_dbo.disconnect()
+
     elif command == 'compare':
-        dbcompare = DatabaseCompare(config)
-        password = config.get_property('target', 'password', '')
-        if password.isspace() or len(password) == 0:
-            password = getpass.getpass(prompt="Enter password for the target database: ")
-            config.set('target', 'password', password)
+        dbcompare = DatabaseCompare(config, catalog_queries)
         source_hive_catalog = config.get_property('compare', 'source_hive_catalog', 'default')
         target_hive_catalog = config.get_property('compare', 'target_hive_catalog', 'default')
-        dbo_tgt = get_dbobject(db_type, config, "target")
-        schema_backup_queries = read_query_file(os.path.join(
-                          config.get_property('global', 'queries_dir', 'queries'),
-                          config.get_property('global', 'database_type', 'postgresql'),
-                          config.get_property('schema_backup', 'query_file', 'backup_ddl.queries')))
-        src_db_schema = dbcompare.get_database_schema(dbo, db_type, hms_db, source_hive_catalog, schema_backup_queries)
-        tgt_db_schema = dbcompare.get_database_schema(dbo_tgt, db_type, hms_db, target_hive_catalog, schema_backup_queries)
+        schema_backup_queries = read_query_file(registry, config.get_property('schema_backup', 'query_file', 'backup_ddl.queries'))
+        # Each side is either a live metastore or a snapshot file saved by the snapshot command
+        schemas = {}
+        live_sides = []
+        for label, catalog in (('source', source_hive_catalog), ('target', target_hive_catalog)):
+            snapshot_file = config.get_property('compare', f'{label}_snapshot', '').strip()
+            if snapshot_file:
+                start = time.time()
+                schemas[label] = (load_snapshot(snapshot_file), time.time() - start)
+            elif label == 'source':
+                live_sides.append((label, dbo, catalog))
+            else:
+                password = config.get_property('target', 'password', '')
+                if password.isspace() or len(password) == 0:
+                    password = getpass.getpass(prompt="Enter password for the target database: ")
+                    config.set('target', 'password', password)
+                live_sides.append((label, get_dbobject(db_type, config, "target"), catalog))
+        # live metastores are independent, they are extracted concurrently
+        if live_sides:
+            try:
+                schemas.update(dbcompare.get_database_schemas(live_sides, db_type, hms_db, schema_backup_queries))
+            except ExtractionError as e:
+                logger.error(f"Compare skipped: {e}")
+                sys.exit(1)
+        src_db_schema, src_seconds = schemas['source']
+        tgt_db_schema, tgt_seconds = schemas['target']
+        print(f"\nExtraction time: source {source_hive_catalog} {src_seconds:.1f}s, target {target_hive_catalog} {tgt_seconds:.1f}s")
         comparator = HiveSchemaComparator(config)
         # Compare the two schemas
         diffs = comparator.compare_schemas(src_db_schema, tgt_db_schema)
@@ -172,35 +335,119 @@ def main():
         comparator.print_diffs_hierarchical(diffs)
         comparator.generate_html_report(diffs, results_dir, f"schema_differences_report_{signature}.html")
 
-        print("\nSQL Statements to reconcile the differences")
-        statements=comparator.sql_statements
-        for statement in statements:
-            print(statement)
+        # Reconciliation statements, grouped per table and ordered for replay
+        sql_file = comparator.plan.write(os.path.join(results_dir, f"schema_reconcile_{signature}.sql"),
+                                         f"Reconcile {source_hive_catalog} with {target_hive_catalog}")
+        print("\nSQL statements to reconcile the differences")
+        for phase, count in comparator.plan.summary().items():
+            print(f"    {phase}: {count}")
+        print(f"Saved to {os.path.abspath(sql_file)}")
+
+        # Partitions are streamed from both metastores, snapshots do not hold them
+        if config.get_property('compare', 'compare_partitions', 'false') == 'true':
+            if len(live_sides) == 2:
+                sides = {label: (side_dbo, catalog) for label, side_dbo, catalog in live_sides}
+                try:
+                    tables = dbcompare.compare_partitions(sides['source'], sides['target'])
+                    differences = partition_differences(tables)
+                    records = [(name, c['source_partitions'], c['target_partitions'], c['missing_in_target'], c['missing_in_source'], c['location_differs'])
+                               for name, c in sorted(differences.items())]
+                    partition_table = ReportWriter().tuples_to_markdown_table("Partition differences",
+                        ['table', 'source partitions', 'target partitions', 'missing in target', 'missing in source', 'location differs'], records)
+                    print(partition_table)
+                    print(f"{len(differences)} of {len(tables)} partitioned tables differ")
+                    partition_file = os.path.join(results_dir, f"partition_differences_{signature}.json")
+                    with open(partition_file, 'w') as fd:
+                        json.dump(differences, fd, indent=2)
+                    logger.info(f"Partition differences saved to {partition_file}")
+                except Exception as e:
+                    traceback.print_exc()
+                    logger.error(f"Partition compare failed: {e}")
+            else:
+                logger.warning("compare_partitions needs a live source and target, skipping the partition compare")
 
     elif command == 'schema_backup':
-        dbbackup = DatabaseBackup(config)
+        dbbackup = DatabaseBackup(config, catalog_queries)
         try:
-            schema_backup_queries = read_query_file(os.path.join(
-                              config.get_property('global', 'queries_dir', 'queries'),
-                              config.get_property('global', 'database_type', 'postgresql'),
-                              config.get_property('schema_backup', 'query_file', 'backup_ddl.queries')))
-            for db in dbs:
+            schema_backup_queries = read_query_file(registry, config.get_property('schema_backup', 'query_file', 'backup_ddl.queries'))
+            bulk_queries = None
+            if config.get_property('schema_backup', 'extraction_mode', 'per_table') == 'bulk':
+                bulk_queries = read_query_file(registry, config.get_property('schema_backup', 'bulk_query_file', 'backup_ddl_bulk.queries'))
+            def backup_task(dbo, db):
                 filebase = f"{db}_backup_{signature}.ddl"
                 results_file = os.path.join(results_dir, filebase)
-                db_schema = dbbackup.database_schema_backup(dbo, db_type, hms_db, db, schema_backup_queries, results_file)
+                if args.resume:
+                    results_file = DatabaseBackup.find_unfinished_backup(results_dir, db) or results_file
+                db_schema = dbbackup.database_schema_backup(dbo, db_type, hms_db, db, schema_backup_queries, results_file, bulk_queries=bulk_queries, resume=args.resume)
                 logger.info(f"{command} saved to {results_file}")
+            run_catalogs(backup_task)
         except Exception as e:
             logger.error(f"Getting schema_backup: {str(e)}")
 
+    elif command == 'snapshot':
+        try:
+            dbcompare = DatabaseCompare(config, catalog_queries)
+            schema_backup_queries = read_query_file(registry, config.get_property('schema_backup', 'query_file', 'backup_ddl.queries'))
+            def snapshot_task(dbo, db):
+                db_schema = dbcompare.get_database_schema(dbo, db_type, hms_db, db, schema_backup_queries)
+                save_snapshot(db_schema, db, os.path.join(results_dir, f"{db}_snapshot_{signature}.jsonl"), source=config.get_property('source', 'host', ''))
+            run_catalogs(snapshot_task)
+        except Exception as e:
+            traceback.print_exc()
+            logger.error(f"command snapshot failed: {e}")
+
+    elif command == 'watch':
+        # Tails NOTIFICATION_LOG by EVENT_ID until interrupted (or for [watch] duration seconds)
+        try:
+            watcher = EventWatcher(dbo, catalog_queries, None if db == 'ALL' else dbs,
+                                   int(config.get_property('watch', 'rate_window_minutes', '15')),
+                                   int(config.get_property('watch', 'batch_size', '10000')))
+            from_event_id = config.get_property('watch', 'from_event_id', '').strip()
+            watcher.start(int(from_event_id) if from_event_id else None)
+            poll_interval = float(config.get_property('watch', 'poll_interval', '10'))
+            snapshot_interval = float(config.get_property('watch', 'snapshot_interval', '60'))
+            duration = float(config.get_property('watch', 'duration', '0'))
+            top_tables = int(config.get_property('watch', 'top_tables', '20'))
+            snapshot_file = os.path.join(results_dir, f"watch_{signature}.jsonl")
+            rw = ReportWriter()
+            def emit_snapshot():
+                snapshot = watcher.snapshot(top_tables)
+                with open(snapshot_file, 'a') as fd:
+                    fd.write(json.dumps(snapshot) + "\n")
+                counters = [(key, value) for key, value in snapshot.items() if not isinstance(value, dict)]
+                counters += [(f"type {name}", count) for name, count in snapshot['by_event_type'].items()]
+                counters += [(f"catalog {name}", count) for name, count in snapshot['by_catalog'].items()]
+                counters += [(f"table {name}", count) for name, count in snapshot['top_tables'].items()]
+                print(rw.tuples_to_markdown_table("NOTIFICATION_LOG watch", ['counter', 'value'], counters))
+            next_snapshot = time.time() + snapshot_interval
+            try:
+                while True:
+                    watcher.poll()
+                    now = time.time()
+                    if duration and now - watcher.started >= duration:
+                        break
+                    if now >= next_snapshot:
+                        emit_snapshot()
+                        next_snapshot = now + snapshot_interval
+                    time.sleep(poll_interval)
+            except KeyboardInterrupt:
+                logger.info("Watch interrupted")
+            emit_snapshot()
+            logger.info(f"Watch snapshots saved to {snapshot_file}")
+        except Exception as e:
+            traceback.print_exc()
+            logger.error(f"command watch failed: {e}")
+
     elif command == 'iceberg_migration':
         try:
             iceberg_version = config.get_property('iceberg_migration', 'iceberg_version', '2')
             approach = config.get_property('iceberg_migration', 'migration_approach', 'inplace')
             table_properties = config.get_property('iceberg_migration', 'table_properties', '')
-            ib = IcebergMigration(version=iceberg_version, approach=approach, table_properties=table_properties, results_dir=results_dir)
-            for db in dbs:
+            ib = IcebergMigration(version=iceberg_version, approach=approach, table_properties=table_properties, results_dir=results_dir, queries=catalog_queries)
+            def iceberg_task(dbo, db):
                 filebase = f"{db}_iceberg_migration_{signature}"
                 ib.create_iceberg_migration_statements(dbo, db_type, db, filebase)
+            run_catalogs(iceberg_task)
         except Exception as e:
             traceback.print_exc()
             logger.error(f"command reports failed: {e}")
@@ -2,20 +2,35 @@ import mysql.connector
 from mysql.connector import Error
 from mysql.connector import pooling
 import logging
+import threading
+from queryRegistry import PreparedQuery
+from databaseInterface import QueryTimeout
 #from logging_setup import setup_logging
 
 logger = logging.getLogger(__name__)
+
+# ER_QUERY_TIMEOUT: the statement was interrupted by max_execution_time
+QUERY_TIMEOUT_ERRNO = 3024
+
 class MySQLDatabase:
     def __init__(self):
         self.connection_pool = None
         self.logger = logger
+        self.prepared_statements = True
+        # prepared cursors keyed by (server connection id, statement name)
+        self.prepared_cache = {}
+        self.prepared_lock = threading.Lock()
+        self.execution_time_supported = True
 
-    def connect(self, host, port, database, user, password):
+    def connect(self, host, port, database, user, password, pool_size=5, prepared_statements=True):
         """Initialize the connection pool for MySQL database."""
+        self.prepared_statements = prepared_statements
         try:
             self.connection_pool = pooling.MySQLConnectionPool(
                 pool_name="mypool",
-                pool_size=5,
+                pool_size=pool_size,
+                # resetting the session on release would deallocate the prepared statements
+                pool_reset_session=not prepared_statements,
                 host=host,
                 port=port,
                 database=database,
@@ -23,7 +38,7 @@ class MySQLDatabase:
                 password=password
             )
             if self.connection_pool:
-                self.logger.info(f"Connected to MySQL database at {host}:{port}")
+                self.logger.info(f"Connected to MySQL database at {host}:{port} (pool size {pool_size})")
             else:
                 self.logger.error('Failed to create connection pool')
         except Error as e:
@@ -34,19 +49,57 @@ class MySQLDatabase:
             self.connection_pool.close()
             self.logger.info('Disconnected from MySQL database and closed connection pool')
 
-    def query(self, sql_query: str, params: tuple = ()):
-        """Execute a query on the MySQL database using a connection from the pool."""
+    @staticmethod
+    def _execution_time(conn, timeout):
+        """Set max_execution_time (milliseconds, 0 is unlimited) for the SELECTs of this session."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SET SESSION MAX_EXECUTION_TIME = {int(timeout * 1000)}")
+        finally:
+            cursor.close()
+
+    def query(self, sql_query, params: tuple = (), timeout: float = None):
+        """Execute a query on the MySQL database using a connection from the pool.
+
+        sql_query is plain SQL or a PreparedQuery. A PreparedQuery with parameters runs on a
+        prepared cursor that is cached per pooled connection. With timeout (seconds) the server
+        stops the query after that time and QueryTimeout is raised.
+        """
         if not self.connection_pool:
             self.logger.error('Connection pool is not initialized')
             return None,None
 
+        conn = None
+        cursor = None
+        prepared_key = None
+        timed = False
         try:
             conn = self.connection_pool.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql_query, params)
-            if cursor.description:
-                results = cursor.fetchall()
-                cols = [desc[0] for desc in cursor.description]
+            if timeout and self.execution_time_supported:
+                try:
+                    self._execution_time(conn, timeout)
+                    timed = True
+                except Error as e:
+                    # MySQL before 5.7.8 and MariaDB have no max_execution_time
+                    self.logger.warning(f"Statement timeouts are not supported by the server, running without: {e}")
+                    self.execution_time_supported = False
+            if isinstance(sql_query, PreparedQuery) and self.prepared_statements and params:
+                prepared_key = (conn.connection_id, sql_query.statement_name)
+                with self.prepared_lock:
+                    prepared_cursor = self.prepared_cache.get(prepared_key)
+                if prepared_cursor is None:
+                    prepared_cursor = conn.cursor(prepared=True)
+                    with self.prepared_lock:
+                        self.prepared_cache[prepared_key] = prepared_cursor
+                prepared_cursor.execute(sql_query.prepare_sql, params)
+                results_cursor = prepared_cursor
+            else:
+                cursor = conn.cursor()
+                cursor.execute(str(sql_query), params)
+                results_cursor = cursor
+            if results_cursor.description:
+                results = results_cursor.fetchall()
+                cols = [desc[0] for desc in results_cursor.description]
                 self.logger.debug("Query executed successfully: {sql_query}")
                 return results, cols
             else:
@@ -54,11 +107,78 @@ class MySQLDatabase:
                 self.logger.info("Query executed successfully (no results): {sql_query}")
                 return None, None
         except Exception as e:
-            self.logger.error('Error executing query: %s', e)
+            if prepared_key:
+                with self.prepared_lock:
+                    self.prepared_cache.pop(prepared_key, None)
             if conn:
                 conn.rollback()
+            if timed and getattr(e, 'errno', None) == QUERY_TIMEOUT_ERRNO:
+                self.logger.error('Query timed out after %ss: %s', timeout, sql_query)
+                raise QueryTimeout(f"timed out after {timeout}s") from e
+            self.logger.error('Error executing query: %s', e)
             return None, None
         finally:
-            cursor.close()
+            if cursor:
+                cursor.close()
+            if conn:
+                if timed:
+                    # pooled sessions are not reset when prepared statements are kept
+                    try:
+                        self._execution_time(conn, 0)
+                    except Error as e:
+                        self.logger.error(f"Failed to reset max_execution_time: {e}")
+                conn.close()
+
+    def iter_query(self, sql_query, params: tuple = (), batch_size: int = 1000, timeout: float = None):
+        """Stream the results of a query in (rows, cols) batches using an unbuffered cursor.
+
+        The pooled connection is held until the generator is exhausted or closed.
+        Errors are logged and re-raised so that a partial result is never mistaken for a complete one.
+        With timeout (seconds) the server stops the query after that time, fetching included,
+        and QueryTimeout is raised.
+        """
+        if not self.connection_pool:
+            self.logger.error('Connection pool is not initialized')
+            return
+
+        conn = None
+        cursor = None
+        timed = False
+        try:
+            conn = self.connection_pool.get_connection()
+            if timeout and self.execution_time_supported:
+                try:
+                    self._execution_time(conn, timeout)
+                    timed = True
+                except Error as e:
+                    self.logger.warning(f"Statement timeouts are not supported by the server, running without: {e}")
+                    self.execution_time_supported = False
+            cursor = conn.cursor(buffered=False)
+            cursor.execute(str(sql_query), params)
+            cols = [desc[0] for desc in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows, cols
+            self.logger.debug(f"Streaming query executed successfully: {sql_query}")
+        except Exception as e:
+            if timed and getattr(e, 'errno', None) == QUERY_TIMEOUT_ERRNO:
+                self.logger.error('Streaming query timed out after %ss: %s', timeout, sql_query)
+                raise QueryTimeout(f"timed out after {timeout}s") from e
+            self.logger.error('Error executing streaming query: %s', e)
+            raise
+        finally:
+            if conn:
+                # an unbuffered cursor must be drained before the connection can be reused
+                if conn.unread_result:
+                    conn.consume_results()
+            if cursor:
+                cursor.close()
             if conn:
+                if timed:
+                    try:
+                        self._execution_time(conn, 0)
+                    except Error as e:
+                        self.logger.error(f"Failed to reset max_execution_time: {e}")
                 conn.close()
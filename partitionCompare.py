@@ -0,0 +1,89 @@
+import logging
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+PARTITION_COUNTERS = ('source_partitions', 'target_partitions', 'missing_in_target', 'missing_in_source', 'location_differs')
+
+
+def location_key(location, mode):
+    """Part of a partition location that takes part in the compare.
+
+    'full' compares the whole URI, 'path' ignores the scheme and authority (name node or bucket
+    of another cluster after a failover), 'none' does not compare locations.
+    """
+    if mode == 'none' or location is None:
+        return None
+    if mode == 'path':
+        return urlsplit(location).path.rstrip('/')
+    return location
+
+
+def ordered_partitions(batches, label):
+    """Flatten (rows, cols) batches of (TBL_NAME, PART_NAME, LOCATION) and check the key order.
+
+    The merge join is only correct if both sides are sorted the same way, so a key that sorts
+    before its predecessor (a collation that differs from code point order) stops the compare.
+    """
+    previous = None
+    for rows, _ in batches:
+        for table_name, part_name, location in rows:
+            key = (table_name, part_name)
+            if previous is not None and key < previous:
+                raise ValueError(f"Partitions of {label} are not in code point order: {key} after {previous}")
+            previous = key
+            yield key, location
+
+
+def merge_partitions(source, target, sample_size=20, location_mode='full'):
+    """Merge join two ordered ((table, partition), location) streams.
+
+    Memory is bounded by the number of tables, not partitions: every table gets its counters
+    and at most sample_size differing partitions as [partition, kind, source location,
+    target location]. Returns {table: counters}, for the tables that have partitions on either side.
+    """
+    tables = {}
+
+    def entry(table_name):
+        counters = tables.get(table_name)
+        if counters is None:
+            counters = tables[table_name] = dict.fromkeys(PARTITION_COUNTERS, 0)
+            counters['sample'] = []
+        return counters
+
+    def difference(table_name, part_name, kind, source_location, target_location):
+        counters = entry(table_name)
+        counters[kind] += 1
+        if len(counters['sample']) < sample_size:
+            counters['sample'].append([part_name, kind, source_location, target_location])
+
+    src = next(source, None)
+    tgt = next(target, None)
+    while src is not None or tgt is not None:
+        if tgt is None or (src is not None and src[0] < tgt[0]):
+            (table_name, part_name), location = src
+            entry(table_name)['source_partitions'] += 1
+            difference(table_name, part_name, 'missing_in_target', location, None)
+            src = next(source, None)
+        elif src is None or tgt[0] < src[0]:
+            (table_name, part_name), location = tgt
+            entry(table_name)['target_partitions'] += 1
+            difference(table_name, part_name, 'missing_in_source', None, location)
+            tgt = next(target, None)
+        else:
+            (table_name, part_name), source_location = src
+            target_location = tgt[1]
+            counters = entry(table_name)
+            counters['source_partitions'] += 1
+            counters['target_partitions'] += 1
+            if location_key(source_location, location_mode) != location_key(target_location, location_mode):
+                difference(table_name, part_name, 'location_differs', source_location, target_location)
+            src = next(source, None)
+            tgt = next(target, None)
+    return tables
+
+
+def partition_differences(tables):
+    """Only the tables of merge_partitions with at least one difference."""
+    return {name: counters for name, counters in tables.items()
+            if counters['missing_in_target'] or counters['missing_in_source'] or counters['location_differs']}
@@ -1,8 +1,13 @@
 import psycopg2
 from psycopg2 import sql
 from psycopg2 import pool
+from psycopg2 import errors
+import uuid
 import logging
+import threading
 import traceback
+from queryRegistry import PreparedQuery
+from databaseInterface import QueryTimeout
 #from logging_setup import setup_logging
 
 logger = logging.getLogger(__name__)
@@ -11,13 +16,19 @@ class PostgreSQLDatabase:
     def __init__(self):
         self.connection_pool = None
         self.logger = logger
+        self.prepared_statements = True
+        # statement names prepared on each pooled connection, keyed by (connection, backend pid)
+        self.prepared_cache = {}
+        self.prepared_lock = threading.Lock()
+        self.unpreparable = set()
 
-    def connect(self, host, port, database, user, password):
-        """Connect to the PostgreSQL database using a connection pool."""
+    def connect(self, host, port, database, user, password, pool_size=5, prepared_statements=True):
+        """Connect to the PostgreSQL database using a thread safe connection pool."""
+        self.prepared_statements = prepared_statements
         try:
-            self.connection_pool = psycopg2.pool.SimpleConnectionPool(
+            self.connection_pool = psycopg2.pool.ThreadedConnectionPool(
                 minconn=1,
-                maxconn=5,
+                maxconn=pool_size,
                 dbname=database,
                 user=user,
                 password=password,
@@ -25,7 +36,7 @@ class PostgreSQLDatabase:
                 port=port
             )
             if self.connection_pool:
-                self.logger.info('Connected to PostgreSQL database at %s:%d', host, port)
+                self.logger.info('Connected to PostgreSQL database at %s:%s (pool size %d)', host, port, pool_size)
             else:
                 self.logger.error('Failed to create connection pool')
         except Exception as e:
@@ -37,16 +48,33 @@ class PostgreSQLDatabase:
             self.connection_pool.closeall()
             self.logger.info('Disconnected from PostgreSQL database and closed connection pool')
 
-    def query(self, sql_query: str, params: tuple = ()):
-        """Execute a query on the PostgreSQL database using a connection from the pool."""
+    @staticmethod
+    def _statement_timeout(cursor, timeout):
+        """Limit the statements of the current transaction to timeout seconds."""
+        if timeout:
+            cursor.execute(f"SET LOCAL statement_timeout = {int(timeout * 1000)}")
+
+    def query(self, sql_query, params: tuple = (), timeout: float = None):
+        """Execute a query on the PostgreSQL database using a connection from the pool.
+
+        sql_query is plain SQL or a PreparedQuery. A PreparedQuery runs as PREPARE/EXECUTE,
+        prepared once per pooled connection. With timeout (seconds) the server cancels the
+        query after that time and QueryTimeout is raised.
+        """
         if not self.connection_pool:
             self.logger.error('Connection pool is not initialized')
             return None, None
 
+        conn = None
         try:
             conn = self.connection_pool.getconn()
             with conn.cursor() as cursor:
-                cursor.execute(sql_query)
+                # SET LOCAL ends with the transaction, the pooled connection keeps no timeout
+                self._statement_timeout(cursor, timeout)
+                if isinstance(sql_query, PreparedQuery) and self.prepared_statements:
+                    self._execute_prepared(conn, cursor, sql_query, params, timeout)
+                else:
+                    cursor.execute(str(sql_query), params or None)
                 if cursor.description:
                     results = cursor.fetchall()
                     cols = [desc[0] for desc in cursor.description]
@@ -56,12 +84,105 @@ class PostgreSQLDatabase:
                     conn.commit()
                     self.logger.info('Query executed successfully (no results): %s', sql_query)
                     return None, None
+        except errors.QueryCanceled as e:
+            conn.rollback()
+            if not timeout:
+                self.logger.error('Error executing query: %s', e)
+                return None, None
+            self.logger.error('Query timed out after %ss: %s', timeout, sql_query)
+            raise QueryTimeout(f"timed out after {timeout}s") from e
         except Exception as e:
             self.logger.error('Error executing query: %s', e)
             traceback.print_exc()
             if conn:
                 conn.rollback()
-            return None
+            return None, None
+        finally:
+            if conn:
+                self.connection_pool.putconn(conn)
+
+    def iter_query(self, sql_query, params: tuple = (), batch_size: int = 1000, timeout: float = None):
+        """Stream the results of a query in (rows, cols) batches using a named server-side cursor.
+
+        The pooled connection is held until the generator is exhausted or closed.
+        Errors are logged and re-raised so that a partial result is never mistaken for a complete one.
+        With timeout (seconds) every statement of the cursor transaction, each FETCH included, is
+        cancelled by the server after that time and QueryTimeout is raised.
+        """
+        if not self.connection_pool:
+            self.logger.error('Connection pool is not initialized')
+            return
+
+        conn = None
+        try:
+            conn = self.connection_pool.getconn()
+            with conn.cursor() as cursor:
+                # SET LOCAL holds for the transaction of the named cursor below
+                self._statement_timeout(cursor, timeout)
+            with conn.cursor(name=f"hms_util_{uuid.uuid4().hex}") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(str(sql_query), params or None)
+                cols = None
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if cols is None:
+                        cols = [desc[0] for desc in cursor.description]
+                    if not rows:
+                        break
+                    yield rows, cols
+            conn.commit()
+            self.logger.debug('Streaming query executed successfully: %s', sql_query)
+        except errors.QueryCanceled as e:
+            conn.rollback()
+            if not timeout:
+                self.logger.error('Error executing streaming query: %s', e)
+                raise
+            self.logger.error('Streaming query timed out after %ss: %s', timeout, sql_query)
+            raise QueryTimeout(f"timed out after {timeout}s") from e
+        except Exception as e:
+            self.logger.error('Error executing streaming query: %s', e)
+            if conn:
+                conn.rollback()
+            raise
         finally:
             if conn:
+                if conn.status != psycopg2.extensions.STATUS_READY:
+                    # generator closed before the end of the result set
+                    conn.rollback()
                 self.connection_pool.putconn(conn)
+
+    def _execute_prepared(self, conn, cursor, statement, params, timeout=None):
+        name = statement.statement_name
+        if name in self.unpreparable:
+            cursor.execute(statement.sql, params or None)
+            return
+
+        key = (id(conn), conn.get_backend_pid())
+        with self.prepared_lock:
+            prepared = self.prepared_cache.setdefault(key, set())
+        for attempt in range(2):
+            if name not in prepared:
+                try:
+                    cursor.execute(f"PREPARE {name} AS {statement.prepare_sql}")
+                except psycopg2.Error as e:
+                    # e.g. parameters whose type the server cannot infer. Bind on the client instead
+                    self.logger.debug('Cannot prepare %s (%s), using client side binding', statement.name, e)
+                    conn.rollback()
+                    self._statement_timeout(cursor, timeout)
+                    self.unpreparable.add(name)
+                    cursor.execute(statement.sql, params or None)
+                    return
+                prepared.add(name)
+            try:
+                if params:
+                    cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+                else:
+                    cursor.execute(f"EXECUTE {name}")
+                return
+            except psycopg2.Error as e:
+                # 26000: the statement is gone from the session, prepare it again once
+                if e.pgcode != '26000' or attempt == 1:
+                    raise
+                conn.rollback()
+                self._statement_timeout(cursor, timeout)
+                prepared.discard(name)
@@ -0,0 +1,101 @@
+import os
+import re
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# {name} placeholders of the .queries files
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+# single quoted SQL literals, '' is an escaped quote inside a literal
+SQL_LITERAL = re.compile(r"('(?:[^']|'')*')")
+# marks a bind parameter while a template is being compiled
+PARAM_MARK = "\x00"
+
+
+def compile_template(template, db_type):
+    """Compile a .queries template into bind parameter form for one SQL dialect.
+
+    '{name}' and {name} become bind parameters. A placeholder embedded in a longer literal,
+    like '{db_location_uri}%', becomes a concatenation of the parameter and the literal text.
+    Returns (sql, prepare_sql, param_names): sql uses %s for the python drivers, prepare_sql
+    uses $n (postgresql PREPARE) or ? (mysql prepared cursors).
+    """
+    names = []
+    out = []
+    for token in SQL_LITERAL.split(template):
+        if len(token) >= 2 and token.startswith("'") and token.endswith("'"):
+            parts = PLACEHOLDER.split(token[1:-1])
+            if len(parts) == 1:
+                out.append(token)
+                continue
+            terms = []
+            for idx, part in enumerate(parts):
+                if idx % 2 == 1:
+                    names.append(part)
+                    terms.append(PARAM_MARK)
+                elif part:
+                    terms.append(f"'{part}'")
+            if len(terms) == 1:
+                out.append(terms[0])
+            elif db_type == 'mysql':
+                out.append(f"CONCAT({', '.join(terms)})")
+            else:
+                out.append(f"({' || '.join(terms)})")
+        else:
+            def mark(match):
+                names.append(match.group(1))
+                return PARAM_MARK
+            out.append(PLACEHOLDER.sub(mark, token))
+    marked = ''.join(out)
+
+    if db_type == 'mysql':
+        # mysql.connector substitutes %s without unescaping %%
+        sql = marked.replace(PARAM_MARK, '%s')
+        prepare_sql = marked.replace(PARAM_MARK, '?')
+    else:
+        # psycopg2 needs literal % escaped as soon as parameters are passed
+        sql = marked.replace('%', '%%') if names else marked
+        sql = sql.replace(PARAM_MARK, '%s')
+        pieces = marked.split(PARAM_MARK)
+        prepare_sql = pieces[0] + ''.join(f"${idx}{piece}" for idx, piece in enumerate(pieces[1:], start=1))
+    return sql, prepare_sql, names
+
+
+class PreparedQuery:
+    """A named query of a .queries file, compiled once into bind parameter form."""
+
+    def __init__(self, name, template, db_type):
+        self.name = name
+        self.template = template
+        self.db_type = db_type
+        self.sql, self.prepare_sql, self.param_names = compile_template(template, db_type)
+        self.statement_name = "hms_" + hashlib.md5(self.prepare_sql.encode('utf-8')).hexdigest()[:16]
+
+    def params(self, **values):
+        """Bind parameters in statement order. Values that the query does not use are ignored."""
+        return tuple(values[name] for name in self.param_names)
+
+    def __str__(self):
+        return self.sql
+
+
+class QueryRegistry:
+    """Loads and compiles the .queries files of one database type. Each file is compiled once."""
+
+    def __init__(self, queries_dir, db_type):
+        self.queries_dir = queries_dir
+        self.db_type = db_type
+        self.logger = logger
+        self.query_files = {}
+
+    def load(self, query_file):
+        if query_file not in self.query_files:
+            filename = os.path.join(self.queries_dir, self.db_type, query_file)
+            with open(filename, 'r') as file:
+                templates = json.load(file)
+            self.query_files[query_file] = {name: PreparedQuery(name, template, self.db_type)
+                                            for name, template in templates.items()}
+            self.logger.debug(f"Compiled {len(templates)} queries from {filename}")
+        return self.query_files[query_file]
@@ -0,0 +1,53 @@
+import time
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from databaseInterface import QueryTimeout
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRunner:
+    """Runs the independent queries of a summary or report concurrently.
+
+    Up to workers queries run at the same time, each on its own connection of the dbo pool
+    (the pool must have at least workers connections). With a timeout (seconds, 0 for none)
+    every query gets its own statement timeout, a query that runs longer is cancelled by the
+    server and reported with status 'timeout' while the others complete.
+    """
+
+    def __init__(self, workers=1, timeout=0):
+        self.logger = logger
+        self.workers = max(1, workers)
+        self.timeout = timeout
+
+    def _run_one(self, dbo, query_name, query, params):
+        start = time.time()
+        try:
+            if self.timeout:
+                rows, cols = dbo.query(query, params, timeout=self.timeout)
+            else:
+                rows, cols = dbo.query(query, params)
+            status = 'ok' if cols else 'failed'
+        except QueryTimeout:
+            rows, cols, status = None, None, 'timeout'
+        except Exception as e:
+            traceback.print_exc()
+            self.logger.error(f"Query {query_name} failed: {e}")
+            rows, cols, status = None, None, 'failed'
+        self.logger.debug(f"Query {query_name}: {status} in {time.time() - start:.1f}s")
+        return rows, cols, status
+
+    def run(self, dbo, queries, **values):
+        """Run {name: PreparedQuery} bound with query.params(**values).
+
+        Returns {name: (rows, cols, status)} in the order of queries, status is 'ok', 'failed'
+        or 'timeout'.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="query") as executor:
+            futures = {}
+            for query_name, query in queries.items():
+                params = query.params(**values)
+                self.logger.debug(f"Executing query {query_name} : {query} {params}")
+                futures[query_name] = executor.submit(self._run_one, dbo, query_name, query, params)
+            return {query_name: future.result() for query_name, future in futures.items()}
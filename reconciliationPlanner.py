@@ -0,0 +1,142 @@
+import time
+import logging
+from viewDependencies import order_views
+
+logger = logging.getLogger(__name__)
+
+# statements are replayed phase by phase: dependents are dropped before what they select
+# from, and created after it
+PHASES = (
+    ('drop_views', "Drop views"),
+    ('drop_tables', "Drop tables"),
+    ('drop_functions', "Drop functions"),
+    ('create_functions', "Create functions"),
+    ('create_tables', "Create tables"),
+    ('alter_tables', "Alter tables"),
+    ('create_views', "Create or replace views"),
+    ('manual', "Changes that need a manual step"),
+)
+
+
+class ReconciliationPlan:
+    """Collects the changes that turn one schema into another and orders them for replay.
+
+    Column changes are grouped per table: added columns become one ADD COLUMNS, and a table
+    that loses columns gets one REPLACE COLUMNS with its complete new column list instead of
+    separate statements. Views are dropped in reverse and created in dependency order.
+    """
+
+    def __init__(self):
+        self.logger = logger
+        self.views_to_drop = {}
+        self.tables_to_drop = []
+        self.functions_to_drop = []
+        self.functions_to_create = []
+        self.tables_to_create = []
+        self.table_changes = {}
+        self.views_to_create = {}
+        self.manual = []
+
+    def _table(self, schema_name, table_name):
+        key = f"{schema_name}.{table_name}"
+        if key not in self.table_changes:
+            self.table_changes[key] = {'add_columns': [], 'replace_columns': None, 'change_columns': [], 'alters': []}
+        return self.table_changes[key]
+
+    def drop_view(self, schema_name, view_name, view_text):
+        self.views_to_drop.setdefault(schema_name, []).append((view_name, view_text))
+
+    def drop_table(self, schema_name, table_name):
+        self.tables_to_drop.append(f"DROP TABLE IF EXISTS {schema_name}.{table_name};")
+
+    def drop_function(self, schema_name, function_name):
+        self.functions_to_drop.append(f"DROP FUNCTION IF EXISTS {schema_name}.{function_name};")
+
+    def create_function(self, statement):
+        self.functions_to_create.append(statement)
+
+    def create_table(self, statement):
+        self.tables_to_create.append(statement)
+
+    def create_view(self, schema_name, view_name, view_text):
+        self.views_to_create.setdefault(schema_name, []).append((view_name, view_text))
+
+    def add_columns(self, schema_name, table_name, columns):
+        self._table(schema_name, table_name)['add_columns'].extend(columns)
+
+    def replace_columns(self, schema_name, table_name, columns):
+        self._table(schema_name, table_name)['replace_columns'] = list(columns)
+
+    def change_column(self, schema_name, table_name, clause):
+        self._table(schema_name, table_name)['change_columns'].append(clause)
+
+    def alter_table(self, schema_name, table_name, clause):
+        self._table(schema_name, table_name)['alters'].append(clause)
+
+    def manual_step(self, reason, statement):
+        self.manual.append(f"-- {reason}: {statement}")
+
+    def _alter_statements(self):
+        statements = []
+        for table, changes in self.table_changes.items():
+            if changes['replace_columns'] is not None:
+                # the new column list covers added, renamed, retyped and moved columns
+                columns = ', '.join(f"{name} {data_type}" for name, data_type in changes['replace_columns'])
+                statements.append(f"ALTER TABLE {table} REPLACE COLUMNS ({columns});")
+            else:
+                if changes['add_columns']:
+                    columns = ', '.join(f"{name} {data_type}" for name, data_type in changes['add_columns'])
+                    statements.append(f"ALTER TABLE {table} ADD COLUMNS ({columns});")
+                for clause in changes['change_columns']:
+                    statements.append(f"ALTER TABLE {table} {clause};")
+            for clause in changes['alters']:
+                statements.append(f"ALTER TABLE {table} {clause};")
+        return statements
+
+    def phases(self):
+        """Return [(phase, title, statements)] in replay order."""
+        drop_views = []
+        for schema_name, views in self.views_to_drop.items():
+            ordered = order_views([(name, None, text) for name, text in views], schema_name)
+            drop_views.extend(f"DROP VIEW IF EXISTS {schema_name}.{name};" for name, _, _ in reversed(ordered))
+        create_views = []
+        for schema_name, views in self.views_to_create.items():
+            ordered = order_views([(name, None, text) for name, text in views], schema_name)
+            create_views.extend(f"CREATE OR REPLACE VIEW {schema_name}.{name} AS {text};" for name, _, text in ordered)
+        statements = {
+            'drop_views': drop_views,
+            'drop_tables': self.tables_to_drop,
+            'drop_functions': self.functions_to_drop,
+            'create_functions': self.functions_to_create,
+            'create_tables': self.tables_to_create,
+            'alter_tables': self._alter_statements(),
+            'create_views': create_views,
+            'manual': self.manual,
+        }
+        return [(phase, title, statements[phase]) for phase, title in PHASES]
+
+    def statements(self):
+        return [statement for _, _, statements in self.phases() for statement in statements]
+
+    def summary(self):
+        """{phase: number of statements}, plus the number of tables with column or property changes."""
+        counts = {phase: len(statements) for phase, _, statements in self.phases()}
+        counts['altered_tables'] = len(self.table_changes)
+        return counts
+
+    def write(self, path, title="Schema reconciliation"):
+        """Write the plan as a .sql file that can be replayed with beeline -f."""
+        phases = self.phases()
+        with open(path, 'w') as fd:
+            fd.write(f"-- {title}\n-- generated {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+            for phase, phase_title, statements in phases:
+                fd.write(f"-- {phase_title}: {len(statements)}\n")
+            fd.write(f"-- Tables altered: {len(self.table_changes)}\n")
+            for phase, phase_title, statements in phases:
+                if not statements:
+                    continue
+                fd.write(f"\n-- {phase_title}\n")
+                for statement in statements:
+                    fd.write(statement + "\n")
+        self.logger.info(f"Reconciliation script with {sum(len(s) for _, _, s in phases)} statements saved to {path}")
+        return path
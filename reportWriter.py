@@ -1,6 +1,9 @@
+import io
+import os
 import csv
+import html
 import logging
-import os
+import itertools
 logger = logging.getLogger(__name__)
 
 class ReportWriter:
@@ -19,6 +22,17 @@ class ReportWriter:
             self.logger.error(f"Error writing CSV file {filename}: {e}")
             raise
 
+    def write_csv_table(self, columns, records, filename):
+        try:
+            with open(filename, 'w', newline='') as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(columns)
+                writer.writerows(records)
+            self.logger.info(f"CSV file written successfully to {filename}")
+        except IOError as e:
+            self.logger.error(f"Error writing CSV file {filename}: {e}")
+            raise
+
     def write_md_file(self, data, filename):
         try:
             keys = list(data.keys())
@@ -40,47 +54,80 @@ class ReportWriter:
             self.logger.error(f"Error writing Markdown file {filename}: {e}")
             raise
 
+    @staticmethod
+    def _md_cell(value):
+        # a | or a line break inside a value would split the markdown row
+        return str(value).replace('|', '\\|').replace('\n', ' ')
+
+    def write_tables(self, handles, query_name, columns, records, failed=None):
+        """Stream one query result to the open report files of every format in one pass.
+
+        handles is {'md': fd, 'html': fd} with the formats to write. records can be any
+        iterable of rows, it is read once and rows are written as they come, so no rendering of
+        the table is held in memory. HTML cells and headers are escaped. Returns the row count.
+        When reading records raises, the table is closed with a row holding failed(error)
+        ("FAILED: <error>" by default) and the error is re-raised, the report stays well formed.
+        """
+        md_fd = handles.get('md')
+        html_fd = handles.get('html')
+        failed = failed or (lambda error: f"FAILED: {error}")
+        rows = iter(records or ())
+        error = None
+        try:
+            first = next(rows, None)
+        except Exception as e:
+            first, error = None, e
+        if first is None and error is None:
+            if md_fd:
+                md_fd.write(f"## {query_name}\n> ** Results empty**\n\n")
+            if html_fd:
+                html_fd.write(f"\n<h2> {html.escape(query_name)} </h2>\n<p><strong>Results empty</strong></p>")
+            return 0
+
+        columns = columns or ['status']
+        if md_fd:
+            md_columns = [self._md_cell(column).upper() for column in columns]
+            md_fd.write(f"## {query_name}\n\n{' | '.join(md_columns)}\n{' | '.join(':---' for _ in md_columns)}\n")
+        if html_fd:
+            header_row = "<thead><tr>" + "".join(f"<th>{html.escape(str(column).upper())}</th>" for column in columns) + "</tr></thead>"
+            html_fd.write(f"\n<h2> {html.escape(query_name)} </h2>\n\n<table id=\"{html.escape(query_name)}\" class=\"display\">\n{header_row}\n<tbody>\n")
+
+        def write_row(row):
+            if md_fd:
+                md_fd.write(" | ".join(self._md_cell(value) for value in row) + "\n")
+            if html_fd:
+                html_fd.write("<tr>" + "".join(f"<td>{html.escape(str(value))}</td>" for value in row) + "</tr>\n")
+
+        count = 0
+        row = first
+        while row is not None:
+            write_row(row)
+            count += 1
+            try:
+                row = next(rows, None)
+            except Exception as e:
+                row, error = None, e
+        if error is not None:
+            write_row([failed(error)] + [''] * (len(columns) - 1))
+        if md_fd:
+            md_fd.write("\n\n")
+        if html_fd:
+            html_fd.write("</tbody>\n</table>\n<br><br>")
+        if error is not None:
+            self.logger.error(f"Query {query_name} failed after {count} rows: {error}")
+            raise error
+        self.logger.info(f"{count} rows written for query: {query_name}")
+        return count
+
     def tuples_to_html_table(self, query_name, columns, records):
-        if not records:
-            return f"\n<h2> {query_name} </h2>\n<p><strong>Results empty</strong></p>"
-
-        table_header = f"\n<h2> {query_name} </h2>\n"
-        table_footer = "<br><br>"
-        header_row = "<thead><tr>" + "".join(f"<th>{column.upper()}</th>" for column in columns) + "</tr></thead>"
-
-        rows = []
-        for row in records:
-            values = [str(value) for value in row]
-            row_html = "<tr>" + "".join(f"<td>{value}</td>" for value in values) + "</tr>"
-            rows.append(row_html)
-
-        html_table = f"""<table id="{query_name}" class="display">
-{header_row}
-<tbody>
-{''.join(rows)}
-</tbody>
-</table>"""
-        self.logger.info(f"HTML table generated for query: {query_name}")
-        return "\n".join([table_header, html_table, table_footer])
+        buffer = io.StringIO()
+        self.write_tables({'html': buffer}, query_name, columns, records)
+        return buffer.getvalue()
 
     def tuples_to_markdown_table(self, query_name, columns, records):
-        if not records:
-            return f"## {query_name}\n> ** Results empty**"
-
-        table_header = f"## {query_name}\n"
-        table_footer = "\n\n"
-        columns = [column.upper() for column in columns]
-        header_row = " | ".join(columns) if columns else ""
-        header_separator = " | ".join([":---" for _ in columns]) if columns else ""
-
-        rows = []
-        for row in records:
-            values = [str(value) for value in row]
-            rows.append(" | ".join(values))
-
-        markdown_table = "\n".join([table_header, header_row, header_separator] + rows + [table_footer])
-        self.logger.info(f"Markdown table generated for query: {query_name}")
-        return markdown_table
+        buffer = io.StringIO()
+        self.write_tables({'md': buffer}, query_name, columns, records)
+        return buffer.getvalue()
 
     def write_section1(self, hfd, title):
         try:
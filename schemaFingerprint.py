@@ -0,0 +1,71 @@
+import json
+import hashlib
+
+# attributes of each object type that HiveSchemaComparator looks at, per compare option
+COMPARED_KEYS = {
+    'tables': [
+        ('compare_columns', ['columns', 'column_list', 'data_types']),
+        ('compare_serdes', ['serde']),
+        ('compare_location', ['location']),
+        ('compare_primary_key', ['primary_key']),
+        ('compare_bucket', ['bucket', 'clustered_by']),
+    ],
+    'udfs': [
+        (None, ['class']),
+    ],
+    'functions': [
+        (None, ['class']),
+    ],
+    'views': [
+        (None, ['definition']),
+    ],
+}
+
+
+def compared_keys(config, object_type):
+    """Keys of an object that take part in the compare, following the [compare] options."""
+    keys = []
+    for option, option_keys in COMPARED_KEYS.get(object_type, []):
+        # same test as HiveSchemaComparator._compare_attributes
+        if option is None or config.get_property('compare', option, True):
+            keys.extend(option_keys)
+    return keys
+
+
+def object_fingerprint(obj, keys):
+    """sha256 of the canonical JSON of the compared keys of a table or view dict.
+
+    Two objects with the same fingerprint have no attribute differences. The key list is part
+    of the hash, so fingerprints taken with different compare options never match.
+    """
+    content = {'keys': keys, 'values': {key: obj.get(key) for key in keys}}
+    canonical = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def fingerprint_object(obj, object_type, config):
+    """Store the fingerprint of a table or view dict in it, unless it already has one."""
+    if obj is not None and 'fingerprint' not in obj:
+        keys = compared_keys(config, object_type)
+        obj['fingerprint'] = object_fingerprint(obj, keys) if keys else object_fingerprint(obj, sorted(obj))
+    return obj
+
+
+def add_fingerprints(db_schema, config):
+    """Store a fingerprint in every table and view dict, and one per schema over all of them."""
+    for schema in db_schema.get('schemas', {}).values():
+        digest = hashlib.sha256()
+        for object_type in ('tables', 'views', 'udfs', 'functions'):
+            objects = schema.get(object_type) or {}
+            for name in sorted(objects):
+                # stores that spill to disk hand out fingerprints without loading the object
+                if hasattr(objects, 'fingerprint'):
+                    fingerprint = objects.fingerprint(name)
+                else:
+                    obj = fingerprint_object(objects[name], object_type, config)
+                    fingerprint = obj['fingerprint'] if obj is not None else None
+                if fingerprint is None:
+                    continue
+                digest.update(f"{object_type}\0{name}\0{fingerprint}\n".encode('utf-8'))
+        schema['fingerprint'] = digest.hexdigest()
+    return db_schema
@@ -0,0 +1,91 @@
+import os
+import json
+import mmap
+import time
+import logging
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 'hms_util.schema_snapshot'
+SNAPSHOT_VERSION = 1
+OBJECT_TYPES = ('tables', 'views', 'udfs', 'functions')
+
+
+def save_snapshot(db_schema, catalog, path, source=None):
+    """Write the db_schema of get_database_schema as a JSON-lines snapshot.
+
+    Line 1 is a header with the format version, catalog, database properties and catalog
+    fingerprints. Every object (table, view, function) follows on its own line, and the last
+    line is an index of [name, offset, length, fingerprint] per schema and object type, so a
+    loader can map the file and parse only the objects it needs.
+    """
+    index = {}
+    with open(path, 'wb') as fd:
+        header = {
+            'format': SNAPSHOT_FORMAT,
+            'version': SNAPSHOT_VERSION,
+            'catalog': catalog,
+            'source': source,
+            'created': time.time(),
+            'properties': db_schema.get('properties'),
+            'fingerprints': {name: schema.get('fingerprint') for name, schema in db_schema.get('schemas', {}).items()},
+        }
+        fd.write(json.dumps(header, default=str).encode('utf-8') + b"\n")
+        for schema_name, schema in db_schema.get('schemas', {}).items():
+            index[schema_name] = {}
+            for object_type in OBJECT_TYPES:
+                if object_type not in schema:
+                    continue
+                entries = index[schema_name][object_type] = []
+                for name, obj in schema[object_type].items():
+                    # objects that failed to extract are kept as null, like in db_schema
+                    line = json.dumps({'schema': schema_name, 'type': object_type, 'name': name, 'data': obj}, default=str).encode('utf-8') + b"\n"
+                    entries.append([name, fd.tell(), len(line), obj.get('fingerprint') if obj else None])
+                    fd.write(line)
+        fd.write(json.dumps({'index': index}).encode('utf-8') + b"\n")
+    logger.info(f"Schema snapshot of {catalog} saved to {path}")
+    return path
+
+
+class SnapshotObjects(Mapping):
+    """Read-only mapping of the objects of one type in a snapshot. Objects are parsed on access."""
+
+    def __init__(self, mm, entries):
+        self.mm = mm
+        self.entries = {name: (offset, length, fingerprint) for name, offset, length, fingerprint in entries}
+
+    def __getitem__(self, name):
+        offset, length, _ = self.entries[name]
+        return json.loads(self.mm[offset:offset + length])['data']
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def fingerprint(self, name):
+        return self.entries[name][2]
+
+
+def load_snapshot(path):
+    """Map a snapshot file and return it in the db_schema layout of get_database_schema."""
+    with open(path, 'rb') as fd:
+        mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    header = json.loads(mm[:mm.find(b"\n") + 1])
+    if header.get('format') != SNAPSHOT_FORMAT or header.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} schema snapshot")
+    index = json.loads(mm[mm.rfind(b"\n", 0, len(mm) - 1) + 1:])['index']
+
+    db_schema = {'catalog': header['catalog'], 'schemas': {}}
+    if header.get('properties') is not None:
+        db_schema['properties'] = header['properties']
+    for schema_name, object_types in index.items():
+        schema = db_schema['schemas'][schema_name] = {}
+        for object_type, entries in object_types.items():
+            schema[object_type] = SnapshotObjects(mm, entries)
+        if header['fingerprints'].get(schema_name):
+            schema['fingerprint'] = header['fingerprints'][schema_name]
+    logger.info(f"Loaded schema snapshot of {header['catalog']} from {path} ({os.path.getsize(path)} bytes)")
+    return db_schema
@@ -0,0 +1,96 @@
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+TREND_COLUMNS = ['catalog', 'key', 'runs', 'first_run', 'last_run', 'first', 'last', 'delta', 'growth_pct', 'per_day', 'last_delta']
+
+
+def _number(value):
+    """Numeric value of a summary entry, None for text like the hive version or owner lists."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _run_label(run_time):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run_time))
+
+
+class SummaryHistory:
+    """History of summary runs in a local sqlite file, one row per run, catalog and key.
+
+    Every summary run appends its results keyed by the run time (the signature of the run),
+    so growth can be followed over time from the file alone: trend() needs no connection to
+    the metastore. Values are kept as text, numeric values also as numbers for the trend.
+    """
+
+    def __init__(self, path):
+        self.logger = logger
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS summary_history (
+            run_time INTEGER NOT NULL, catalog TEXT NOT NULL, key TEXT NOT NULL, value TEXT, number REAL,
+            PRIMARY KEY (catalog, run_time, key))""")
+        self.db.commit()
+
+    def append(self, run_time, catalog, summary):
+        """Store the {key: value} summary of one catalog. A repeated run time replaces its values."""
+        rows = [(run_time, catalog, str(key), None if value is None else str(value), _number(value))
+                for key, value in summary.items()]
+        with self.lock:
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO summary_history VALUES (?, ?, ?, ?, ?)", rows)
+        self.logger.info(f"Summary of {catalog} added to the history {self.path}")
+
+    def catalogs(self):
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT DISTINCT catalog FROM summary_history ORDER BY catalog")]
+
+    def run_times(self, catalog, runs=None):
+        """The last runs run times of catalog, oldest first."""
+        with self.lock:
+            rows = self.db.execute("SELECT DISTINCT run_time FROM summary_history WHERE catalog = ? ORDER BY run_time DESC LIMIT ?",
+                                   (catalog, runs or -1)).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def trend(self, catalogs=None, runs=10):
+        """Deltas and growth of the numeric summary keys over the last runs runs of each catalog.
+
+        Returns rows of TREND_COLUMNS: values of the first and last run, their delta, growth in
+        percent of the first value, delta per day between the two runs and the delta to the run
+        before the last one. Keys that exist in only one run have no deltas.
+        """
+        records = []
+        for catalog in catalogs or self.catalogs():
+            run_times = self.run_times(catalog, runs)
+            if not run_times:
+                self.logger.warning(f"No summary history for {catalog}")
+                continue
+            with self.lock:
+                rows = self.db.execute("SELECT key, run_time, number FROM summary_history WHERE catalog = ? AND run_time >= ? AND number IS NOT NULL ORDER BY key, run_time",
+                                       (catalog, run_times[0])).fetchall()
+            series = {}
+            for key, run_time, number in rows:
+                series.setdefault(key, []).append((run_time, number))
+            for key, points in series.items():
+                (first_run, first), (last_run, last) = points[0], points[-1]
+                delta = growth = per_day = last_delta = None
+                if len(points) > 1:
+                    delta = last - first
+                    growth = round(100 * delta / first, 2) if first else None
+                    per_day = round(delta * 86400 / (last_run - first_run), 2) if last_run > first_run else None
+                    last_delta = last - points[-2][1]
+                records.append((catalog, key, len(points), _run_label(first_run), _run_label(last_run),
+                                first, last, delta, growth, per_day, last_delta))
+        return records
+
+    def close(self):
+        with self.lock:
+            self.db.close()
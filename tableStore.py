@@ -0,0 +1,112 @@
+import os
+import json
+import sqlite3
+import logging
+import tempfile
+import weakref
+from collections.abc import MutableMapping
+
+logger = logging.getLogger(__name__)
+
+# a table dict takes several times the size of its JSON text as Python objects
+PYTHON_OVERHEAD = 4
+COMMIT_INTERVAL = 1000
+
+
+def _remove_spill_file(db, path):
+    db.close()
+    if os.path.isfile(path):
+        os.remove(path)
+
+
+class TableStore(MutableMapping):
+    """Mapping of table name to table dict with a memory budget.
+
+    Tables are kept in memory until their estimated size reaches budget_bytes, later tables
+    spill to a temporary sqlite file in spill_dir as JSON. Names and fingerprints always stay
+    in memory, so the comparator can skip identical tables and walk both sides by name while
+    only one spilled table at a time is decoded. Objects must carry their fingerprint when
+    they are stored, a spilled object that is changed after it was read is not written back.
+    The spill file is removed when the store is closed or garbage collected.
+    """
+
+    def __init__(self, budget_bytes, spill_dir=None):
+        self.logger = logger
+        self.budget_bytes = budget_bytes
+        self.spill_dir = spill_dir or None
+        self.memory = {}
+        self.sizes = {}
+        self.fingerprints = {}
+        self.used = 0
+        self.db = None
+        self.path = None
+        self.pending = 0
+        self.finalizer = None
+
+    def _spill_db(self):
+        if self.db is None:
+            fd, self.path = tempfile.mkstemp(prefix='hms_util_tables_', suffix='.sqlite', dir=self.spill_dir)
+            os.close(fd)
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode = OFF")
+            self.db.execute("PRAGMA synchronous = OFF")
+            self.db.execute("CREATE TABLE objects (name TEXT PRIMARY KEY, data TEXT)")
+            self.finalizer = weakref.finalize(self, _remove_spill_file, self.db, self.path)
+            self.logger.info(f"Memory budget of {self.budget_bytes // (1024 * 1024)} MB reached after {len(self.memory)} tables, spilling to {self.path}")
+        return self.db
+
+    def __setitem__(self, name, obj):
+        if name in self.fingerprints:
+            del self[name]
+        self.fingerprints[name] = obj.get('fingerprint') if obj else None
+        data = json.dumps(obj, default=str)
+        size = len(data) * PYTHON_OVERHEAD
+        if self.db is None and self.used + size <= self.budget_bytes:
+            self.memory[name] = obj
+            self.sizes[name] = size
+            self.used += size
+            return
+        self._spill_db().execute("INSERT INTO objects (name, data) VALUES (?, ?)", (name, data))
+        self.pending += 1
+        if self.pending >= COMMIT_INTERVAL:
+            self.db.commit()
+            self.pending = 0
+
+    def __getitem__(self, name):
+        if name in self.memory:
+            return self.memory[name]
+        if self.db is not None and name in self.fingerprints:
+            row = self.db.execute("SELECT data FROM objects WHERE name = ?", (name,)).fetchone()
+            if row is not None:
+                return json.loads(row[0])
+        raise KeyError(name)
+
+    def __delitem__(self, name):
+        if name not in self.fingerprints:
+            raise KeyError(name)
+        del self.fingerprints[name]
+        if name in self.memory:
+            del self.memory[name]
+            self.used -= self.sizes.pop(name)
+        elif self.db is not None:
+            self.db.execute("DELETE FROM objects WHERE name = ?", (name,))
+
+    def __iter__(self):
+        return iter(self.fingerprints)
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def __contains__(self, name):
+        return name in self.fingerprints
+
+    def fingerprint(self, name):
+        return self.fingerprints[name]
+
+    def spilled(self):
+        return len(self.fingerprints) - len(self.memory)
+
+    def close(self):
+        if self.finalizer is not None:
+            self.finalizer()
+        self.db = None
@@ -0,0 +1,76 @@
+import os
+import sys
+import gzip
+import hashlib
+import tempfile
+import unittest
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+from backupWriter import BackupWriter, BackupReader, zstandard
+
+TABLES = [f"CREATE TABLE `sales`.`t{idx}` (`id` int);\n" for idx in range(5)]
+
+
+def decompress(path, compression):
+    with open(path, 'rb') as fd:
+        if compression == 'gzip':
+            return gzip.decompress(fd.read())
+        with zstandard.ZstdDecompressor().stream_reader(fd, read_across_frames=True) as stream:
+            return stream.read()
+
+
+class BackupWriterResumeTest(unittest.TestCase):
+    def resume(self, compression, shard_tables, checkpoint_after):
+        """Write checkpoint_after tables, checkpoint, write a partial table, crash, resume and finish."""
+        with tempfile.TemporaryDirectory() as directory:
+            output_file = os.path.join(directory, 'sales_backup.ddl')
+            writer = BackupWriter(output_file, compression=compression, shard_tables=shard_tables)
+            writer.start()
+            for text in TABLES[:checkpoint_after]:
+                writer.write_table(text)
+            position = writer.checkpoint()
+            # a table and part of the next are written after the checkpoint and lost in the crash
+            writer.write_table(TABLES[checkpoint_after])
+            writer.begin_table()
+            writer.write("CREATE TABLE `sales`.`partial`")
+            writer.raw.flush()
+            writer.abort()
+
+            writer = BackupWriter(output_file, compression=compression, shard_tables=shard_tables)
+            writer.resume(position)
+            extents = [writer.write_table(text) for text in TABLES[checkpoint_after:]]
+            shards = writer.close()
+
+            files = sorted(os.listdir(directory))
+            self.assertEqual(files, [shard['file'] for shard in shards])
+            text = b''.join(decompress(os.path.join(directory, shard['file']), compression) for shard in shards)
+            self.assertEqual(text.decode('utf-8'), ''.join(TABLES))
+            self.assertEqual(sum(shard['tables'] for shard in shards), len(TABLES))
+            for shard in shards:
+                with open(os.path.join(directory, shard['file']), 'rb') as fd:
+                    data = fd.read()
+                self.assertEqual((len(data), hashlib.sha256(data).hexdigest()), (shard['stored_bytes'], shard['sha256']))
+
+            reader = BackupReader(directory, [shard['file'] for shard in shards], compression)
+            try:
+                self.assertEqual([reader.read(extent) for extent in extents], TABLES[checkpoint_after:])
+            finally:
+                reader.close()
+
+    def check_resume(self, compression):
+        # (shard_tables, tables written before the checkpoint)
+        for shard_tables, checkpoint_after in [(0, 1), (0, 3), (2, 1), (2, 2), (2, 3)]:
+            with self.subTest(shard_tables=shard_tables, checkpoint_after=checkpoint_after):
+                self.resume(compression, shard_tables, checkpoint_after)
+
+    def test_resume_gzip(self):
+        self.check_resume('gzip')
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_resume_zstd(self):
+        self.check_resume('zstd')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import sys
+import unittest
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+from columnDiff import parse_type, compare_types, diff_columns, SAME, WIDENING, INCOMPATIBLE
+
+PARSE_CASES = [
+    ('int', ('int', ())),
+    ('INTEGER', ('int', ())),
+    ('decimal', ('decimal', (10, 0))),
+    ('decimal(5)', ('decimal', (5, 0))),
+    ('decimal(12, 2)', ('decimal', (12, 2))),
+    ('varchar(20)', ('varchar', (20,))),
+    ('array<struct<a:int>>', ('array', (('struct', (('a', ('int', ())),)),))),
+    ('struct<`a b`:int,C:varchar(10)>', ('struct', (('a b', ('int', ())), ('c', ('varchar', (10,)))))),
+    ('map<string,decimal(10,2)>', ('map', (('string', ()), ('decimal', (10, 2))))),
+    ('what<', ('unknown', ('what<',))),
+]
+
+# (old type, new type, change)
+CHANGE_CASES = [
+    ('decimal(10,2)', 'decimal(10,2)', SAME),
+    ('decimal', 'decimal(10,0)', SAME),
+    ('decimal(10,2)', 'decimal(12,2)', WIDENING),
+    ('decimal(10,2)', 'decimal(11,3)', WIDENING),
+    ('decimal(10,2)', 'decimal(10,3)', INCOMPATIBLE),
+    ('decimal(10,2)', 'decimal(9,2)', INCOMPATIBLE),
+    ('int', 'decimal(10,0)', WIDENING),
+    ('bigint', 'decimal(18,0)', INCOMPATIBLE),
+    ('decimal(10,2)', 'double', INCOMPATIBLE),
+    ('int', 'bigint', WIDENING),
+    ('bigint', 'int', INCOMPATIBLE),
+    ('varchar(10)', 'varchar(20)', WIDENING),
+    ('varchar(20)', 'varchar(10)', INCOMPATIBLE),
+    ('date', 'string', WIDENING),
+    ('struct<a:int,b:string>', 'struct<a:bigint,b:string>', WIDENING),
+    ('struct<a:int,b:string>', 'struct<a:int,b:string,c:int>', WIDENING),
+    ('struct<a:int,b:string>', 'struct<c:int,a:int,b:string>', INCOMPATIBLE),
+    ('struct<a:int,b:string>', 'struct<a:int>', INCOMPATIBLE),
+    ('struct<a:decimal(10,2)>', 'struct<a:decimal(12,2)>', WIDENING),
+    ('array<struct<a:int>>', 'array<struct<a:bigint>>', WIDENING),
+    ('map<string,int>', 'map<string,bigint>', WIDENING),
+    ('map<int,int>', 'map<bigint,int>', INCOMPATIBLE),
+    ('struct<a:int>', 'int', INCOMPATIBLE),
+]
+
+
+class ColumnDiffTest(unittest.TestCase):
+    def test_parse_type(self):
+        for type_string, parsed in PARSE_CASES:
+            with self.subTest(type_string=type_string):
+                self.assertEqual(parse_type(type_string), parsed)
+
+    def test_compare_types(self):
+        for old, new, change in CHANGE_CASES:
+            with self.subTest(old=old, new=new):
+                self.assertEqual(compare_types(parse_type(old), parse_type(new))[0], change)
+
+    def test_diff_columns_widening(self):
+        differences = diff_columns(
+            [('id', 'int'), ('amount', 'decimal(10,2)'), ('address', 'struct<street:string>')],
+            [('id', 'bigint'), ('amount', 'decimal(12,2)'), ('address', 'struct<street:string,zip:string>')])
+        self.assertEqual(list(differences), ['type_changes'])
+        self.assertEqual([(change['column'], change['change']) for change in differences['type_changes']],
+                         [('id', WIDENING), ('amount', WIDENING), ('address', WIDENING)])
+        self.assertEqual(differences['type_changes'][2]['details'], ['address.zip: added string'])
+
+    def test_diff_columns_incompatible(self):
+        differences = diff_columns(
+            [('amount', 'decimal(10,2)'), ('address', 'struct<street:string,zip:string>')],
+            [('amount', 'decimal(10,3)'), ('address', 'struct<zip:string,street:string>')])
+        self.assertEqual([(change['column'], change['change']) for change in differences['type_changes']],
+                         [('amount', INCOMPATIBLE), ('address', INCOMPATIBLE)])
+
+    def test_diff_columns_structure(self):
+        # (columns1, columns2, expected keys of the diff)
+        cases = [
+            ([('a', 'int'), ('b', 'string')], [('a', 'int'), ('b', 'string')], {}),
+            ([('a', 'int')], [('a', 'int'), ('b', 'string')], {'new_columns': ['b']}),
+            ([('a', 'int'), ('b', 'string')], [('a', 'int')], {'dropped_columns': ['b']}),
+            ([('a', 'int'), ('b', 'string')], [('a', 'int'), ('c', 'string')], {'renamed_columns': ['b']}),
+            ([('a', 'int'), ('b', 'string'), ('c', 'date')], [('b', 'string'), ('c', 'date'), ('a', 'int')], {'moved_columns': ['a']}),
+        ]
+        for columns1, columns2, expected in cases:
+            with self.subTest(columns1=columns1, columns2=columns2):
+                differences = diff_columns(columns1, columns2)
+                self.assertEqual({key: [item.get('column', item.get('from')) for item in value] for key, value in differences.items()}, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
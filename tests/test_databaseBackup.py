@@ -0,0 +1,32 @@
+import os
+import sys
+import unittest
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+from commands.databaseBackup import partition_spec
+
+# (PART_NAME as stored in PARTITIONS, rendered partition spec)
+CASES = [
+    ('dt=2024-01-01', "dt='2024-01-01'"),
+    ('year=2024', "year=2024"),
+    ('dt=2024-01-01/hr=3', "dt='2024-01-01', hr=3"),
+    ('p=a/q=-5/r=0', "p='a', q=-5, r=0"),
+    ('dt=2024-01-01%2F00/country=US%3DX', "dt='2024-01-01/00', country='US=X'"),
+    ('path=a%5Cb/q=1', "path='a\\\\b', q=1"),
+    ('name=it%27s/hr=3', "name='it\\'s', hr=3"),
+    ('region=eu%3Awest/dt=2024-01-01%2012%3A00%3A00/n=07', "region='eu:west', dt='2024-01-01 12:00:00', n=07"),
+    ('k%3Dx=v=w', "k=x='v=w'"),
+    ('dt=__HIVE_DEFAULT_PARTITION__/hr=1', "dt='__HIVE_DEFAULT_PARTITION__', hr=1"),
+]
+
+
+class PartitionSpecTest(unittest.TestCase):
+    def test_partition_spec(self):
+        for part_name, spec in CASES:
+            with self.subTest(part_name=part_name):
+                self.assertEqual(partition_spec(part_name), spec)
+
+
+if __name__ == '__main__':
+    unittest.main()
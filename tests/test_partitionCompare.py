@@ -0,0 +1,73 @@
+import os
+import sys
+import unittest
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+from partitionCompare import merge_partitions, ordered_partitions, partition_differences
+
+SOURCE = [
+    ('orders', 'dt=2024-01-01', 'hdfs://nn1/warehouse/orders/dt=2024-01-01'),
+    ('orders', 'dt=2024-01-02', 'hdfs://nn1/warehouse/orders/dt=2024-01-02'),
+    ('orders', 'dt=2024-01-03', 'hdfs://nn1/warehouse/orders/dt=2024-01-03'),
+    ('sales', 'dt=2024-01-01', 'hdfs://nn1/warehouse/sales/dt=2024-01-01'),
+]
+TARGET = [
+    ('items', 'dt=2024-01-01', 'hdfs://nn2/warehouse/items/dt=2024-01-01'),
+    ('orders', 'dt=2024-01-01', 'hdfs://nn2/warehouse/orders/dt=2024-01-01'),
+    ('orders', 'dt=2024-01-03', 'hdfs://nn2/warehouse/orders/other/dt=2024-01-03/'),
+    ('sales', 'dt=2024-01-01', 'hdfs://nn1/warehouse/sales/dt=2024-01-01'),
+]
+
+# (location_mode, {table: (source, target, missing_in_target, missing_in_source, location_differs)})
+CASES = [
+    ('full', {'items': (0, 1, 0, 1, 0), 'orders': (3, 2, 1, 0, 2), 'sales': (1, 1, 0, 0, 0)}),
+    ('path', {'items': (0, 1, 0, 1, 0), 'orders': (3, 2, 1, 0, 1), 'sales': (1, 1, 0, 0, 0)}),
+    ('none', {'items': (0, 1, 0, 1, 0), 'orders': (3, 2, 1, 0, 0), 'sales': (1, 1, 0, 0, 0)}),
+]
+
+
+def batches(rows, batch_size=2):
+    return [(rows[idx:idx + batch_size], ['TBL_NAME', 'PART_NAME', 'LOCATION']) for idx in range(0, len(rows), batch_size)]
+
+
+def counters(tables):
+    return {name: (table['source_partitions'], table['target_partitions'], table['missing_in_target'],
+                   table['missing_in_source'], table['location_differs'])
+            for name, table in tables.items()}
+
+
+class MergePartitionsTest(unittest.TestCase):
+    def test_location_modes(self):
+        for location_mode, expected in CASES:
+            with self.subTest(location_mode=location_mode):
+                tables = merge_partitions(ordered_partitions(batches(SOURCE), 'source'),
+                                          ordered_partitions(batches(TARGET), 'target'), location_mode=location_mode)
+                self.assertEqual(counters(tables), expected)
+
+    def test_samples(self):
+        tables = merge_partitions(ordered_partitions(batches(SOURCE), 'source'), ordered_partitions(batches(TARGET), 'target'))
+        self.assertEqual(tables['orders']['sample'], [
+            ['dt=2024-01-01', 'location_differs', SOURCE[0][2], TARGET[1][2]],
+            ['dt=2024-01-02', 'missing_in_target', SOURCE[1][2], None],
+            ['dt=2024-01-03', 'location_differs', SOURCE[2][2], TARGET[2][2]],
+        ])
+        self.assertEqual(list(partition_differences(tables)), ['items', 'orders'])
+
+    def test_sample_size(self):
+        source = [('t', f"p={idx:03d}", None) for idx in range(50)]
+        tables = merge_partitions(ordered_partitions(batches(source), 'source'), iter([]), sample_size=5)
+        self.assertEqual(tables['t']['missing_in_target'], 50)
+        self.assertEqual([sample[0] for sample in tables['t']['sample']], [f"p={idx:03d}" for idx in range(5)])
+
+    def test_empty(self):
+        self.assertEqual(merge_partitions(iter([]), iter([])), {})
+
+    def test_unordered_input(self):
+        rows = [('orders', 'dt=2024-01-02', None), ('orders', 'dt=2024-01-01', None)]
+        with self.assertRaises(ValueError):
+            merge_partitions(ordered_partitions(batches(rows), 'source'), iter([]))
+
+
+if __name__ == '__main__':
+    unittest.main()
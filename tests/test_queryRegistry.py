@@ -0,0 +1,46 @@
+import os
+import sys
+import unittest
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+from queryRegistry import compile_template
+
+# (template, dialect, sql, prepare_sql, param names)
+CASES = [
+    ("SELECT 1 WHERE A = '{x}'", 'mysql',
+     "SELECT 1 WHERE A = %s", "SELECT 1 WHERE A = ?", ['x']),
+    ("SELECT 1 WHERE A = '{x}'", 'postgresql',
+     "SELECT 1 WHERE A = %s", "SELECT 1 WHERE A = $1", ['x']),
+    # '' is an escaped quote, the literal does not end there
+    ("SELECT 'it''s' WHERE B = 'it''s {y}'", 'mysql',
+     "SELECT 'it''s' WHERE B = CONCAT('it''s ', %s)", "SELECT 'it''s' WHERE B = CONCAT('it''s ', ?)", ['y']),
+    ("SELECT 'it''s' WHERE B = 'it''s {y}'", 'postgresql',
+     "SELECT 'it''s' WHERE B = ('it''s ' || %s)", "SELECT 'it''s' WHERE B = ('it''s ' || $1)", ['y']),
+    ("WHERE C = 'a''{b}' AND D = {d}", 'mysql',
+     "WHERE C = CONCAT('a''', %s) AND D = %s", "WHERE C = CONCAT('a''', ?) AND D = ?", ['b', 'd']),
+    # a placeholder inside a longer literal is concatenated with the rest of the literal
+    ("WHERE L NOT LIKE '{uri}%' AND K = {k}", 'mysql',
+     "WHERE L NOT LIKE CONCAT(%s, '%') AND K = %s", "WHERE L NOT LIKE CONCAT(?, '%') AND K = ?", ['uri', 'k']),
+    ("WHERE L NOT LIKE '{uri}%' AND K = {k}", 'postgresql',
+     "WHERE L NOT LIKE (%s || '%%') AND K = %s", "WHERE L NOT LIKE ($1 || '%') AND K = $2", ['uri', 'k']),
+    # psycopg2 needs % escaped only when parameters are passed
+    ("WHERE L LIKE 'x%'", 'postgresql',
+     "WHERE L LIKE 'x%'", "WHERE L LIKE 'x%'", []),
+    ("WHERE L LIKE 'x%' AND K = {k}", 'postgresql',
+     "WHERE L LIKE 'x%%' AND K = %s", "WHERE L LIKE 'x%' AND K = $1", ['k']),
+    # a repeated placeholder is bound once per occurrence
+    ("WHERE LEFT(L, CHAR_LENGTH('{uri}')) <> '{uri}'", 'mysql',
+     "WHERE LEFT(L, CHAR_LENGTH(%s)) <> %s", "WHERE LEFT(L, CHAR_LENGTH(?)) <> ?", ['uri', 'uri']),
+]
+
+
+class CompileTemplateTest(unittest.TestCase):
+    def test_compile_template(self):
+        for template, db_type, sql, prepare_sql, names in CASES:
+            with self.subTest(template=template, db_type=db_type):
+                self.assertEqual(compile_template(template, db_type), (sql, prepare_sql, names))
+
+
+if __name__ == '__main__':
+    unittest.main()
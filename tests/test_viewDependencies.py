@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+from viewDependencies import order_views
+
+
+def view(name, *references):
+    text = "SELECT * FROM " + " JOIN ".join(f"`{db}`.`{ref}`" for db, ref in references) if references else "SELECT 1"
+    return (name, 'VIRTUAL_VIEW', text)
+
+
+# (views in TBL_ID order, expected order of the view names)
+CASES = [
+    ([], []),
+    ([view('a'), view('b')], ['a', 'b']),
+    # a view is moved after the view it selects from
+    ([view('a', ('sales', 'b')), view('b')], ['b', 'a']),
+    ([view('c', ('sales', 'b')), view('b', ('sales', 'a')), view('a')], ['a', 'b', 'c']),
+    # independent views keep their original order
+    ([view('x'), view('a', ('sales', 'b')), view('y'), view('b')], ['x', 'y', 'b', 'a']),
+    # names are matched case insensitively, views of other databases and tables are no dependencies
+    ([view('a', ('SALES', 'B')), view('B')], ['B', 'a']),
+    ([view('a', ('other', 'b')), view('b')], ['a', 'b']),
+    ([view('a', ('sales', 'orders')), view('b')], ['a', 'b']),
+    # a view that selects from itself is no cycle
+    ([view('a', ('sales', 'a')), view('b')], ['a', 'b']),
+    # cycles are appended in their original order after the views that can be ordered
+    ([view('a', ('sales', 'b')), view('b', ('sales', 'a')), view('c')], ['c', 'a', 'b']),
+    ([view('a', ('sales', 'c')), view('b', ('sales', 'a')), view('c', ('sales', 'b')), view('d')], ['d', 'a', 'b', 'c']),
+    # a view that depends on a cycle cannot be ordered either
+    ([view('e', ('sales', 'a')), view('a', ('sales', 'b')), view('b', ('sales', 'a')), view('f')], ['f', 'e', 'a', 'b']),
+]
+
+
+class OrderViewsTest(unittest.TestCase):
+    def test_order_views(self):
+        for views, expected in CASES:
+            with self.subTest(views=[name for name, _, _ in views]):
+                self.assertEqual([name for name, _, _ in order_views(views, 'sales')], expected)
+
+    def test_escaped_backticks(self):
+        views = [('a', 'VIRTUAL_VIEW', "SELECT * FROM `sales`.`we``ird`"), ('we`ird', 'VIRTUAL_VIEW', "SELECT 1")]
+        self.assertEqual([name for name, _, _ in order_views(views, 'sales')], ['we`ird', 'a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import re
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+# VIEW_EXPANDED_TEXT qualifies every object as `db`.`name`
+QUALIFIED_NAME = re.compile(r"`((?:[^`]|``)+)`\s*\.\s*`((?:[^`]|``)+)`")
+
+
+def referenced_objects(view_text):
+    """Return the set of (db, name) pairs referenced by the expanded text of a view, lower cased."""
+    if not view_text:
+        return set()
+    return {(db.replace('``', '`').lower(), name.replace('``', '`').lower())
+            for db, name in QUALIFIED_NAME.findall(view_text)}
+
+
+def order_views(views, catalog):
+    """Order views so that every view comes after the views of catalog it selects from.
+
+    views is a list of (name, view_type, view_text) tuples, normally in TBL_ID order. The order
+    is a topological sort (Kahn) that keeps the original order among independent views. Views
+    that are part of a dependency cycle cannot be ordered and are appended in their original
+    order. Column references like `alias`.`column` also match the pattern, but only pairs that
+    name a view of catalog become dependencies.
+    """
+    position = {name.lower(): idx for idx, (name, _, _) in enumerate(views)}
+    catalog = catalog.lower()
+    dependents = [[] for _ in views]
+    pending = [0] * len(views)
+    for idx, (name, _, view_text) in enumerate(views):
+        for db, ref in referenced_objects(view_text):
+            dep = position.get(ref) if db == catalog else None
+            if dep is not None and dep != idx:
+                dependents[dep].append(idx)
+                pending[idx] += 1
+
+    ready = [idx for idx in range(len(views)) if pending[idx] == 0]
+    heapq.heapify(ready)
+    ordered = []
+    while ready:
+        idx = heapq.heappop(ready)
+        ordered.append(views[idx])
+        for dependent in dependents[idx]:
+            pending[dependent] -= 1
+            if pending[dependent] == 0:
+                heapq.heappush(ready, dependent)
+
+    if len(ordered) < len(views):
+        cyclic = [views[idx] for idx in range(len(views)) if pending[idx] > 0]
+        logger.warning(f"Views with circular dependencies in {catalog}: {', '.join(view[0] for view in cyclic)}")
+        ordered.extend(cyclic)
+    return ordered